@@ -1,12 +1,32 @@
 import os
+import json
+import signal
+import time
+import heapq
+import sqlite3
+import struct
+import sys
+import math
+import zlib
 import asyncio
+import multiprocessing
 import logging
-from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial, wraps
+from itertools import compress
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler, MessageHandler, filters
 import aiohttp
-from typing import Dict, List, Optional
+from aiohttp import web
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 # Configure logging
 logging.basicConfig(
@@ -15,8 +35,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Store user alerts: {user_id: {symbol: [(target_price, direction)]}}
-user_alerts: Dict[int, Dict[str, List[tuple]]] = {}
+# Sorted threshold index per symbol, kept in sync with alert_store: {symbol: AlertIndex}
+alert_index: Dict[str, 'AlertIndex'] = {}
+
+# Alerts waiting out the hysteresis band before they are armed again: {symbol: RearmIndex}
+held_alerts: Dict[str, 'RearmIndex'] = {}
+
+# Repeating alerts, re-armed instead of deleted after they fire: {(user_id, symbol, target, direction)}
+repeat_alerts: Set[Tuple[int, str, float, str]] = set()
+
+# Alerts set in another currency than USD, whose targets are stored converted to USD:
+# {(user_id, symbol, USD target, direction): (currency, target as entered)}
+alert_quotes: Dict[Tuple[int, str, float, str], Tuple[str, float]] = {}
+
+# Percent-move alerts per symbol, grouped by window length: {symbol: MoveIndex}
+move_index: Dict[str, 'MoveIndex'] = {}
+
+# Store user percent-move alerts: {user_id: [(symbol, percent, window seconds)]}
+user_move_alerts: Dict[int, List[Tuple[str, float, int]]] = {}
 
 # Store user watchlists: {user_id: [symbols]}
 user_watchlists: Dict[int, List[str]] = {}
@@ -24,10 +60,147 @@ user_watchlists: Dict[int, List[str]] = {}
 # Store user language preferences: {user_id: 'en' or 'ru'}
 user_languages: Dict[int, str] = {}
 
+# Store user quote currency preferences: {user_id: 'eur', 'rub', ...}; users not listed see USD
+user_currencies: Dict[int, str] = {}
+
 # CoinGecko API base URL (free, no API key required)
-COINGECKO_API = "https://api.coingecko.com/api/v3"
+COINGECKO_API = os.getenv('COINGECKO_API', "https://api.coingecko.com/api/v3")
+
+# Maximum length of the comma-separated ids parameter in one /simple/price request
+MAX_IDS_PARAM_LENGTH = 1500
+
+# Upstream HTTP client settings (connection pool, keep-alive, DNS cache, timeouts in seconds)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+
+# Price cache settings: entries are fresh for PRICE_CACHE_TTL seconds, at most PRICE_CACHE_MAX_SIZE ids are kept
+PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', '30'))
+PRICE_CACHE_MAX_SIZE = int(os.getenv('PRICE_CACHE_MAX_SIZE', '5000'))
+
+# Outbound notification settings: concurrent senders, Telegram rate limits (messages per second) and retries
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '8'))
+NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', '30'))
+NOTIFY_CHAT_RATE = float(os.getenv('NOTIFY_CHAT_RATE', '1'))
+NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '5'))
+NOTIFY_DRAIN_TIMEOUT = float(os.getenv('NOTIFY_DRAIN_TIMEOUT', '10'))
+
+# SQLite state database and how often queued writes are group-committed (milliseconds).
+# A batch that fails STATE_FLUSH_MAX_RETRIES times is retried statement by statement, dropping the ones that fail.
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', str(Path(__file__).parent / 'bot_state.db'))
+STATE_FLUSH_INTERVAL_MS = int(os.getenv('STATE_FLUSH_INTERVAL_MS', '200'))
+STATE_FLUSH_MAX_RETRIES = int(os.getenv('STATE_FLUSH_MAX_RETRIES', '3'))
+
+# Optional streaming price feed: PRICE_FEED selects an adapter ('binance' or 'json'), empty disables streaming.
+# Symbols without a streamed update for PRICE_FEED_STALE_AFTER seconds fall back to polling.
+PRICE_FEED = os.getenv('PRICE_FEED', '').strip().lower()
+PRICE_FEED_URL = os.getenv('PRICE_FEED_URL', '')
+PRICE_FEED_STALE_AFTER = float(os.getenv('PRICE_FEED_STALE_AFTER', '30'))
+
+# Alert polling: 'adaptive' polls each symbol every POLL_MIN_INTERVAL..POLL_MAX_INTERVAL seconds depending on
+# how close it is to its nearest threshold, 'fixed' polls everything every 60 seconds.
+# UPSTREAM_REQUESTS_PER_MINUTE is the CoinGecko budget shared by polling and user commands.
+POLL_MODE = os.getenv('POLL_MODE', 'adaptive').strip().lower()
+POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', '10'))
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '300'))
+UPSTREAM_REQUESTS_PER_MINUTE = float(os.getenv('UPSTREAM_REQUESTS_PER_MINUTE', '25'))
+
+# Circuit breaker: consecutive upstream failures that open it, and how long it stays open
+# (doubling on every failed probe up to the maximum, or as long as Retry-After asks)
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', '3'))
+UPSTREAM_OPEN_SECONDS = float(os.getenv('UPSTREAM_OPEN_SECONDS', '15'))
+UPSTREAM_MAX_OPEN_SECONDS = float(os.getenv('UPSTREAM_MAX_OPEN_SECONDS', '300'))
+
+# How old a cached price may be and still be shown (marked with its age) while upstream is failing
+PRICE_STALE_MAX_AGE = float(os.getenv('PRICE_STALE_MAX_AGE', '3600'))
+
+# Price history behind percent-move alerts: one low/high sample per HISTORY_RESOLUTION seconds,
+# HISTORY_CAPACITY samples per coin (24 hours by default) for at most HISTORY_MAX_COINS coins
+HISTORY_RESOLUTION = float(os.getenv('HISTORY_RESOLUTION', '60'))
+HISTORY_CAPACITY = int(os.getenv('HISTORY_CAPACITY', '1440'))
+HISTORY_MAX_COINS = int(os.getenv('HISTORY_MAX_COINS', '500'))
+HISTORY_SNAPSHOT_PATH = os.getenv('HISTORY_SNAPSHOT_PATH', str(Path(__file__).parent / 'price_history.bin'))
+HISTORY_SNAPSHOT_INTERVAL = int(os.getenv('HISTORY_SNAPSHOT_INTERVAL', '300'))
+
+# Prometheus metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics); port 0 disables it
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Worker processes holding the alert indexes, partitioned by user id; 0 evaluates alerts in-process
+ALERT_SHARDS = int(os.getenv('ALERT_SHARDS', '0'))
+
+# Alerts one chat triggers within ALERT_DIGEST_WINDOW_MS go out as a single digest message (0 still merges
+# the alerts of one tick), with at most ALERT_DIGEST_MAX_LINES alerts per message
+ALERT_DIGEST_WINDOW_MS = int(os.getenv('ALERT_DIGEST_WINDOW_MS', '1000'))
+ALERT_DIGEST_MAX_LINES = int(os.getenv('ALERT_DIGEST_MAX_LINES', '20'))
+
+# Hysteresis band in percent of the target: a repeating alert that fired is armed again only once the price
+# moves this far back; 0 re-arms it right away
+ALERT_HYSTERESIS_PCT = float(os.getenv('ALERT_HYSTERESIS_PCT', '0.5'))
+
+# How updates arrive: 'polling' (long polling) or 'webhook' (embedded aiohttp server).
+# WEBHOOK_URL is the public HTTPS address registered with Telegram; the server listens on
+# WEBHOOK_LISTEN:WEBHOOK_PORT at WEBHOOK_PATH and checks WEBHOOK_SECRET when it is set.
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443')))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '10'))
+
+# Updates processed at the same time; one user's updates always run in order. 1 disables concurrency.
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '64'))
+
+# Inline mode (@bot BTC): seconds Telegram may cache an answer, and how long to wait for the user to stop typing
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '10'))
+INLINE_DEBOUNCE_MS = int(os.getenv('INLINE_DEBOUNCE_MS', '300'))
+
+# Quote currencies users can choose with /currency (USD is always available). Prices are fetched in USD only
+# and converted with CoinGecko's exchange rates, which are refreshed every FX_RATES_TTL seconds
+CURRENCIES = ['usd'] + [
+    currency for currency in (c.strip().lower() for c in os.getenv('CURRENCIES', 'usd,eur,rub').split(','))
+    if currency and currency != 'usd'
+]
+FX_RATES_TTL = float(os.getenv('FX_RATES_TTL', '3600'))
+
+# How amounts are written per currency as (prefix, suffix); other currencies get their code as a suffix
+CURRENCY_SIGNS = {
+    'usd': ('$', ''),
+    'eur': ('€', ''),
+    'gbp': ('£', ''),
+    'rub': ('', ' ₽'),
+    'uah': ('', ' ₴'),
+    'kzt': ('', ' ₸')
+}
+
+# Live watchlists (/live): how often the pinned dashboards are re-rendered (seconds) and how many of them may be
+# edited per refresh; changed dashboards over the limit are edited by the following refreshes
+LIVE_REFRESH_INTERVAL = float(os.getenv('LIVE_REFRESH_INTERVAL', '30'))
+LIVE_MAX_EDITS = int(os.getenv('LIVE_MAX_EDITS', '300'))
+
+# Price charts (/chart): how long a fetched series and its rendered image are reused (seconds), how many charts
+# are kept, and the worker processes drawing them (0 draws in a thread of the bot's process instead)
+CHART_CACHE_TTL = float(os.getenv('CHART_CACHE_TTL', '300'))
+CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', '200'))
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', '1'))
+
+# /chart ranges and the days of CoinGecko market_chart data behind each
+CHART_RANGES = {'24h': 1, '7d': 7, '30d': 30, '90d': 90, '1y': 365}
+
+# How often runtime statistics are written to the log (seconds)
+STATS_LOG_INTERVAL = int(os.getenv('STATS_LOG_INTERVAL', '300'))
+
+# Local cache of CoinGecko's full coin list (/coins/list) and how old it may get before it is refreshed
+COIN_LIST_PATH = os.getenv('COIN_LIST_PATH', str(Path(__file__).parent / 'coins.tsv'))
+COIN_LIST_MAX_AGE = float(os.getenv('COIN_LIST_MAX_AGE', '604800'))
+
+# Shared upstream HTTP session, created in post_init and closed in post_shutdown
+http_session: Optional[aiohttp.ClientSession] = None
 
-# Popular cryptocurrencies mapping
+# Popular cryptocurrencies mapping; these win when a ticker is shared by several coins
 CRYPTO_IDS = {
     'BTC': 'bitcoin',
     'ETH': 'ethereum',
@@ -60,35 +233,66 @@ Welcome! I can help you track cryptocurrency prices and set price alerts.
 
 **Available Commands:**
 /price <SYMBOL> - Get current price (e.g., /price BTC)
-/alert <SYMBOL> <PRICE> <above/below> - Set price alert (e.g., /alert BTC 50000 above)
+/alert <SYMBOL> <PRICE> <above/below> [repeat] - Set price alert (e.g., /alert BTC 50000 above)
+/move <SYMBOL> <PERCENT> [MINUTES] - Alert on a % move within a time window (e.g., /move BTC 5 60)
 /list - Show your active alerts
 /watch <SYMBOL> - Add to watchlist
 /watchlist - Show your watchlist with current prices
+/live - Pinned watchlist that keeps itself up to date
+/chart <SYMBOL> [RANGE] - Price chart (e.g., /chart BTC 7d)
 /remove <SYMBOL> - Remove alert
+/currency - Choose the currency for prices and alerts
 /lang - Change language / Изменить язык
 /help - Show this help message
 
 **Supported Cryptocurrencies:**
 BTC, ETH, USDT, BNB, SOL, XRP, ADA, DOGE, TRX, DOT, MATIC, LTC, SHIB, AVAX, UNI, LINK, ATOM, XLM, TON, APT
+and any other coin listed on CoinGecko, by ticker or by CoinGecko id (e.g., /price pepe)
 
 Let's start tracking! 🚀''',
         'lang_changed': '✅ Language changed to English',
+        'currency_choose': '💱 Your currency: {currency}\nChoose the currency for prices and alerts:',
+        'currency_changed': '✅ Prices and new alerts are now in {currency}.',
+        'currency_invalid': '❌ Supported currencies: {currencies}',
+        'fx_unavailable': '⏳ Exchange rates are not loaded yet. Try again in a minute or use /currency USD.',
         'price_usage': '❌ Please specify a cryptocurrency symbol.\nExample: /price BTC',
         'price_not_found': '❌ Could not find price for {symbol}.\nPlease use a supported cryptocurrency symbol.',
+        'symbol_ambiguous': '❓ {symbol} is the ticker of several coins: {ids}\nPlease use the CoinGecko id of the one you mean instead.',
+        'symbol_suggest': '\nDid you mean: {suggestions}?',
+        'price_unavailable': '⏳ The price service is temporarily unavailable. Please try again in a minute.',
+        'price_stale': '\n\n⚠️ _Price is {minutes} min old: the price service is temporarily unavailable._',
         'price_info': '''💰 **{symbol} Price**
 
-Current Price: ${price:,.2f}
+Current Price: {price}
 24h Change: {emoji} {sign}{change:.2f}%
-Market Cap: ${market_cap:,.0f}
+Market Cap: {market_cap}
 
 _Updated: {time}_''',
+        'inline_description': '24h: {sign}{change:.2f}% · Market Cap: {market_cap}',
+        'inline_stale': ' · {minutes} min old',
         'alert_usage': '''❌ Invalid format.
-Usage: /alert <SYMBOL> <PRICE> <above/below>
-Example: /alert BTC 50000 above''',
+Usage: /alert <SYMBOL> <PRICE> <above/below> [repeat]
+Example: /alert BTC 50000 above
+Add "repeat" to keep the alert after it fires''',
         'alert_invalid_price': '❌ Invalid price. Please enter a number.',
         'alert_invalid_direction': '❌ Direction must be \'above\' or \'below\'',
         'alert_unsupported': '❌ {symbol} is not supported.\nUse /help to see supported cryptocurrencies.',
-        'alert_set': '✅ Alert set!\nI\'ll notify you when {symbol} goes {direction} ${price:,.2f}',
+        'alert_set': '✅ Alert set!\nI\'ll notify you when {symbol} goes {direction} {price}',
+        'alert_repeat': '\n🔁 It stays active and re-arms once the price moves {band:g}% back from the target.',
+        'move_usage': '''❌ Invalid format.
+Usage: /move <SYMBOL> <PERCENT> [MINUTES]
+Example: /move BTC 5 60 - notify when BTC moves 5% up or down within an hour''',
+        'move_invalid': '❌ Percent must be a positive number and minutes between {min_minutes} and {max_minutes}.',
+        'move_set': '✅ Alert set!\nI\'ll notify you when {symbol} moves {percent:g}% within {minutes} min',
+        'move_entry': '  ↕️ {percent:g}% / {minutes} min\n',
+        'move_triggered': '''🚨 **PRICE MOVE ALERT!**
+
+{symbol} moved {sign}{change:.2f}% within {minutes} min!
+
+From: {reference}
+Current Price: {current}
+
+_Alert time: {time}_''',
         'list_empty': '📭 You have no active alerts.\nUse /alert to set one!',
         'list_header': '🔔 **Your Active Alerts:**\n\n',
         'watch_usage': '❌ Please specify a cryptocurrency symbol.\nExample: /watch BTC',
@@ -97,6 +301,13 @@ Example: /alert BTC 50000 above''',
         'watch_added': '✅ {symbol} added to your watchlist!',
         'watchlist_empty': '📭 Your watchlist is empty.\nUse /watch <SYMBOL> to add cryptocurrencies!',
         'watchlist_header': '👁️ **Your Watchlist:**\n\n',
+        'live_header': '📡 **Live Watchlist**\n\n',
+        'live_footer': '\n_Updated every {seconds} s · /live off to stop_',
+        'live_stopped': '✅ Live watchlist stopped.',
+        'live_not_running': 'ℹ️ You have no live watchlist. Use /live to start one.',
+        'chart_usage': '❌ Usage: /chart <SYMBOL> [RANGE]\nRanges: {ranges}\nExample: /chart BTC 7d',
+        'chart_caption': '📈 {symbol} · {range}\nNow: {price} ({sign}{change:.2f}%)\nHigh: {high} · Low: {low}',
+        'chart_unavailable': '⏳ The chart for {symbol} could not be built right now. Please try again in a minute.',
         'remove_usage': '❌ Please specify a cryptocurrency symbol.\nExample: /remove BTC',
         'remove_success': '✅ All alerts for {symbol} removed.',
         'remove_not_found': 'ℹ️ No alerts found for {symbol}.',
@@ -105,10 +316,14 @@ Example: /alert BTC 50000 above''',
 
 {symbol} has reached your target!
 
-Target: ${target:,.2f} ({direction})
-Current Price: ${current:,.2f}
+Target: {target} ({direction})
+Current Price: {current}
 
 _Alert time: {time}_''',
+        'digest_header': '🚨 **{count} ALERTS TRIGGERED!**\n\n',
+        'digest_alert': '{arrow} {symbol}: {current} - target {target} ({direction})\n',
+        'digest_move': '↕️ {symbol}: {current} - {sign}{change:.2f}% within {minutes} min\n',
+        'digest_footer': '\n_Alert time: {time}_',
         'above': 'above',
         'below': 'below'
     },
@@ -119,35 +334,66 @@ _Alert time: {time}_''',
 
 **Доступные команды:**
 /price <СИМВОЛ> - Узнать текущую цену (например, /price BTC)
-/alert <СИМВОЛ> <ЦЕНА> <выше/ниже> - Установить оповещение (например, /alert BTC 50000 выше)
+/alert <СИМВОЛ> <ЦЕНА> <выше/ниже> [повтор] - Установить оповещение (например, /alert BTC 50000 выше)
+/move <СИМВОЛ> <ПРОЦЕНТ> [МИНУТ] - Оповещение об изменении цены на % за период (например, /move BTC 5 60)
 /list - Показать активные оповещения
 /watch <СИМВОЛ> - Добавить в список отслеживания
 /watchlist - Показать список отслеживаемых монет
+/live - Закрепленный список отслеживания с автообновлением
+/chart <СИМВОЛ> [ПЕРИОД] - График цены (например, /chart BTC 7d)
 /remove <СИМВОЛ> - Удалить оповещение
+/currency - Выбрать валюту для цен и оповещений
 /lang - Change language / Изменить язык
 /help - Показать справку
 
 **Поддерживаемые криптовалюты:**
 BTC, ETH, USDT, BNB, SOL, XRP, ADA, DOGE, TRX, DOT, MATIC, LTC, SHIB, AVAX, UNI, LINK, ATOM, XLM, TON, APT
+и любые другие монеты с CoinGecko, по тикеру или по id CoinGecko (например, /price pepe)
 
 Начнем отслеживание! 🚀''',
         'lang_changed': '✅ Язык изменен на русский',
+        'currency_choose': '💱 Ваша валюта: {currency}\nВыберите валюту для цен и оповещений:',
+        'currency_changed': '✅ Цены и новые оповещения теперь в {currency}.',
+        'currency_invalid': '❌ Поддерживаемые валюты: {currencies}',
+        'fx_unavailable': '⏳ Курсы валют еще не загружены. Попробуйте через минуту или выберите /currency USD.',
         'price_usage': '❌ Укажите символ криптовалюты.\nПример: /price BTC',
         'price_not_found': '❌ Не удалось найти цену для {symbol}.\nИспользуйте поддерживаемую криптовалюту.',
+        'symbol_ambiguous': '❓ {symbol} - тикер нескольких монет: {ids}\nУкажите вместо него id нужной монеты на CoinGecko.',
+        'symbol_suggest': '\nВозможно, вы имели в виду: {suggestions}?',
+        'price_unavailable': '⏳ Сервис цен временно недоступен. Попробуйте через минуту.',
+        'price_stale': '\n\n⚠️ _Цене {minutes} мин.: сервис цен временно недоступен._',
         'price_info': '''💰 **Цена {symbol}**
 
-Текущая цена: ${price:,.2f}
+Текущая цена: {price}
 Изменение за 24ч: {emoji} {sign}{change:.2f}%
-Капитализация: ${market_cap:,.0f}
+Капитализация: {market_cap}
 
 _Обновлено: {time}_''',
+        'inline_description': '24ч: {sign}{change:.2f}% · Капитализация: {market_cap}',
+        'inline_stale': ' · {minutes} мин. назад',
         'alert_usage': '''❌ Неверный формат.
-Использование: /alert <СИМВОЛ> <ЦЕНА> <выше/ниже>
-Пример: /alert BTC 50000 выше''',
+Использование: /alert <СИМВОЛ> <ЦЕНА> <выше/ниже> [повтор]
+Пример: /alert BTC 50000 выше
+Добавьте "повтор", чтобы оповещение не удалялось после срабатывания''',
         'alert_invalid_price': '❌ Неверная цена. Введите число.',
         'alert_invalid_direction': '❌ Направление должно быть \'выше\' или \'ниже\' (или \'above\'/\'below\')',
         'alert_unsupported': '❌ {symbol} не поддерживается.\nИспользуйте /help для списка поддерживаемых монет.',
-        'alert_set': '✅ Оповещение установлено!\nЯ уведомлю вас, когда {symbol} будет {direction} ${price:,.2f}',
+        'alert_set': '✅ Оповещение установлено!\nЯ уведомлю вас, когда {symbol} будет {direction} {price}',
+        'alert_repeat': '\n🔁 Оно останется активным и снова включится, когда цена отойдет от цели на {band:g}%.',
+        'move_usage': '''❌ Неверный формат.
+Использование: /move <СИМВОЛ> <ПРОЦЕНТ> [МИНУТ]
+Пример: /move BTC 5 60 - уведомить, когда BTC вырастет или упадет на 5% за час''',
+        'move_invalid': '❌ Процент должен быть положительным числом, а минуты - от {min_minutes} до {max_minutes}.',
+        'move_set': '✅ Оповещение установлено!\nЯ уведомлю вас, когда {symbol} изменится на {percent:g}% за {minutes} мин.',
+        'move_entry': '  ↕️ {percent:g}% / {minutes} мин.\n',
+        'move_triggered': '''🚨 **РЕЗКОЕ ИЗМЕНЕНИЕ ЦЕНЫ!**
+
+{symbol} изменился на {sign}{change:.2f}% за {minutes} мин.!
+
+С: {reference}
+Текущая цена: {current}
+
+_Время оповещения: {time}_''',
         'list_empty': '📭 У вас нет активных оповещений.\nИспользуйте /alert чтобы создать!',
         'list_header': '🔔 **Ваши активные оповещения:**\n\n',
         'watch_usage': '❌ Укажите символ криптовалюты.\nПример: /watch BTC',
@@ -156,6 +402,13 @@ _Обновлено: {time}_''',
         'watch_added': '✅ {symbol} добавлен в список отслеживания!',
         'watchlist_empty': '📭 Ваш список отслеживания пуст.\nИспользуйте /watch <СИМВОЛ> для добавления!',
         'watchlist_header': '👁️ **Ваш список отслеживания:**\n\n',
+        'live_header': '📡 **Список отслеживания онлайн**\n\n',
+        'live_footer': '\n_Обновляется каждые {seconds} с · /live off - остановить_',
+        'live_stopped': '✅ Онлайн-список остановлен.',
+        'live_not_running': 'ℹ️ Онлайн-список не запущен. Запустите его командой /live.',
+        'chart_usage': '❌ Использование: /chart <СИМВОЛ> [ПЕРИОД]\nПериоды: {ranges}\nПример: /chart BTC 7d',
+        'chart_caption': '📈 {symbol} · {range}\nСейчас: {price} ({sign}{change:.2f}%)\nМакс.: {high} · Мин.: {low}',
+        'chart_unavailable': '⏳ Не удалось построить график {symbol}. Попробуйте через минуту.',
         'remove_usage': '❌ Укажите символ криптовалюты.\nПример: /remove BTC',
         'remove_success': '✅ Все оповещения для {symbol} удалены.',
         'remove_not_found': 'ℹ️ Оповещения для {symbol} не найдены.',
@@ -164,340 +417,4378 @@ _Обновлено: {time}_''',
 
 {symbol} достиг вашей целевой цены!
 
-Цель: ${target:,.2f} ({direction})
-Текущая цена: ${current:,.2f}
+Цель: {target} ({direction})
+Текущая цена: {current}
 
 _Время оповещения: {time}_''',
+        'digest_header': '🚨 **СРАБОТАЛО ОПОВЕЩЕНИЙ: {count}**\n\n',
+        'digest_alert': '{arrow} {symbol}: {current} - цель {target} ({direction})\n',
+        'digest_move': '↕️ {symbol}: {current} - {sign}{change:.2f}% за {minutes} мин.\n',
+        'digest_footer': '\n_Время оповещения: {time}_',
         'above': 'выше',
         'below': 'ниже'
     }
 }
 
 
+class LocaleRenderer:
+    """LOCALE strings of one language, resolved against English once at startup"""
+    
+    def __init__(self, lang: str, strings: Dict[str, str], fallback: Dict[str, str]):
+        self.lang = lang
+        # Raw text for every key, falling back to English for missing translations
+        self.static: Dict[str, str] = {**fallback, **strings}
+        # Bound str.format of the resolved text: the C formatter beats any per-field rendering in Python
+        self.templates: Dict[str, Callable[..., str]] = {key: text.format for key, text in self.static.items()}
+        # Direction words, looked up once per alert in /list and notifications
+        self.direction = {'above': self.static['above'], 'below': self.static['below']}
+    
+    def render(self, key: str, **kwargs) -> str:
+        """Render a key like str.format would; without arguments the raw text is returned"""
+        text = self.static.get(key, key)
+        return text.format_map(kwargs) if kwargs else text
+
+
+# Compiled renderers for every language in LOCALE
+RENDERERS = {lang: LocaleRenderer(lang, strings, LOCALE['en']) for lang, strings in LOCALE.items()}
+
+
 def get_user_lang(user_id: int) -> str:
     """Get user's language preference, default to English"""
     return user_languages.get(user_id, 'en')
 
 
+def renderer_for(user_id: int) -> LocaleRenderer:
+    """Get the compiled renderer for the user's language"""
+    return RENDERERS.get(user_languages.get(user_id, 'en'), RENDERERS['en'])
+
+
 def t(user_id: int, key: str, **kwargs) -> str:
     """Translate text based on user's language preference"""
-    lang = get_user_lang(user_id)
-    text = LOCALE[lang].get(key, LOCALE['en'].get(key, key))
-    if kwargs:
-        return text.format(**kwargs)
-    return text
+    text = (RENDERERS.get(user_languages.get(user_id, 'en')) or RENDERERS['en']).static.get(key, key)
+    # format_map on the kwargs dict avoids unpacking the arguments once more
+    return text.format_map(kwargs) if kwargs else text
 
 
-async def get_crypto_price(symbol: str) -> Optional[Dict]:
-    """Get current cryptocurrency price from CoinGecko API"""
-    symbol = symbol.upper()
-    
-    if symbol not in CRYPTO_IDS:
-        return None
-    
-    crypto_id = CRYPTO_IDS[symbol]
+class NotificationCache:
+    """Alert notifications rendered once per tick for each (language, currency, symbol, direction, target, price)"""
     
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"{COINGECKO_API}/simple/price"
-            params = {
-                'ids': crypto_id,
-                'vs_currencies': 'usd',
-                'include_24hr_change': 'true',
-                'include_market_cap': 'true'
-            }
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if crypto_id in data:
-                        return {
-                            'symbol': symbol,
-                            'price': data[crypto_id]['usd'],
-                            'change_24h': data[crypto_id].get('usd_24h_change', 0),
-                            'market_cap': data[crypto_id].get('usd_market_cap', 0)
-                        }
-    except Exception as e:
-        logger.error(f"Error fetching price for {symbol}: {e}")
+    def __init__(self):
+        self.alert_time = None
+        self._rendered: Dict[tuple, str] = {}
+        self.hits = 0
+        self.misses = 0
     
-    return None
+    def render(self, renderer: LocaleRenderer, symbol: str, target_price: float, direction: str,
+               current_price: float, alert_time: str, currency: str = 'usd') -> str:
+        if alert_time != self.alert_time:
+            # The timestamp is part of the text, so a new tick starts a new cache
+            self._rendered = {}
+            self.alert_time = alert_time
+        
+        # Within a tick every alert on a symbol sees the same price, so it is its own bucket
+        key = (renderer.lang, currency, symbol, direction, target_price, current_price)
+        message = self._rendered.get(key)
+        if message is None:
+            self.misses += 1
+            message = self._rendered[key] = renderer.templates['alert_triggered'](
+                symbol=symbol,
+                target=format_money(target_price, currency),
+                direction=renderer.direction[direction],
+                current=format_money(current_price, currency),
+                time=alert_time
+            )
+        else:
+            self.hits += 1
+        return message
 
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send a message when the command /start is issued."""
-    user_id = update.effective_user.id
+# Shared cache of rendered alert notifications
+notification_cache = NotificationCache()
+
+
+class Metric:
+    """Labelled Prometheus metric; label values are passed positionally in `labels` order"""
     
-    if user_id not in user_alerts:
-        user_alerts[user_id] = {}
-    if user_id not in user_watchlists:
-        user_watchlists[user_id] = []
-    if user_id not in user_languages:
-        user_languages[user_id] = 'en'
+    kind = 'untyped'
     
-    await update.message.reply_text(t(user_id, 'welcome'), parse_mode='Markdown')
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+    
+    def _label_str(self, values: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+    
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._label_str(key)} {value}" for key, value in self.values.items()]
+    
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
 
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send a message when the command /help is issued."""
-    await start(update, context)
+class Counter(Metric):
+    kind = 'counter'
+    
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
 
 
-async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Get current price of a cryptocurrency"""
-    user_id = update.effective_user.id
+class Gauge(Metric):
+    """Gauge set directly, or computed at scrape time when a callback is given"""
     
-    if not context.args:
-        await update.message.reply_text(t(user_id, 'price_usage'))
-        return
+    kind = 'gauge'
     
-    symbol = context.args[0].upper()
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback=None):
+        super().__init__(name, help_text, labels)
+        # Returns a number, or {label values tuple: number} for labelled gauges
+        self.callback = callback
     
-    price_data = await get_crypto_price(symbol)
+    def set(self, value: float, *labels) -> None:
+        self.values[labels] = value
     
-    if price_data:
-        change_emoji = "📈" if price_data['change_24h'] >= 0 else "📉"
-        change_sign = "+" if price_data['change_24h'] >= 0 else ""
-        
-        message = t(user_id, 'price_info',
-                   symbol=price_data['symbol'],
-                   price=price_data['price'],
-                   emoji=change_emoji,
-                   sign=change_sign,
-                   change=price_data['change_24h'],
-                   market_cap=price_data['market_cap'],
-                   time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        await update.message.reply_text(message, parse_mode='Markdown')
-    else:
-        await update.message.reply_text(t(user_id, 'price_not_found', symbol=symbol))
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            value = self.callback()
+            self.values = value if isinstance(value, dict) else {(): value}
+        return super().samples()
 
 
-async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Set a price alert"""
-    user_id = update.effective_user.id
+class Histogram(Metric):
+    kind = 'histogram'
     
-    if len(context.args) < 3:
-        await update.message.reply_text(t(user_id, 'alert_usage'))
-        return
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
     
-    symbol = context.args[0].upper()
-    try:
-        target_price = float(context.args[1])
-    except ValueError:
-        await update.message.reply_text(t(user_id, 'alert_invalid_price'))
-        return
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # {label values: [per-bucket counts..., +Inf count, sum]}
+        self.values: Dict[tuple, List[float]] = {}
     
-    direction = context.args[2].lower()
-    # Support both English and Russian direction words
-    if direction in ['выше', 'higher']:
-        direction = 'above'
-    elif direction in ['ниже', 'lower']:
-        direction = 'below'
+    def observe(self, value: float, *labels) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
     
-    if direction not in ['above', 'below']:
-        await update.message.reply_text(t(user_id, 'alert_invalid_direction'))
-        return
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._label_str(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format"""
     
-    if symbol not in CRYPTO_IDS:
-        await update.message.reply_text(t(user_id, 'alert_unsupported', symbol=symbol))
-        return
+    def __init__(self):
+        self.metrics: List[Metric] = []
     
-    if user_id not in user_alerts:
-        user_alerts[user_id] = {}
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
     
-    if symbol not in user_alerts[user_id]:
-        user_alerts[user_id][symbol] = []
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+metrics = MetricsRegistry()
+
+UPSTREAM_LATENCY = metrics.register(Histogram(
+    'crypto_bot_upstream_request_seconds', 'CoinGecko request latency', ('endpoint',)))
+UPSTREAM_RESPONSES = metrics.register(Counter(
+    'crypto_bot_upstream_responses_total', 'CoinGecko responses by HTTP status (or "error")', ('endpoint', 'status')))
+COMMAND_LATENCY = metrics.register(Histogram(
+    'crypto_bot_command_seconds', 'Handler latency per command', ('command',)))
+COMMAND_ERRORS = metrics.register(Counter(
+    'crypto_bot_command_errors_total', 'Handlers that raised', ('command',)))
+TICK_DURATION = metrics.register(Histogram(
+    'crypto_bot_tick_seconds', 'Duration of alert polling ticks', ('job',)))
+ALERTS_EVALUATED = metrics.register(Counter(
+    'crypto_bot_alerts_evaluated_total', 'Alerts on symbols checked against a new price', ('source',)))
+ALERTS_TRIGGERED = metrics.register(Counter(
+    'crypto_bot_alerts_triggered_total', 'Alerts fired by a new price', ('source',)))
+LAST_TICK_ALERTS = metrics.register(Gauge(
+    'crypto_bot_last_tick_alerts', 'Alerts evaluated and triggered in the most recent tick', ('kind',)))
+OUTBOUND_LATENCY = metrics.register(Histogram(
+    'crypto_bot_outbound_send_seconds', 'Bot API send_message latency'))
+OUTBOUND_MESSAGES = metrics.register(Counter(
+    'crypto_bot_outbound_messages_total', 'Outbound messages by result', ('result',)))
+EVENT_LOOP_LAG = metrics.register(Histogram(
+    'crypto_bot_event_loop_lag_seconds', 'How late the event loop runs a scheduled wakeup'))
+STATE_DROPPED_WRITES = metrics.register(Counter(
+    'crypto_bot_state_dropped_writes_total', 'Queued state mutations dropped because they could not be committed'))
+
+
+def timed_handler(command: str, handler):
+    """Wrap a handler so its latency and failures are recorded under the command name"""
+    @wraps(handler)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await handler(update, context)
+        except Exception:
+            COMMAND_ERRORS.inc(command)
+            raise
+        finally:
+            COMMAND_LATENCY.observe(time.perf_counter() - started, command)
+    return wrapper
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Measure how late the loop wakes up from a fixed sleep"""
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - expected))
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Serve all metrics in the Prometheus text format"""
+    return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8',
+                        headers={'X-Content-Type-Options': 'nosniff'})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Start the local /metrics endpoint"""
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
+
+
+def chunk_crypto_ids(crypto_ids: List[str], max_length: int = MAX_IDS_PARAM_LENGTH) -> List[List[str]]:
+    """Split CoinGecko ids into chunks whose comma-joined length fits in one URL"""
+    chunks = []
+    current = []
+    current_length = 0
     
-    user_alerts[user_id][symbol].append((target_price, direction))
+    for crypto_id in crypto_ids:
+        extra = len(crypto_id) + (1 if current else 0)
+        if current and current_length + extra > max_length:
+            chunks.append(current)
+            current = []
+            extra = len(crypto_id)
+            current_length = 0
+        current.append(crypto_id)
+        current_length += extra
     
-    # Translate direction for display
-    direction_text = t(user_id, direction)
-    await update.message.reply_text(
-        t(user_id, 'alert_set', symbol=symbol, direction=direction_text, price=target_price)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Create the pooled keep-alive session used for all upstream HTTP calls"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_SIZE,
+        limit_per_host=HTTP_POOL_SIZE,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
     )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
 
 
-async def list_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """List all active alerts for the user"""
-    user_id = update.effective_user.id
-    
-    if user_id not in user_alerts or not user_alerts[user_id]:
-        await update.message.reply_text(t(user_id, 'list_empty'))
-        return
-    
-    message = t(user_id, 'list_header')
-    
-    for symbol, alerts in user_alerts[user_id].items():
-        message += f"**{symbol}:**\n"
-        for price, direction in alerts:
-            arrow = "⬆️" if direction == "above" else "⬇️"
-            direction_text = t(user_id, direction)
-            message += f"  {arrow} ${price:,.2f} ({direction_text})\n"
-        message += "\n"
-    
-    await update.message.reply_text(message, parse_mode='Markdown')
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared upstream session, creating it on first use"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = create_http_session()
+    return http_session
 
 
-async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Add a cryptocurrency to watchlist"""
-    user_id = update.effective_user.id
+async def close_http_session() -> None:
+    """Close the shared upstream session"""
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+
+class UpstreamUnavailable(Exception):
+    """CoinGecko failed, rate-limited us, or the circuit breaker is refusing requests"""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Request refused locally because the circuit breaker is open"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Fails upstream calls fast after repeated errors, letting one probe through once the open period ends"""
     
-    if not context.args:
-        await update.message.reply_text(t(user_id, 'watch_usage'))
-        return
+    def __init__(self, failure_threshold: int, open_seconds: float, max_open_seconds: float,
+                 probe_timeout: float = HTTP_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+        self.failures = 0
+        self.opened = 0
+        # Monotonic time until which requests are refused; 0 while closed
+        self.open_until = 0.0
+        self._backoff = open_seconds
+        self._probe_started: Optional[float] = None
     
-    symbol = context.args[0].upper()
+    @property
+    def state(self) -> str:
+        if not self.open_until:
+            return 'closed'
+        return 'open' if time.monotonic() < self.open_until else 'half_open'
     
-    if symbol not in CRYPTO_IDS:
-        await update.message.reply_text(t(user_id, 'watch_unsupported', symbol=symbol))
-        return
+    def is_open(self) -> bool:
+        """True while requests are being refused outright"""
+        return bool(self.open_until) and time.monotonic() < self.open_until
     
-    if user_id not in user_watchlists:
-        user_watchlists[user_id] = []
+    def allow_request(self) -> bool:
+        """Whether a request may go out now; after the open period only one probe at a time is allowed"""
+        if not self.open_until:
+            return True
+        now = time.monotonic()
+        if now < self.open_until:
+            return False
+        # A probe that never reported back (e.g. cancelled) stops blocking after probe_timeout
+        if self._probe_started is not None and now - self._probe_started < self.probe_timeout:
+            return False
+        self._probe_started = now
+        return True
     
-    if symbol in user_watchlists[user_id]:
-        await update.message.reply_text(t(user_id, 'watch_exists', symbol=symbol))
-        return
+    def record_success(self) -> None:
+        if self.open_until:
+            logger.info("Upstream recovered, closing circuit breaker")
+        self.failures = 0
+        self.open_until = 0.0
+        self._backoff = self.open_seconds
+        self._probe_started = None
     
-    user_watchlists[user_id].append(symbol)
-    await update.message.reply_text(t(user_id, 'watch_added', symbol=symbol))
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        """Count a failure; a Retry-After or a failed probe opens the breaker immediately"""
+        self.failures += 1
+        probe_failed = self._probe_started is not None
+        self._probe_started = None
+        if retry_after is None and not probe_failed and self.failures < self.failure_threshold:
+            return
+        
+        if probe_failed:
+            self._backoff = min(self.max_open_seconds, self._backoff * 2)
+        delay = self._backoff if retry_after is None else max(retry_after, 1.0)
+        if not self.is_open():
+            self.opened += 1
+            logger.warning(f"Upstream unhealthy after {self.failures} failures, failing fast for {delay:.0f}s")
+        self.open_until = max(self.open_until, time.monotonic() + delay)
 
 
-async def watchlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show user's watchlist with current prices"""
-    user_id = update.effective_user.id
-    
-    if user_id not in user_watchlists or not user_watchlists[user_id]:
-        await update.message.reply_text(t(user_id, 'watchlist_empty'))
-        return
+# Guards every CoinGecko request
+upstream_breaker = CircuitBreaker(UPSTREAM_FAILURE_THRESHOLD, UPSTREAM_OPEN_SECONDS, UPSTREAM_MAX_OPEN_SECONDS)
+
+
+async def upstream_get_json(endpoint: str, path: str, params: Optional[Dict] = None,
+                            timeout: Optional[aiohttp.ClientTimeout] = None):
+    """GET a CoinGecko path as JSON through the circuit breaker and request budget, raising UpstreamUnavailable"""
+    if not upstream_breaker.allow_request():
+        UPSTREAM_RESPONSES.inc(endpoint, 'circuit_open')
+        raise CircuitOpen('circuit breaker open')
     
-    message = t(user_id, 'watchlist_header')
+    # Every request counts against the shared budget; only the poller waits for it
+    upstream_budget.reserve()
     
-    for symbol in user_watchlists[user_id]:
-        price_data = await get_crypto_price(symbol)
-        if price_data:
-            change_emoji = "📈" if price_data['change_24h'] >= 0 else "📉"
-            change_sign = "+" if price_data['change_24h'] >= 0 else ""
-            message += (
-                f"**{symbol}:** ${price_data['price']:,.2f} "
-                f"{change_emoji} {change_sign}{price_data['change_24h']:.2f}%\n"
-            )
+    # Without a timeout argument the session's default applies
+    options = {'params': params} if timeout is None else {'params': params, 'timeout': timeout}
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        async with get_http_session().get(f"{COINGECKO_API}/{path}", **options) as response:
+            status = response.status
+            if response.status == 200:
+                data = await response.json()
+                upstream_breaker.record_success()
+                return data
+            
+            logger.error(f"CoinGecko returned {response.status} for {endpoint}")
+            if response.status == 429 or response.status >= 500:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                upstream_breaker.record_failure(retry_after)
+            else:
+                # Any other answer (e.g. 404 for an unknown coin) shows the upstream is up and ends a probe
+                upstream_breaker.record_success()
+            raise UpstreamUnavailable(f"HTTP {response.status}")
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching {endpoint}: {e}")
+        upstream_breaker.record_failure()
+        raise UpstreamUnavailable(str(e)) from e
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint)
+        UPSTREAM_RESPONSES.inc(endpoint, status)
+
+
+async def fetch_price_chunk(chunk: List[str]) -> Dict[str, Dict]:
+    """Fetch raw /simple/price entries for one chunk of CoinGecko ids, raising UpstreamUnavailable on failure"""
+    params = {
+        'ids': ','.join(chunk),
+        'vs_currencies': 'usd',
+        'include_24hr_change': 'true',
+        'include_market_cap': 'true'
+    }
+    data = await upstream_get_json('simple_price', 'simple/price', params)
+    return {
+        crypto_id: data[crypto_id]
+        for crypto_id in chunk if crypto_id in data and 'usd' in data[crypto_id]
+    }
+
+
+async def fetch_prices(crypto_ids: List[str]) -> Dict[str, Dict]:
+    """Fetch raw /simple/price entries for many CoinGecko ids, one request per chunk; raises only if all chunks fail"""
+    result = {}
+    if not crypto_ids:
+        return result
     
-    await update.message.reply_text(message, parse_mode='Markdown')
+    chunks = chunk_crypto_ids(sorted(set(crypto_ids)))
+    errors = []
+    for chunk_result in await asyncio.gather(*(fetch_price_chunk(chunk) for chunk in chunks),
+                                             return_exceptions=True):
+        if isinstance(chunk_result, UpstreamUnavailable):
+            errors.append(chunk_result)
+        elif isinstance(chunk_result, BaseException):
+            raise chunk_result
+        else:
+            result.update(chunk_result)
+    if errors and len(errors) == len(chunks):
+        raise errors[0]
+    # Every fetched price also feeds the history behind percent-move alerts
+    price_history.record_many(result, time.time())
+    return result
 
 
-async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Remove all alerts for a cryptocurrency"""
-    user_id = update.effective_user.id
+class PriceCache:
+    """In-process TTL cache of CoinGecko price entries with LRU eviction, single-flight fetches and stale reads"""
     
-    if not context.args:
-        await update.message.reply_text(t(user_id, 'remove_usage'))
-        return
+    def __init__(self, ttl: float, max_size: int, stale_max_age: float = 0.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        # Expired entries younger than this may still be served to callers that accept stale data
+        self.stale_max_age = stale_max_age
+        # {crypto_id: (fetched_at, entry)}, least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        # {crypto_id: future resolving to the fetch result that covers this id}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        # Background refreshes started for stale reads
+        self._refreshes = set()
     
-    symbol = context.args[0].upper()
+    def __len__(self) -> int:
+        return len(self._entries)
     
-    if user_id in user_alerts and symbol in user_alerts[user_id]:
-        del user_alerts[user_id][symbol]
-        await update.message.reply_text(t(user_id, 'remove_success', symbol=symbol))
-    else:
-        await update.message.reply_text(t(user_id, 'remove_not_found', symbol=symbol))
+    def put(self, crypto_id: str, entry: Dict, fetched_at: Optional[float] = None) -> None:
+        """Store a fresh entry, evicting the least recently used ids over the size bound"""
+        self._entries[crypto_id] = (fetched_at if fetched_at is not None else time.monotonic(), entry)
+        self._entries.move_to_end(crypto_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
     
-    # Also remove from watchlist
-    if user_id in user_watchlists and symbol in user_watchlists[user_id]:
-        user_watchlists[user_id].remove(symbol)
-        await update.message.reply_text(t(user_id, 'remove_watchlist', symbol=symbol))
-
-
-async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Change language preference"""
-    user_id = update.effective_user.id
+    def update_price(self, crypto_id: str, price: float) -> None:
+        """Apply a streamed USD price to a cached entry, keeping its fetch time and other fields"""
+        cached = self._entries.get(crypto_id)
+        if cached:
+            entry = dict(cached[1])
+            entry['usd'] = price
+            self._entries[crypto_id] = (cached[0], entry)
     
-    # Create inline keyboard with language options
-    keyboard = [
-        [
-            InlineKeyboardButton("🇬🇧 English", callback_data='lang_en'),
-            InlineKeyboardButton("🇷🇺 Русский", callback_data='lang_ru')
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    def age(self, crypto_id: str) -> float:
+        """Seconds since the cached entry was fetched (0 if it is not cached)"""
+        cached = self._entries.get(crypto_id)
+        return time.monotonic() - cached[0] if cached else 0.0
     
-    current_lang = get_user_lang(user_id)
-    if current_lang == 'en':
-        text = "Choose your language:\nВыберите язык:"
-    else:
-        text = "Выберите язык:\nChoose your language:"
+    def _stale_entry(self, crypto_id: str, now: float) -> Optional[Dict]:
+        cached = self._entries.get(crypto_id)
+        if cached and now - cached[0] < self.stale_max_age:
+            return cached[1]
+        return None
     
-    await update.message.reply_text(text, reply_markup=reply_markup)
-
-
-async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle language selection from inline keyboard"""
-    query = update.callback_query
-    await query.answer()
+    def _claim(self, crypto_ids: List[str]) -> asyncio.Future:
+        """Mark ids as being fetched, returning the future their result will be published on"""
+        future = asyncio.get_running_loop().create_future()
+        for crypto_id in crypto_ids:
+            self._inflight[crypto_id] = future
+        return future
     
-    user_id = query.from_user.id
+    async def _fetch(self, crypto_ids: List[str], fetcher,
+                     future: Optional[asyncio.Future] = None) -> Dict[str, Dict]:
+        """Fetch ids nobody is fetching yet, publishing the result to concurrent waiters"""
+        if future is None:
+            future = self._claim(crypto_ids)
+        data = {}
+        try:
+            data = await fetcher(crypto_ids)
+            fetched_at = time.monotonic()
+            for crypto_id, entry in data.items():
+                self.put(crypto_id, entry, fetched_at)
+        except CircuitOpen:
+            pass
+        except UpstreamUnavailable as e:
+            logger.warning(f"Price fetch for {len(crypto_ids)} ids failed: {e}")
+        finally:
+            for crypto_id in crypto_ids:
+                if self._inflight.get(crypto_id) is future:
+                    del self._inflight[crypto_id]
+            future.set_result(data)
+        return data
     
-    if query.data == 'lang_en':
-        user_languages[user_id] = 'en'
-        await query.edit_message_text(text=t(user_id, 'lang_changed'))
-    elif query.data == 'lang_ru':
-        user_languages[user_id] = 'ru'
-        await query.edit_message_text(text=t(user_id, 'lang_changed'))
-
-
-async def check_alerts(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Background task to check all alerts"""
-    for user_id, alerts in list(user_alerts.items()):
-        for symbol, alert_list in list(alerts.items()):
-            price_data = await get_crypto_price(symbol)
-            
-            if not price_data:
+    def _refresh(self, crypto_ids: List[str], fetcher) -> None:
+        """Re-fetch stale ids in the background"""
+        # Claimed right away, so callers in the same loop iteration wait for this fetch instead of starting another
+        task = asyncio.create_task(self._fetch(crypto_ids, fetcher, self._claim(crypto_ids)))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+    
+    def peek(self, crypto_id: str) -> Optional[Dict]:
+        """Return the cached entry if it is still fresh, without fetching or touching stats"""
+        cached = self._entries.get(crypto_id)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+    
+    def snapshot(self, crypto_id: str) -> Optional[Tuple[float, Dict]]:
+        """Return (fetched_at, entry) if it may still be served, even stale, without fetching or touching stats"""
+        cached = self._entries.get(crypto_id)
+        if cached and time.monotonic() - cached[0] < max(self.ttl, self.stale_max_age):
+            return cached
+        return None
+    
+    def prefetch(self, crypto_ids, fetcher) -> None:
+        """Start one background fetch for the ids that are neither fresh nor already being fetched"""
+        now = time.monotonic()
+        to_fetch = []
+        for crypto_id in crypto_ids:
+            cached = self._entries.get(crypto_id)
+            if crypto_id not in self._inflight and not (cached and now - cached[0] < self.ttl):
+                to_fetch.append(crypto_id)
+        if to_fetch and not upstream_breaker.is_open():
+            self._refresh(to_fetch, fetcher)
+    
+    async def get_many(self, crypto_ids, fetcher, max_age: Optional[float] = None,
+                       stale_ok: bool = False) -> Dict[str, Dict]:
+        """Return entries for the given ids, fetching only the misses that nobody is fetching yet"""
+        # With stale_ok, expired entries younger than stale_max_age are returned at once and refreshed
+        # in the background, and they also stand in for ids whose fetch fails
+        now = time.monotonic()
+        if max_age is None:
+            max_age = self.ttl
+        result = {}
+        waiting = {}
+        to_fetch = []
+        to_refresh = []
+        seen = set()
+        
+        for crypto_id in crypto_ids:
+            if crypto_id in seen:
+                continue
+            seen.add(crypto_id)
+            cached = self._entries.get(crypto_id)
+            if cached and now - cached[0] < max_age:
+                self._entries.move_to_end(crypto_id)
+                result[crypto_id] = cached[1]
+                self.hits += 1
                 continue
             
-            current_price = price_data['price']
-            alerts_to_remove = []
-            
-            for idx, (target_price, direction) in enumerate(alert_list):
-                triggered = False
-                
-                if direction == 'above' and current_price >= target_price:
-                    triggered = True
-                elif direction == 'below' and current_price <= target_price:
-                    triggered = True
-                
-                if triggered:
-                    direction_text = t(user_id, direction)
-                    message = t(user_id, 'alert_triggered',
-                               symbol=symbol,
-                               target=target_price,
-                               direction=direction_text,
-                               current=current_price,
-                               time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                    try:
-                        await context.bot.send_message(
-                            chat_id=user_id,
-                            text=message,
-                            parse_mode='Markdown'
-                        )
-                        alerts_to_remove.append(idx)
-                    except Exception as e:
-                        logger.error(f"Error sending alert to user {user_id}: {e}")
-            
-            # Remove triggered alerts
-            for idx in sorted(alerts_to_remove, reverse=True):
-                alert_list.pop(idx)
+            self.misses += 1
+            if stale_ok:
+                stale = self._stale_entry(crypto_id, now)
+                if stale is not None:
+                    result[crypto_id] = stale
+                    self.stale += 1
+                    if crypto_id not in self._inflight:
+                        to_refresh.append(crypto_id)
+                    continue
             
-            # Clean up empty alert lists
-            if not alert_list:
-                del alerts[symbol]
+            future = self._inflight.get(crypto_id)
+            if future is not None:
+                waiting[crypto_id] = future
+                self.coalesced += 1
+            else:
+                to_fetch.append(crypto_id)
+        
+        if to_refresh and not upstream_breaker.is_open():
+            self._refresh(to_refresh, fetcher)
+        
+        if to_fetch:
+            data = await self._fetch(to_fetch, fetcher)
+            for crypto_id in to_fetch:
+                if crypto_id in data:
+                    result[crypto_id] = data[crypto_id]
+        
+        for crypto_id, future in waiting.items():
+            data = await asyncio.shield(future)
+            if crypto_id in data:
+                result[crypto_id] = data[crypto_id]
+        
+        if stale_ok:
+            # Ids whose fetch failed fall back to whatever we last knew
+            now = time.monotonic()
+            for crypto_id in seen - result.keys():
+                stale = self._stale_entry(crypto_id, now)
+                if stale is not None:
+                    result[crypto_id] = stale
+                    self.stale += 1
+        
+        return result
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current size"""
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'stale': self.stale
+        }
 
 
-def load_token() -> str:
-    """Load bot token from rr.env file or environment variable"""
-    # First, try to load from rr.env file
-    env_file = Path(__file__).parent / 'rr.env'
+# Shared price cache used by /price, /watchlist and the alert checker
+price_cache = PriceCache(PRICE_CACHE_TTL, PRICE_CACHE_MAX_SIZE, PRICE_STALE_MAX_AGE)
+
+
+class CoinIndex:
+    """CoinGecko coin universe: exact symbol and id maps plus a prefix trie of symbols for suggestions"""
     
-    if env_file.exists():
-        try:
+    # Trie key marking that the path spelled so far is a complete symbol (real keys are single characters)
+    END = ''
+    
+    def __init__(self, rows=()):
+        # {SYMBOL: [crypto_id, ...]}; more than one id means the ticker is ambiguous
+        self.by_symbol: Dict[str, List[str]] = {}
+        # {crypto_id: (SYMBOL, name)}
+        self.by_id: Dict[str, Tuple[str, str]] = {}
+        # Nested {character: node} dicts spelling every symbol
+        self.trie: Dict = {}
+        # {stored key: crypto_id} for keys whose coin a newer list would change; they resolve like CRYPTO_IDS
+        self.pinned: Dict[str, str] = {}
+        for crypto_id, symbol, name in rows:
+            self.add(crypto_id, symbol, name)
+        # The curated coins resolve even before the full list has been downloaded
+        for symbol, crypto_id in CRYPTO_IDS.items():
+            self.add(crypto_id, symbol, symbol)
+    
+    def __len__(self) -> int:
+        return len(self.by_id)
+    
+    def add(self, crypto_id: str, symbol: str, name: str) -> None:
+        symbol = symbol.upper()
+        if not crypto_id or not symbol or crypto_id in self.by_id:
+            return
+        self.by_id[crypto_id] = (symbol, name)
+        ids = self.by_symbol.get(symbol)
+        if ids is not None:
+            ids.append(crypto_id)
+            return
+        self.by_symbol[symbol] = [crypto_id]
+        node = self.trie
+        for char in symbol:
+            child = node.get(char)
+            if child is None:
+                child = node[char] = {}
+            node = child
+        node[self.END] = symbol
+    
+    def resolve(self, text: str) -> Optional[str]:
+        """Key the bot stores for a user-typed ticker or CoinGecko id: the ticker if it names one coin, else the id"""
+        symbol = text.upper()
+        if symbol in CRYPTO_IDS or symbol in self.pinned:
+            return symbol
+        ids = self.by_symbol.get(symbol)
+        if ids is not None and len(ids) == 1:
+            return symbol
+        crypto_id = text.lower()
+        if crypto_id in self.pinned:
+            return crypto_id
+        coin = self.by_id.get(crypto_id)
+        if coin is None:
+            return None
+        return coin[0] if self.coin_id(coin[0]) == crypto_id else crypto_id
+    
+    def coin_id(self, key: str) -> Optional[str]:
+        """CoinGecko id behind a key returned by resolve"""
+        crypto_id = CRYPTO_IDS.get(key) or self.pinned.get(key)
+        if crypto_id is not None:
+            return crypto_id
+        ids = self.by_symbol.get(key)
+        if ids is not None:
+            return ids[0] if len(ids) == 1 else None
+        return key if key in self.by_id else None
+    
+    def candidates(self, text: str) -> List[str]:
+        """Ids sharing an ambiguous ticker (empty if the ticker resolves or is unknown)"""
+        symbol = text.upper()
+        ids = self.by_symbol.get(symbol)
+        if symbol in CRYPTO_IDS or symbol in self.pinned or ids is None or len(ids) == 1:
+            return []
+        return ids
+    
+    def pin(self, keys, previous: 'CoinIndex') -> Dict[str, str]:
+        """Pin keys to the coin they named in the previous index where this one would name another or none"""
+        self.pinned.update(previous.pinned)
+        added = {}
+        for key in keys:
+            crypto_id = previous.coin_id(key)
+            if crypto_id is not None and self.coin_id(key) != crypto_id:
+                self.pinned[key] = added[key] = crypto_id
+        return added
+    
+    def _walk(self, text: str) -> Tuple[Dict, int]:
+        """Deepest trie node along text and how many characters of it matched"""
+        node = self.trie
+        matched = 0
+        for char in text.upper():
+            child = node.get(char)
+            if child is None:
+                break
+            node = child
+            matched += 1
+        return node, matched
+    
+    def _collect(self, node: Dict, limit: int) -> List[str]:
+        """Up to limit symbols below node, shortest first"""
+        symbols = []
+        queue = deque([node])
+        while queue and len(symbols) < limit:
+            node = queue.popleft()
+            if self.END in node:
+                symbols.append(node[self.END])
+            queue.extend(child for char, child in sorted(node.items()) if char)
+        return symbols
+    
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Shortest symbols starting with prefix"""
+        node, matched = self._walk(prefix)
+        return self._collect(node, limit) if prefix and matched == len(prefix) else []
+    
+    def suggest(self, text: str, limit: int = 5) -> List[str]:
+        """Shortest symbols sharing the longest prefix of text that any symbol has"""
+        node, matched = self._walk(text)
+        return self._collect(node, limit) if matched else []
+
+
+def read_coin_list(path: str) -> List[Tuple[str, str, str]]:
+    """(id, symbol, name) rows of the on-disk coin list, one tab-separated row per line"""
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) == 3:
+                rows.append(tuple(fields))
+    return rows
+
+
+def write_coin_list(path: str, rows: List[Tuple[str, str, str]]) -> None:
+    """Replace the on-disk coin list atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{crypto_id}\t{symbol}\t{name}\n" for crypto_id, symbol, name in rows)
+    os.replace(tmp_path, path)
+
+
+def load_coin_index(path: str) -> CoinIndex:
+    """Build the index from the on-disk coin list, or from the curated coins alone if there is none"""
+    try:
+        return CoinIndex(read_coin_list(path))
+    except FileNotFoundError:
+        return CoinIndex()
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Could not read coin list {path}: {e}")
+        return CoinIndex()
+
+
+def coin_list_age(path: str) -> float:
+    """Seconds since the on-disk coin list was written (infinite if there is none)"""
+    try:
+        return max(0.0, time.time() - os.path.getmtime(path))
+    except OSError:
+        return math.inf
+
+
+async def fetch_coin_list() -> List[Tuple[str, str, str]]:
+    """Download CoinGecko's full /coins/list as (id, symbol, name) rows"""
+    # Several megabytes of JSON, so the usual request timeout is too short
+    data = await upstream_get_json('coins_list', 'coins/list', timeout=aiohttp.ClientTimeout(total=120))
+    
+    # Tabs and newlines would break the on-disk format
+    clean = str.maketrans('\t\n\r', '   ')
+    return [
+        (str(coin['id']).translate(clean), str(coin['symbol']).translate(clean),
+         str(coin.get('name') or '').translate(clean))
+        for coin in data
+        if isinstance(coin, dict) and coin.get('id') and coin.get('symbol')
+    ]
+
+
+def store_coin_list(path: str, rows: List[Tuple[str, str, str]]) -> CoinIndex:
+    """Write a downloaded list to disk and build its index (blocking, run in a thread)"""
+    write_coin_list(path, rows)
+    return CoinIndex(rows)
+
+
+async def refresh_coin_list(context: Optional[ContextTypes.DEFAULT_TYPE] = None) -> None:
+    """Re-download the coin list and swap in a freshly built index"""
+    global coin_index
+    try:
+        rows = await fetch_coin_list()
+    except UpstreamUnavailable as e:
+        logger.warning(f"Could not refresh the coin list: {e}")
+        return
+    try:
+        index = await asyncio.to_thread(store_coin_list, COIN_LIST_PATH, rows)
+    except OSError as e:
+        logger.error(f"Could not write coin list {COIN_LIST_PATH}: {e}")
+        index = CoinIndex(rows)
+    # Stored alerts and watchlists keep the coin they were set on, even where the new list makes their
+    # ticker ambiguous; without the pin they would never be priced again
+    for key, crypto_id in index.pin(stored_symbols(), coin_index).items():
+        logger.info(f"Pinned {key} to {crypto_id}: the new coin list changes what it names")
+        state_store.queue('INSERT OR REPLACE INTO coin_pins (symbol, crypto_id) VALUES (?, ?)', (key, crypto_id))
+    coin_index = index
+    logger.info(f"Coin list refreshed: {len(coin_index)} coins, {len(coin_index.by_symbol)} tickers")
+
+
+# Every coin the bot can resolve; loaded from COIN_LIST_PATH in post_init
+coin_index = CoinIndex()
+
+
+def resolve_symbol(text: str) -> Optional[str]:
+    """Key for a user-typed ticker or CoinGecko id, or None if it is unknown or ambiguous"""
+    return coin_index.resolve(text)
+
+
+def format_money(amount: float, currency: str, decimals: int = 2) -> str:
+    """An amount with its currency sign, e.g. $50,000.00 or 4,600,000.00 ₽"""
+    prefix, suffix = CURRENCY_SIGNS.get(currency) or ('', ' ' + currency.upper())
+    return f"{prefix}{amount:,.{decimals}f}{suffix}"
+
+
+async def fetch_exchange_rates() -> Dict[str, float]:
+    """Download CoinGecko's /exchange_rates as {fiat currency: units per 1 USD}"""
+    data = await upstream_get_json('exchange_rates', 'exchange_rates')
+    
+    # Rates are quoted per 1 BTC; dividing by the USD rate turns them into units per 1 USD
+    try:
+        rates = data['rates']
+        usd = float(rates['usd']['value'])
+        return {
+            code: float(rate['value']) / usd
+            for code, rate in rates.items() if rate.get('type') == 'fiat' and rate.get('value')
+        }
+    except (KeyError, TypeError, ValueError, ZeroDivisionError, AttributeError) as e:
+        raise UpstreamUnavailable(f"malformed exchange rates: {e}") from e
+
+
+async def refresh_exchange_rates(context: Optional[ContextTypes.DEFAULT_TYPE] = None) -> None:
+    """Re-download the exchange rates; the previous ones stay in use if that fails"""
+    global fx_rates
+    try:
+        rates = await fetch_exchange_rates()
+    except UpstreamUnavailable as e:
+        logger.warning(f"Could not refresh exchange rates: {e}")
+        return
+    fx_rates = {**rates, 'usd': 1.0}
+    quoted = ', '.join(f"{c.upper()}={fx_rates[c]:.4f}" for c in CURRENCIES if c in fx_rates)
+    logger.info(f"Exchange rates refreshed: {quoted} per USD")
+
+
+# Units of each fiat currency per 1 USD; only USD until refresh_exchange_rates has run
+fx_rates: Dict[str, float] = {'usd': 1.0}
+
+
+def get_user_currency(user_id: int) -> str:
+    """Get user's quote currency preference, default to USD"""
+    return user_currencies.get(user_id, 'usd')
+
+
+def quote_currency(user_id: int) -> Tuple[str, float]:
+    """The user's currency and its units per USD, falling back to USD while its rate is unknown"""
+    currency = user_currencies.get(user_id, 'usd')
+    rate = fx_rates.get(currency)
+    if rate is None:
+        return 'usd', 1.0
+    return currency, rate
+
+
+async def fetch_market_chart(crypto_id: str, days: int) -> List[float]:
+    """Download CoinGecko's /coins/{id}/market_chart USD prices for the last `days` days, oldest first"""
+    data = await upstream_get_json('market_chart', f'coins/{crypto_id}/market_chart',
+                                   {'vs_currency': 'usd', 'days': str(days)})
+    
+    # Points are [timestamp in ms, price]; only the prices are drawn
+    try:
+        prices = [float(point[1]) for point in data['prices'] if point[1] is not None]
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        raise UpstreamUnavailable(f"malformed market chart: {e}") from e
+    if not prices:
+        raise UpstreamUnavailable(f"empty market chart for {crypto_id}")
+    return prices
+
+
+def coin_id(symbol: str) -> Optional[str]:
+    """CoinGecko id behind a resolved symbol key"""
+    return coin_index.coin_id(symbol)
+
+
+async def get_crypto_prices(symbols, max_age: Optional[float] = None, stale_ok: bool = False) -> Dict[str, Dict]:
+    """Get current prices for several cryptocurrencies with a single batched fetch"""
+    # 'age' is the seconds since the price was fetched; with stale_ok it can exceed the cache TTL
+    ids_by_symbol = {}
+    for symbol in symbols:
+        crypto_id = coin_id(symbol)
+        if crypto_id is not None:
+            ids_by_symbol[symbol] = crypto_id
+    
+    data = await price_cache.get_many(ids_by_symbol.values(), fetch_prices, max_age, stale_ok)
+    
+    prices = {}
+    for symbol, crypto_id in ids_by_symbol.items():
+        if crypto_id in data:
+            prices[symbol] = price_data_from(symbol, data[crypto_id], price_cache.age(crypto_id))
+    return prices
+
+
+def price_data_from(symbol: str, entry: Dict, age: float) -> Dict:
+    """Price dict used by the handlers, from a raw /simple/price entry fetched `age` seconds ago"""
+    return {
+        'symbol': symbol,
+        'price': entry['usd'],
+        'change_24h': entry.get('usd_24h_change') or 0,
+        'market_cap': entry.get('usd_market_cap') or 0,
+        'age': age
+    }
+
+
+async def get_crypto_price(symbol: str) -> Optional[Dict]:
+    """Get current cryptocurrency price from CoinGecko API, falling back to the last known price"""
+    symbol = resolve_symbol(symbol)
+    
+    if symbol is None:
+        return None
+    
+    prices = await get_crypto_prices([symbol], stale_ok=True)
+    return prices.get(symbol)
+
+
+class PriceRing:
+    """Fixed-capacity ring of (bucket start time, low, high) samples of one coin's price"""
+    
+    __slots__ = ('times', 'lows', 'highs', 'capacity', 'resolution', 'count')
+    
+    def __init__(self, capacity: int, resolution: float):
+        # Columns grow up to capacity, after which the oldest slot is overwritten
+        self.times = array('d')
+        self.lows = array('d')
+        self.highs = array('d')
+        self.capacity = capacity
+        self.resolution = resolution
+        # Samples ever started; sample n lives in slot n % capacity while n >= first_seq()
+        self.count = 0
+    
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+    
+    def first_seq(self) -> int:
+        return max(0, self.count - self.capacity)
+    
+    def sample(self, seq: int) -> Tuple[float, float, float]:
+        slot = seq % self.capacity
+        return self.times[slot], self.lows[slot], self.highs[slot]
+    
+    def record(self, timestamp: float, price: float) -> None:
+        """Widen the current bucket's low/high with a price, or start a new bucket once it is resolution old"""
+        if self.count:
+            slot = (self.count - 1) % self.capacity
+            # Prices from a clock that stepped back are merged into the current bucket too
+            if timestamp - self.times[slot] < self.resolution:
+                if price < self.lows[slot]:
+                    self.lows[slot] = price
+                if price > self.highs[slot]:
+                    self.highs[slot] = price
+                return
+        if len(self.times) < self.capacity:
+            self.times.append(timestamp)
+            self.lows.append(price)
+            self.highs.append(price)
+        else:
+            slot = self.count % self.capacity
+            self.times[slot] = timestamp
+            self.lows[slot] = price
+            self.highs[slot] = price
+        self.count += 1
+    
+    def columns(self) -> Tuple[array, array, array]:
+        """Times, lows and highs in chronological order"""
+        if self.count <= self.capacity:
+            return array('d', self.times), array('d', self.lows), array('d', self.highs)
+        split = self.count % self.capacity
+        return tuple(column[split:] + column[:split] for column in (self.times, self.lows, self.highs))
+
+
+class PriceHistory:
+    """Bounded price rings per CoinGecko id, filled from fetched and streamed prices, with a binary snapshot"""
+    
+    # Snapshot layout (little-endian): magic, version, coin count, then per coin the id length, sample
+    # count, the id and its times, lows and highs as consecutive float64 columns
+    MAGIC = b'CBPH'
+    VERSION = 1
+    
+    def __init__(self, capacity: int, resolution: float, max_coins: int):
+        self.capacity = capacity
+        self.resolution = resolution
+        self.max_coins = max_coins
+        # {crypto_id: PriceRing}, least recently updated first
+        self.rings: OrderedDict = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self.rings)
+    
+    def ring(self, crypto_id: Optional[str]) -> Optional[PriceRing]:
+        return self.rings.get(crypto_id)
+    
+    def record(self, crypto_id: str, price: float, timestamp: float) -> None:
+        """Add one observed USD price, evicting the least recently updated coin over max_coins"""
+        if not price or price <= 0:
+            return
+        ring = self.rings.get(crypto_id)
+        if ring is None:
+            ring = self.rings[crypto_id] = PriceRing(self.capacity, self.resolution)
+            while len(self.rings) > self.max_coins:
+                self.rings.popitem(last=False)
+        else:
+            self.rings.move_to_end(crypto_id)
+        ring.record(timestamp, price)
+    
+    def record_many(self, entries: Dict[str, Dict], timestamp: float) -> None:
+        """Add the USD prices of raw /simple/price entries"""
+        for crypto_id, entry in entries.items():
+            self.record(crypto_id, entry.get('usd'), timestamp)
+    
+    def dump(self) -> bytes:
+        """Serialize every ring, oldest sample first"""
+        parts = [struct.pack('<4sHI', self.MAGIC, self.VERSION, len(self.rings))]
+        for crypto_id, ring in self.rings.items():
+            name = crypto_id.encode()
+            columns = ring.columns()
+            parts.append(struct.pack('<HI', len(name), len(columns[0])))
+            parts.append(name)
+            for column in columns:
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                parts.append(column.tobytes())
+        return b''.join(parts)
+    
+    def load(self, data: bytes) -> int:
+        """Replay a snapshot into the rings (re-bucketed to the current settings), returning the samples read"""
+        magic, version, coins = struct.unpack_from('<4sHI', data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError('not a price history snapshot')
+        offset = struct.calcsize('<4sHI')
+        samples = 0
+        for _ in range(coins):
+            name_length, count = struct.unpack_from('<HI', data, offset)
+            offset += struct.calcsize('<HI')
+            crypto_id = data[offset:offset + name_length].decode()
+            offset += name_length
+            columns = []
+            for _ in range(3):
+                column = array('d')
+                column.frombytes(data[offset:offset + count * 8])
+                if len(column) != count:
+                    raise ValueError('truncated price history snapshot')
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                columns.append(column)
+                offset += count * 8
+            for timestamp, low, high in zip(*columns):
+                self.record(crypto_id, low, timestamp)
+                self.record(crypto_id, high, timestamp)
+            samples += count
+        return samples
+    
+    def save(self, path: str, data: Optional[bytes] = None) -> None:
+        """Write a snapshot atomically (blocking; pass a dump taken on the event loop when called from a thread)"""
+        if data is None:
+            data = self.dump()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def restore(self, path: str) -> None:
+        """Load a snapshot written by save, if there is one"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not read price history snapshot: {e}")
+            return
+        try:
+            samples = self.load(data)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            logger.warning(f"Ignoring unreadable price history snapshot {path}: {e}")
+            return
+        logger.info(f"Loaded {samples} price history samples for {len(self.rings)} coins")
+
+
+# Price history of recently seen coins, the data behind percent-move alerts
+price_history = PriceHistory(HISTORY_CAPACITY, HISTORY_RESOLUTION, HISTORY_MAX_COINS)
+
+
+class ThresholdSide:
+    """One direction's thresholds: prices ascending in array('d') with their owners in a parallel array('q')"""
+    
+    __slots__ = ('prices', 'users', 'dead')
+    
+    # Removed entries keep their slot with this user id until the side is compacted
+    TOMBSTONE = 0
+    
+    def __init__(self):
+        self.prices = array('d')
+        self.users = array('q')
+        self.dead = 0
+    
+    def __len__(self) -> int:
+        return len(self.prices) - self.dead
+    
+    def append(self, target_price: float, user_id: int) -> None:
+        """Add a threshold known to sort last (bulk loads)"""
+        self.prices.append(target_price)
+        self.users.append(user_id)
+    
+    def add(self, target_price: float, user_id: int) -> None:
+        idx = bisect_right(self.prices, target_price)
+        self.prices.insert(idx, target_price)
+        self.users.insert(idx, user_id)
+    
+    def remove(self, target_price: float, user_id: int) -> bool:
+        """Tombstone one threshold, returning False if it is not present"""
+        idx = bisect_left(self.prices, target_price)
+        users = self.users
+        while idx < len(self.prices) and self.prices[idx] == target_price:
+            if users[idx] == user_id:
+                users[idx] = self.TOMBSTONE
+                self.dead += 1
+                if self.dead > 64 and self.dead * 4 > len(users):
+                    self.compact()
+                return True
+            idx += 1
+        return False
+    
+    def compact(self) -> None:
+        """Drop tombstoned slots"""
+        self.prices = array('d', compress(self.prices, self.users))
+        self.users = array('q', filter(None, self.users))
+        self.dead = 0
+    
+    def first_live_after(self, idx: int) -> int:
+        while idx < len(self.users) and self.users[idx] == self.TOMBSTONE:
+            idx += 1
+        return idx
+    
+    def last_live_before(self, idx: int) -> int:
+        idx -= 1
+        while idx >= 0 and self.users[idx] == self.TOMBSTONE:
+            idx -= 1
+        return idx
+    
+    def pop_range(self, start: int, end: int) -> List[Tuple[float, int]]:
+        """Remove slots [start, end) and return their live (target_price, user_id) pairs"""
+        popped = [pair for pair in zip(self.prices[start:end], self.users[start:end]) if pair[1]]
+        self.dead -= (end - start) - len(popped)
+        del self.prices[start:end]
+        del self.users[start:end]
+        return popped
+
+
+class AlertIndex:
+    """Sorted above/below thresholds of one symbol, so a price finds its fired alerts by bisection"""
+    
+    __slots__ = ('above', 'below')
+    
+    def __init__(self):
+        # "above" fires when price >= target
+        self.above = ThresholdSide()
+        # "below" fires when price <= target
+        self.below = ThresholdSide()
+    
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below)
+    
+    def _side(self, direction: str) -> ThresholdSide:
+        return self.above if direction == 'above' else self.below
+    
+    def add(self, target_price: float, user_id: int, direction: str) -> None:
+        """Insert one alert keeping its side sorted"""
+        self._side(direction).add(target_price, user_id)
+    
+    def remove(self, target_price: float, user_id: int, direction: str) -> bool:
+        """Remove one alert, returning False if it is not indexed"""
+        return self._side(direction).remove(target_price, user_id)
+    
+    def nearest_distance(self, price: float) -> float:
+        """Relative distance from price to the closest armed threshold on either side"""
+        distance = math.inf
+        above = self.above
+        idx = above.first_live_after(bisect_right(above.prices, price))
+        if idx < len(above.prices):
+            distance = (above.prices[idx] - price) / price
+        below = self.below
+        idx = below.last_live_before(bisect_left(below.prices, price))
+        if idx >= 0:
+            distance = min(distance, (price - below.prices[idx]) / price)
+        return distance
+    
+    def pop_triggered(self, price: float) -> List[Tuple[float, int, str]]:
+        """Remove and return (target_price, user_id, direction) of every alert fired by this price"""
+        triggered = []
+        
+        idx = bisect_right(self.above.prices, price)
+        if idx:
+            triggered.extend((target, user_id, 'above') for target, user_id in self.above.pop_range(0, idx))
+        
+        idx = bisect_left(self.below.prices, price)
+        if idx < len(self.below.prices):
+            triggered.extend(
+                (target, user_id, 'below')
+                for target, user_id in self.below.pop_range(idx, len(self.below.prices))
+            )
+        
+        return triggered
+
+
+class RearmIndex:
+    """Alerts of one symbol held out of its AlertIndex until the price moves back through the hysteresis band"""
+    
+    __slots__ = ('band', 'levels', 'targets')
+    
+    def __init__(self):
+        self.band = ALERT_HYSTERESIS_PCT / 100
+        # A held "above" alert waits as a "below" threshold at target * (1 - band), and the other way round
+        self.levels = AlertIndex()
+        # (level, user_id, waiting direction) -> targets held there, as a level does not map back to its exact target
+        self.targets: Dict[Tuple[float, int, str], List[float]] = {}
+    
+    def __len__(self) -> int:
+        return len(self.levels)
+    
+    def _level(self, target_price: float, direction: str) -> Tuple[float, str]:
+        if direction == 'above':
+            return target_price * (1 - self.band), 'below'
+        return target_price * (1 + self.band), 'above'
+    
+    def add(self, target_price: float, user_id: int, direction: str) -> None:
+        """Hold one alert until the price crosses back over its level"""
+        level, waiting = self._level(target_price, direction)
+        self.levels.add(level, user_id, waiting)
+        self.targets.setdefault((level, user_id, waiting), []).append(target_price)
+    
+    def remove(self, target_price: float, user_id: int, direction: str) -> bool:
+        """Drop one held alert, returning False if it is not held"""
+        level, waiting = self._level(target_price, direction)
+        key = (level, user_id, waiting)
+        targets = self.targets.get(key)
+        if not targets or target_price not in targets:
+            return False
+        self.levels.remove(level, user_id, waiting)
+        targets.remove(target_price)
+        if not targets:
+            del self.targets[key]
+        return True
+    
+    def pop_rearmed(self, price: float) -> List[Tuple[float, int, str]]:
+        """Remove and return (target_price, user_id, direction) of every alert this price re-arms"""
+        rearmed = []
+        for level, user_id, waiting in self.levels.pop_triggered(price):
+            key = (level, user_id, waiting)
+            targets = self.targets[key]
+            target_price = targets.pop()
+            if not targets:
+                del self.targets[key]
+            rearmed.append((target_price, user_id, 'above' if waiting == 'below' else 'below'))
+        return rearmed
+    
+    def items(self):
+        """Iterate held (target_price, user_id, direction)"""
+        for (level, user_id, waiting), targets in self.targets.items():
+            direction = 'above' if waiting == 'below' else 'below'
+            for target_price in targets:
+                yield target_price, user_id, direction
+
+
+class MoveWindow:
+    """Percent-move alerts sharing one window length, with the rolling low/high of the coin's history over it"""
+    
+    __slots__ = ('window', 'alerts', 'lows', 'highs', 'ring', 'seen')
+    
+    def __init__(self, window: int):
+        self.window = window
+        # Percents ascending with their owners: a move of m% fires every alert at or below m
+        self.alerts = ThresholdSide()
+        # Monotonic deques of (seq, bucket time, value): lows ascending and highs descending from the front
+        self.lows = deque()
+        self.highs = deque()
+        # History ring being followed and its first sample not consumed yet
+        self.ring: Optional[PriceRing] = None
+        self.seen = 0
+    
+    def advance(self, ring: PriceRing, now: float) -> None:
+        """Consume new history samples and drop the ones that left the window"""
+        lows = self.lows
+        highs = self.highs
+        if ring is not self.ring:
+            # First use, or the coin's history was evicted and started over
+            lows.clear()
+            highs.clear()
+            self.ring = ring
+            self.seen = 0
+        for seq in range(max(self.seen, ring.first_seq()), ring.count):
+            timestamp, low, high = ring.sample(seq)
+            # The latest bucket is re-read every time as it may still widen; its older entry is popped here
+            while lows and lows[-1][2] >= low:
+                lows.pop()
+            lows.append((seq, timestamp, low))
+            while highs and highs[-1][2] <= high:
+                highs.pop()
+            highs.append((seq, timestamp, high))
+        self.seen = max(0, ring.count - 1)
+        
+        oldest = ring.first_seq()
+        cutoff = now - self.window
+        # The latest sample always stays, so a window is never empty once there is history
+        for extremes in (lows, highs):
+            while len(extremes) > 1 and (extremes[0][0] < oldest or extremes[0][1] < cutoff):
+                extremes.popleft()
+    
+    def move(self, price: float) -> Tuple[float, float]:
+        """Larger of the relative rise from the window's low and fall from its high, signed, with that reference"""
+        if not self.lows:
+            return 0.0, price
+        low = self.lows[0][2]
+        high = self.highs[0][2]
+        rise = price / low - 1
+        fall = 1 - price / high
+        return (rise, low) if rise >= fall else (-fall, high)
+
+
+class MoveIndex:
+    """Percent-move alerts of one symbol, grouped by window so each group shares one rolling low/high"""
+    
+    __slots__ = ('windows',)
+    
+    def __init__(self):
+        # {window seconds: MoveWindow}
+        self.windows: Dict[int, MoveWindow] = {}
+    
+    def __len__(self) -> int:
+        return sum(len(moves.alerts) for moves in self.windows.values())
+    
+    def add(self, percent: float, window: int, user_id: int) -> None:
+        moves = self.windows.get(window)
+        if moves is None:
+            moves = self.windows[window] = MoveWindow(window)
+        moves.alerts.add(percent, user_id)
+    
+    def remove(self, percent: float, window: int, user_id: int) -> bool:
+        """Remove one alert, returning False if it is not indexed"""
+        moves = self.windows.get(window)
+        if moves is None or not moves.alerts.remove(percent, user_id):
+            return False
+        if not moves.alerts:
+            del self.windows[window]
+        return True
+    
+    def sampling_interval(self) -> float:
+        """Longest poll interval that still gives the shortest window a few samples"""
+        return min(self.windows) / 4 if self.windows else math.inf
+    
+    def nearest_distance(self, price: float, ring: Optional[PriceRing], now: float) -> float:
+        """Relative price change still needed to fire the closest alert (0 while there is no history)"""
+        if ring is None:
+            return 0.0
+        distance = math.inf
+        for moves in self.windows.values():
+            idx = moves.alerts.first_live_after(0)
+            if idx < len(moves.alerts.prices):
+                moves.advance(ring, now)
+                change, _ = moves.move(price)
+                distance = min(distance, max(0.0, moves.alerts.prices[idx] / 100 - abs(change)))
+        return distance
+    
+    def pop_triggered(self, price: float, ring: PriceRing,
+                      now: float) -> List[Tuple[float, int, int, float, float]]:
+        """Remove and return (percent, window, user_id, change, reference) of every alert fired by this price"""
+        triggered = []
+        for window, moves in list(self.windows.items()):
+            moves.advance(ring, now)
+            change, reference = moves.move(price)
+            idx = bisect_right(moves.alerts.prices, abs(change) * 100)
+            if idx:
+                triggered.extend(
+                    (percent, window, user_id, change, reference)
+                    for percent, user_id in moves.alerts.pop_range(0, idx)
+                )
+                if not moves.alerts:
+                    del self.windows[window]
+        return triggered
+
+
+class CompactAlertStore:
+    """Every user's alerts as parallel arrays sorted by user id, with an append-only tail and tombstoned deletes"""
+    
+    DIRECTIONS = ('above', 'below')
+    # Direction byte of a deleted row
+    DEAD = 255
+    
+    def __init__(self, compact_after: int = 4096):
+        # Symbols are stored as small ids: {symbol: id} and id -> symbol
+        self.symbol_ids: Dict[str, int] = {}
+        self.symbols: List[str] = []
+        # Row columns
+        self.users = array('q')
+        self.symbol_col = array('I')
+        self.targets = array('d')
+        self.directions = bytearray()
+        # Rows [0, sorted_len) are ordered by user id (then insertion); later rows are the unsorted tail
+        self.sorted_len = 0
+        # {user_id: tail row positions}
+        self.tail: Dict[int, List[int]] = {}
+        # Positions of deleted rows in the sorted part
+        self.dead_rows: List[int] = []
+        self.live = 0
+        self.user_count = 0
+        # Tail rows plus tombstones that trigger a compaction
+        self.compact_after = compact_after
+    
+    def __len__(self) -> int:
+        return self.live
+    
+    def intern(self, symbol: str) -> int:
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+    
+    def _rows(self, user_id: int) -> List[int]:
+        """Live row positions of the user in insertion order"""
+        lo = bisect_left(self.users, user_id, 0, self.sorted_len)
+        hi = bisect_right(self.users, user_id, lo, self.sorted_len)
+        rows = [row for row in range(lo, hi) if self.directions[row] != self.DEAD]
+        for row in self.tail.get(user_id, ()):
+            if self.directions[row] != self.DEAD:
+                rows.append(row)
+        return rows
+    
+    def _append(self, user_id: int, symbol_id: int, target_price: float, direction: str) -> None:
+        self.users.append(user_id)
+        self.symbol_col.append(symbol_id)
+        self.targets.append(target_price)
+        self.directions.append(0 if direction == 'above' else 1)
+    
+    def load_sorted(self, rows) -> int:
+        """Bulk-append (user_id, symbol, target_price, direction) rows ordered by user id onto an empty store"""
+        count = 0
+        last_user = None
+        for user_id, symbol, target_price, direction in rows:
+            self._append(user_id, self.intern(symbol), target_price, direction)
+            if user_id != last_user:
+                self.user_count += 1
+                last_user = user_id
+            count += 1
+        self.sorted_len = len(self.users)
+        self.live += count
+        return count
+    
+    def add(self, user_id: int, symbol: str, target_price: float, direction: str) -> None:
+        if not self._rows(user_id):
+            self.user_count += 1
+        self.tail.setdefault(user_id, []).append(len(self.users))
+        self._append(user_id, self.intern(symbol), target_price, direction)
+        self.live += 1
+        self._maybe_compact()
+    
+    def alerts_of(self, user_id: int) -> Dict[str, List[Tuple[float, str]]]:
+        """The user's alerts as {symbol: [(target_price, direction)]}, in the order they were set"""
+        alerts = {}
+        for row in self._rows(user_id):
+            alerts.setdefault(self.symbols[self.symbol_col[row]], []).append(
+                (self.targets[row], self.DIRECTIONS[self.directions[row]])
+            )
+        return alerts
+    
+    def contains(self, user_id: int, symbol: str, target_price: float, direction: str) -> bool:
+        return self._find(user_id, symbol, target_price, direction) is not None
+    
+    def _find(self, user_id: int, symbol: str, target_price: float, direction: str) -> Optional[int]:
+        symbol_id = self.symbol_ids.get(symbol)
+        code = 0 if direction == 'above' else 1
+        for row in self._rows(user_id):
+            if (self.symbol_col[row] == symbol_id and self.targets[row] == target_price
+                    and self.directions[row] == code):
+                return row
+        return None
+    
+    def _kill(self, row: int) -> None:
+        self.directions[row] = self.DEAD
+        self.live -= 1
+        if row < self.sorted_len:
+            self.dead_rows.append(row)
+    
+    def remove_one(self, user_id: int, symbol: str, target_price: float, direction: str) -> bool:
+        """Delete one matching alert, returning False if the user has none"""
+        row = self._find(user_id, symbol, target_price, direction)
+        if row is None:
+            return False
+        self._kill(row)
+        self._user_removed(user_id)
+        return True
+    
+    def remove_symbol(self, user_id: int, symbol: str) -> List[Tuple[float, str]]:
+        """Delete all of the user's alerts for a symbol and return them as (target_price, direction)"""
+        symbol_id = self.symbol_ids.get(symbol)
+        removed = []
+        for row in self._rows(user_id):
+            if self.symbol_col[row] == symbol_id:
+                removed.append((self.targets[row], self.DIRECTIONS[self.directions[row]]))
+                self._kill(row)
+        if removed:
+            self._user_removed(user_id)
+        return removed
+    
+    def _user_removed(self, user_id: int) -> None:
+        if not self._rows(user_id):
+            self.user_count -= 1
+            self.tail.pop(user_id, None)
+        self._maybe_compact()
+    
+    def items(self):
+        """Iterate live (user_id, symbol, target_price, direction) rows"""
+        for row, code in enumerate(self.directions):
+            if code != self.DEAD:
+                yield self.users[row], self.symbols[self.symbol_col[row]], self.targets[row], self.DIRECTIONS[code]
+    
+    def _maybe_compact(self) -> None:
+        if len(self.users) - self.sorted_len + len(self.dead_rows) >= self.compact_after:
+            self.compact()
+    
+    def compact(self) -> None:
+        """Merge the tail into the sorted part and drop deleted rows, copying runs of rows as slices"""
+        users = self.users
+        # (position in the sorted part, 0 = insert tail row before it / 1 = drop it, user id, row)
+        ops = [(row, 1, 0, row) for row in self.dead_rows]
+        for row in range(self.sorted_len, len(users)):
+            if self.directions[row] != self.DEAD:
+                user_id = users[row]
+                ops.append((bisect_right(users, user_id, 0, self.sorted_len), 0, user_id, row))
+        ops.sort()
+        
+        columns = (users, self.symbol_col, self.targets, self.directions)
+        merged = [array('q'), array('I'), array('d'), bytearray()]
+        prev = 0
+        for at, op, _, row in ops:
+            if at > prev:
+                for out, column in zip(merged, columns):
+                    out += column[prev:at]
+                prev = at
+            if op:
+                prev = at + 1
+            else:
+                for out, column in zip(merged, columns):
+                    out.append(column[row])
+        for out, column in zip(merged, columns):
+            out += column[prev:self.sorted_len]
+        
+        self.users, self.symbol_col, self.targets, self.directions = merged
+        self.sorted_len = len(self.users)
+        self.tail = {}
+        self.dead_rows = []
+    
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the row columns"""
+        return sum(column.buffer_info()[1] * column.itemsize for column in (self.users, self.symbol_col, self.targets)) \
+            + len(self.directions)
+
+
+# Every user's alerts; the per-symbol thresholds live in alert_index
+alert_store = CompactAlertStore()
+
+
+def alert_shard_worker(conn) -> None:
+    """Worker process loop: owns one shard of the alert indexes and evaluates price snapshots against it"""
+    # Ctrl+C reaches the whole process group; the main process stops shards itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    indexes: Dict[str, AlertIndex] = {}
+    
+    while True:
+        try:
+            command = conn.recv()
+        except (EOFError, OSError):
+            return
+        op = command[0]
+        
+        if op == 'add':
+            _, symbol, target_price, user_id, direction = command
+            if symbol not in indexes:
+                indexes[symbol] = AlertIndex()
+            indexes[symbol].add(target_price, user_id, direction)
+        elif op == 'remove':
+            _, symbol, target_price, user_id, direction = command
+            index = indexes.get(symbol)
+            if index is not None:
+                index.remove(target_price, user_id, direction)
+                if not index:
+                    del indexes[symbol]
+        elif op == 'load':
+            # Rows arrive sorted by (symbol, direction, target, user_id), so appending keeps sides sorted
+            for symbol, direction, target_price, user_id in command[1]:
+                if symbol not in indexes:
+                    indexes[symbol] = AlertIndex()
+                indexes[symbol]._side(direction).append(target_price, user_id)
+        elif op == 'evaluate':
+            triggered = []
+            distances = {}
+            for symbol, price in command[1].items():
+                index = indexes.get(symbol)
+                if index is None:
+                    continue
+                triggered.extend((symbol, target, user_id, direction)
+                                 for target, user_id, direction in index.pop_triggered(price))
+                if index:
+                    distances[symbol] = index.nearest_distance(price)
+                else:
+                    del indexes[symbol]
+            conn.send((triggered, distances))
+        elif op == 'stop':
+            return
+
+
+class ShardedSymbolIndex:
+    """Main-process stand-in for a symbol's AlertIndex whose thresholds live in the shard workers"""
+    
+    __slots__ = ('symbol', 'shards', 'count', 'distance')
+    
+    def __init__(self, symbol: str, shards: 'AlertShards'):
+        self.symbol = symbol
+        self.shards = shards
+        # Alerts users still have on the symbol, including those whose notification is in flight
+        self.count = 0
+        # Nearest threshold distance reported by the last evaluation
+        self.distance = 0.0
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def add(self, target_price: float, user_id: int, direction: str) -> None:
+        self.shards.route(user_id, ('add', self.symbol, target_price, user_id, direction))
+        self.count += 1
+    
+    def remove(self, target_price: float, user_id: int, direction: str) -> bool:
+        self.shards.route(user_id, ('remove', self.symbol, target_price, user_id, direction))
+        self.count -= 1
+        return True
+    
+    def nearest_distance(self, price: float) -> float:
+        # Reschedules follow an evaluation at the same price, so the reported distance is current
+        return self.distance
+
+
+class AlertShards:
+    """Alert indexes partitioned by user id across worker processes, evaluated with one broadcast per snapshot"""
+    
+    def __init__(self, count: int):
+        self.count = count
+        self.processes: List[multiprocessing.Process] = []
+        self.conns = []
+        self._context = multiprocessing.get_context('spawn')
+        self._lock: Optional[asyncio.Lock] = None
+        # Commands waiting for each shard's writer task, which sends them in order off the event loop
+        self._outbox: List[List[tuple]] = []
+        self._wakeups: List[asyncio.Event] = []
+        self._writers: List[asyncio.Task] = []
+    
+    def _spawn(self, shard: int) -> None:
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=alert_shard_worker, args=(child,), name=f'alert-shard-{shard}', daemon=True
+        )
+        process.start()
+        child.close()
+        self.processes[shard] = process
+        self.conns[shard] = parent
+    
+    def start(self) -> None:
+        """Start the worker processes"""
+        self.processes = [None] * self.count
+        self.conns = [None] * self.count
+        for shard in range(self.count):
+            self._spawn(shard)
+        self._lock = asyncio.Lock()
+        self._outbox = [[] for _ in range(self.count)]
+        self._wakeups = [asyncio.Event() for _ in range(self.count)]
+        self._writers = [asyncio.create_task(self._write_loop(shard)) for shard in range(self.count)]
+        logger.info(f"Started {self.count} alert shard workers")
+    
+    def shard_of(self, user_id: int) -> int:
+        return user_id % self.count
+    
+    def send(self, shard: int, command: tuple) -> None:
+        """Queue a command for the shard without blocking on a full pipe"""
+        self._outbox[shard].append(command)
+        self._wakeups[shard].set()
+    
+    @staticmethod
+    def _send_all(conn, commands: List[tuple]) -> None:
+        for command in commands:
+            conn.send(command)
+    
+    async def _write_loop(self, shard: int) -> None:
+        """Send the shard's queued commands from a worker thread, in the order they were queued"""
+        while True:
+            await self._wakeups[shard].wait()
+            self._wakeups[shard].clear()
+            while self._outbox[shard]:
+                commands, self._outbox[shard] = self._outbox[shard], []
+                try:
+                    await asyncio.to_thread(self._send_all, self.conns[shard], commands)
+                except (OSError, ValueError) as e:
+                    # A dead worker is noticed and rebuilt by the next evaluate
+                    logger.error(f"Alert shard {shard} unavailable: {e}")
+    
+    def route(self, user_id: int, command: tuple) -> None:
+        """Send an index mutation to the shard owning the user"""
+        self.send(self.shard_of(user_id), command)
+    
+    def load(self, rows, batch_size: int = 50000) -> None:
+        """Distribute sorted (symbol, direction, target, user_id) rows to their shards in batches"""
+        batches = [[] for _ in range(self.count)]
+        for row in rows:
+            batch = batches[row[3] % self.count]
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.send(row[3] % self.count, ('load', batch))
+                batches[row[3] % self.count] = []
+        for shard, batch in enumerate(batches):
+            if batch:
+                self.send(shard, ('load', batch))
+    
+    def _restart(self, shard: int) -> None:
+        """Replace a dead worker and rebuild its shard from alert_store"""
+        logger.error(f"Alert shard {shard} died, restarting it")
+        self.processes[shard].kill()
+        self._spawn(shard)
+        # Whatever was still queued for the old worker is covered by the rebuild below
+        self._outbox[shard].clear()
+        # Held repeating alerts wait in the main process until they re-arm, so they stay out of the rebuild
+        held: Dict[Tuple[str, float, int, str], int] = {}
+        for symbol, index in held_alerts.items():
+            for target, user_id, direction in index.items():
+                held[(symbol, target, user_id, direction)] = held.get((symbol, target, user_id, direction), 0) + 1
+        rows = []
+        counts: Dict[str, int] = {}
+        for user_id, symbol, target, direction in alert_store.items():
+            key = (symbol, target, user_id, direction)
+            if held.get(key):
+                held[key] -= 1
+                continue
+            counts[symbol] = counts.get(symbol, 0) + 1
+            # Alerts whose notification is in flight are re-armed too; a duplicate beats a lost alert
+            if self.shard_of(user_id) == shard:
+                rows.append((symbol, direction, target, user_id))
+        self.load(sorted(rows))
+        
+        # Counts cover armed and in-flight alerts of every shard, which is exactly the alerts not held
+        for symbol in list(alert_index):
+            if isinstance(alert_index[symbol], ShardedSymbolIndex) and symbol not in counts:
+                del alert_index[symbol]
+        for symbol, count in counts.items():
+            index_for(symbol).count = count
+    
+    async def evaluate(self, prices: Dict[str, float]) -> Dict[str, List[Tuple[float, int, str]]]:
+        """Pop every alert fired by the snapshot, grouped by symbol, and refresh threshold distances"""
+        async with self._lock:
+            # Queued behind any pending mutations, so each shard evaluates its up-to-date index
+            for shard in range(self.count):
+                self.send(shard, ('evaluate', prices))
+            replies = await asyncio.gather(
+                *(asyncio.to_thread(conn.recv) for conn in self.conns), return_exceptions=True
+            )
+        
+        triggered: Dict[str, List[Tuple[float, int, str]]] = {}
+        distances = {symbol: math.inf for symbol in prices}
+        for shard, reply in enumerate(replies):
+            if isinstance(reply, BaseException):
+                self._restart(shard)
+                continue
+            fired, shard_distances = reply
+            for symbol, target_price, user_id, direction in fired:
+                triggered.setdefault(symbol, []).append((target_price, user_id, direction))
+            for symbol, distance in shard_distances.items():
+                distances[symbol] = min(distances[symbol], distance)
+        
+        for symbol, distance in distances.items():
+            index = alert_index.get(symbol)
+            if isinstance(index, ShardedSymbolIndex):
+                index.distance = distance
+        return triggered
+    
+    def alert_delivered(self, symbol: str) -> None:
+        """Stop counting a delivered alert, dropping the symbol once none are left"""
+        index = alert_index.get(symbol)
+        if index is None:
+            return
+        index.count -= 1
+        if not index:
+            del alert_index[symbol]
+    
+    def _join(self, timeout: float) -> None:
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+    
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Ask the workers to exit after their queued commands and reap them"""
+        for shard in range(self.count):
+            self.send(shard, ('stop',))
+        await asyncio.to_thread(self._join, timeout)
+        for writer in self._writers:
+            writer.cancel()
+        await asyncio.gather(*self._writers, return_exceptions=True)
+        for conn in self.conns:
+            conn.close()
+
+
+# Shard workers, created in post_init when ALERT_SHARDS is set
+alert_shards: Optional[AlertShards] = None
+
+
+def index_for(symbol: str):
+    """The symbol's alert index, created on first use"""
+    index = alert_index.get(symbol)
+    if index is None:
+        index = alert_index[symbol] = AlertIndex() if alert_shards is None else ShardedSymbolIndex(symbol, alert_shards)
+    return index
+
+
+def move_index_for(symbol: str) -> MoveIndex:
+    """The symbol's percent-move index, created on first use"""
+    index = move_index.get(symbol)
+    if index is None:
+        index = move_index[symbol] = MoveIndex()
+    return index
+
+
+def held_index_for(symbol: str) -> RearmIndex:
+    """The symbol's held alerts, created on first use"""
+    held = held_alerts.get(symbol)
+    if held is None:
+        held = held_alerts[symbol] = RearmIndex()
+    return held
+
+
+def has_alerts(symbol: str) -> bool:
+    """True while the symbol has threshold, held or percent-move alerts"""
+    return bool(alert_index.get(symbol)) or bool(move_index.get(symbol)) or bool(held_alerts.get(symbol))
+
+
+def alert_symbols() -> List[str]:
+    """Symbols with threshold, held or percent-move alerts, i.e. the ones that need prices"""
+    symbols = [symbol for symbol, index in alert_index.items() if index]
+    symbols.extend(symbol for symbol, index in move_index.items() if index and not alert_index.get(symbol))
+    # Held alerts need prices too, or they would never see the price move back and re-arm
+    symbols.extend(
+        symbol for symbol, held in held_alerts.items()
+        if held and not alert_index.get(symbol) and not move_index.get(symbol)
+    )
+    return symbols
+
+
+def stored_symbols() -> Set[str]:
+    """Every symbol key kept in alerts or watchlists"""
+    symbols = set(alert_symbols())
+    for watchlist in user_watchlists.values():
+        symbols.update(watchlist)
+    return symbols
+
+
+class StateStore:
+    """SQLite (WAL) persistence for alerts, move alerts, watchlists and user preferences with write-behind group commits"""
+    
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            target REAL NOT NULL,
+            direction TEXT NOT NULL,
+            repeat INTEGER NOT NULL DEFAULT 0,
+            currency TEXT NOT NULL DEFAULT 'usd',
+            amount REAL,
+            held INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS alerts_by_user ON alerts (user_id, symbol);
+        CREATE INDEX IF NOT EXISTS alerts_by_symbol ON alerts (symbol, direction, target, user_id);
+        CREATE TABLE IF NOT EXISTS move_alerts (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            percent REAL NOT NULL,
+            window_seconds INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS move_alerts_by_user ON move_alerts (user_id, symbol);
+        CREATE TABLE IF NOT EXISTS watchlists (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            UNIQUE (user_id, symbol)
+        );
+        CREATE TABLE IF NOT EXISTS languages (
+            user_id INTEGER PRIMARY KEY,
+            lang TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS currencies (
+            user_id INTEGER PRIMARY KEY,
+            currency TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS live_dashboards (
+            user_id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS coin_pins (
+            symbol TEXT PRIMARY KEY,
+            crypto_id TEXT NOT NULL
+        );
+    '''
+    
+    # Columns added after the tables were first released: (table, column, definition)
+    MIGRATIONS = (
+        ('alerts', 'repeat', 'INTEGER NOT NULL DEFAULT 0'),
+        ('alerts', 'currency', "TEXT NOT NULL DEFAULT 'usd'"),
+        ('alerts', 'amount', 'REAL'),
+        ('alerts', 'held', 'INTEGER NOT NULL DEFAULT 0')
+    )
+    
+    def __init__(self, path: str, flush_interval: float, max_retries: int = STATE_FLUSH_MAX_RETRIES):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        # Consecutive failed commits of the batch at the front of the queue
+        self._failures = 0
+        self.conn: Optional[sqlite3.Connection] = None
+        # Queued (sql, params) mutations, committed together by the flush task
+        self._pending: List[Tuple[str, tuple]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+    
+    def open(self) -> None:
+        """Open the database in WAL mode and create missing tables"""
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        for table, column, definition in self.MIGRATIONS:
+            if column not in {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}:
+                self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def load(self) -> None:
+        """Bulk-load stored state straight into the in-memory structures"""
+        # Held repeating alerts stay out of the index until the price moves back through the hysteresis band
+        rows = self.conn.execute(
+            'SELECT symbol, direction, target, user_id FROM alerts WHERE held = 0 '
+            'ORDER BY symbol, direction, target, user_id'
+        )
+        if alert_shards is not None:
+            rows = rows.fetchall()
+            alert_shards.load(rows)
+        side_key = None
+        side_append = None
+        for symbol, direction, target, user_id in rows:
+            if (symbol, direction) != side_key:
+                index = index_for(symbol)
+                side_key = (symbol, direction)
+                side_append = index._side(direction).append if alert_shards is None else None
+            if side_append is not None:
+                # Rows arrive in (target, user_id) order, so appending keeps each side sorted
+                side_append(target, user_id)
+            else:
+                index.count += 1
+        for symbol, target, user_id, direction in self.conn.execute(
+            'SELECT symbol, target, user_id, direction FROM alerts WHERE held = 1'
+        ):
+            held_index_for(symbol).add(target, user_id, direction)
+        
+        # Per-user rows in the order they were set
+        count = alert_store.load_sorted(self.conn.execute(
+            'SELECT user_id, symbol, target, direction FROM alerts ORDER BY user_id, id'
+        ))
+        repeat_alerts.update(self.conn.execute(
+            'SELECT user_id, symbol, target, direction FROM alerts WHERE repeat = 1'
+        ))
+        for user_id, symbol, target, direction, currency, amount in self.conn.execute(
+            "SELECT user_id, symbol, target, direction, currency, amount FROM alerts WHERE currency != 'usd'"
+        ):
+            alert_quotes[(user_id, symbol, target, direction)] = (currency, amount)
+        
+        for user_id, symbol, percent, window in self.conn.execute(
+            'SELECT user_id, symbol, percent, window_seconds FROM move_alerts ORDER BY id'
+        ):
+            user_move_alerts.setdefault(user_id, []).append((symbol, percent, window))
+            move_index_for(symbol).add(percent, window, user_id)
+            count += 1
+        
+        for user_id, symbol in self.conn.execute('SELECT user_id, symbol FROM watchlists ORDER BY id'):
+            user_watchlists.setdefault(user_id, []).append(symbol)
+        
+        coin_index.pinned.update(self.conn.execute('SELECT symbol, crypto_id FROM coin_pins'))
+        user_languages.update(self.conn.execute('SELECT user_id, lang FROM languages'))
+        user_currencies.update(self.conn.execute('SELECT user_id, currency FROM currencies'))
+        for user_id, chat_id, message_id in self.conn.execute(
+            'SELECT user_id, chat_id, message_id FROM live_dashboards'
+        ):
+            live_dashboards.messages[user_id] = (chat_id, message_id)
+        logger.info(f"Loaded {count} alerts, {len(user_watchlists)} watchlists and {len(user_languages)} languages")
+    
+    def queue(self, sql: str, params: tuple) -> None:
+        """Queue a mutation for the next group commit"""
+        self._pending.append((sql, params))
+    
+    def _write(self, batch: List[Tuple[str, tuple]]) -> None:
+        self.conn.execute('BEGIN')
+        try:
+            # Consecutive identical statements go through a single executemany
+            start = 0
+            while start < len(batch):
+                sql = batch[start][0]
+                end = start + 1
+                while end < len(batch) and batch[end][0] == sql:
+                    end += 1
+                self.conn.executemany(sql, [params for _, params in batch[start:end]])
+                start = end
+            self.conn.execute('COMMIT')
+        except Exception:
+            if self.conn.in_transaction:
+                self.conn.execute('ROLLBACK')
+            raise
+    
+    def _write_each(self, batch: List[Tuple[str, tuple]]) -> int:
+        """Commit the statements one at a time, dropping those that fail; returns how many were dropped"""
+        dropped = 0
+        for statement in batch:
+            try:
+                self._write([statement])
+            except Exception as e:
+                logger.error(f"Dropping state change {statement[0]!r} {statement[1]!r}: {e}")
+                dropped += 1
+        return dropped
+    
+    async def flush(self) -> None:
+        """Commit every queued mutation in one transaction off the event loop"""
+        async with self._flush_lock:
+            if not self._pending or self.conn is None:
+                return
+            batch = self._pending
+            self._pending = []
+            if self._failures >= self.max_retries:
+                # The batch keeps failing, most likely on one bad statement: isolate it rather than block the queue
+                dropped = await asyncio.to_thread(self._write_each, batch)
+                self._failures = 0
+                if dropped:
+                    STATE_DROPPED_WRITES.inc(amount=dropped)
+                return
+            try:
+                await asyncio.to_thread(self._write, batch)
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                logger.error(f"Error writing {len(batch)} state changes (attempt {self._failures}): {e}")
+                # The transaction was rolled back, so the whole batch can be retried
+                self._pending = batch + self._pending
+    
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    def start(self) -> None:
+        """Start the periodic group-commit task"""
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        """Stop the flush task, commit what is left and close the database"""
+        if self._task is not None:
+            # Never cancel a flush midway: its transaction is still running in a worker thread
+            async with self._flush_lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._flush_lock is not None:
+            await self.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# Durable storage behind alert_store, user_watchlists, user_languages and user_currencies
+state_store = StateStore(STATE_DB_PATH, STATE_FLUSH_INTERVAL_MS / 1000)
+
+
+def add_alert(user_id: int, symbol: str, target_price: float, direction: str, repeat: bool = False,
+              quote: Optional[Tuple[str, float]] = None) -> None:
+    """Store a new alert with a USD target, plus the (currency, target) the user entered if it was not USD"""
+    alert_store.add(user_id, symbol, target_price, direction)
+    if repeat:
+        repeat_alerts.add((user_id, symbol, target_price, direction))
+    if quote is not None:
+        alert_quotes[(user_id, symbol, target_price, direction)] = quote
+    # New alerts are always armed, even at a price already past the target; only repeating alerts are held
+    # back by the hysteresis band, and only after they fired
+    index_for(symbol).add(target_price, user_id, direction)
+    poll_scheduler.threshold_added(symbol, target_price)
+    currency, amount = quote if quote is not None else ('usd', None)
+    state_store.queue(
+        'INSERT INTO alerts (user_id, symbol, target, direction, repeat, currency, amount) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (user_id, symbol, target_price, direction, int(repeat), currency, amount)
+    )
+
+
+def remove_alerts(user_id: int, symbol: str) -> bool:
+    """Remove all of the user's alerts for a symbol, returning False if there were none"""
+    alerts = alert_store.remove_symbol(user_id, symbol)
+    if not alerts:
+        return False
+    state_store.queue('DELETE FROM alerts WHERE user_id = ? AND symbol = ?', (user_id, symbol))
+    
+    index = alert_index.get(symbol)
+    held = held_alerts.get(symbol)
+    for target_price, direction in alerts:
+        repeat_alerts.discard((user_id, symbol, target_price, direction))
+        alert_quotes.pop((user_id, symbol, target_price, direction), None)
+        if held is not None and held.remove(target_price, user_id, direction):
+            continue
+        if index is not None:
+            index.remove(target_price, user_id, direction)
+    if index is not None and not index:
+        del alert_index[symbol]
+    if held is not None and not held:
+        del held_alerts[symbol]
+    return True
+
+
+def rearm_alert(user_id: int, symbol: str, target_price: float, direction: str) -> None:
+    """Put a popped alert back into the index if the user still has it"""
+    if not alert_store.contains(user_id, symbol, target_price, direction):
+        return
+    
+    if alert_shards is not None:
+        # Sharded indexes keep counting an alert while its notification is in flight
+        alert_shards.route(user_id, ('add', symbol, target_price, user_id, direction))
+        return
+    index_for(symbol).add(target_price, user_id, direction)
+
+
+def forget_triggered_alert(user_id: int, symbol: str, target_price: float, direction: str) -> None:
+    """Drop a delivered alert from the user's list (it is already out of the index)"""
+    if not alert_store.remove_one(user_id, symbol, target_price, direction):
+        return
+    alert_quotes.pop((user_id, symbol, target_price, direction), None)
+    state_store.queue(
+        'DELETE FROM alerts WHERE id = (SELECT id FROM alerts '
+        'WHERE user_id = ? AND symbol = ? AND target = ? AND direction = ? LIMIT 1)',
+        (user_id, symbol, target_price, direction)
+    )
+    if alert_shards is not None:
+        alert_shards.alert_delivered(symbol)
+
+
+def mark_alert_held(user_id: int, symbol: str, target_price: float, direction: str, held: bool) -> None:
+    """Persist that one of the user's matching alerts was held back or re-armed, so a restart keeps it that way"""
+    state_store.queue(
+        'UPDATE alerts SET held = ? WHERE id = (SELECT id FROM alerts '
+        'WHERE user_id = ? AND symbol = ? AND target = ? AND direction = ? AND held = ? LIMIT 1)',
+        (int(held), user_id, symbol, target_price, direction, int(not held))
+    )
+
+
+def alert_delivered(user_id: int, symbol: str, target_price: float, direction: str) -> None:
+    """Drop a delivered alert, or hold a repeating one until the price moves back through the hysteresis band"""
+    if (user_id, symbol, target_price, direction) not in repeat_alerts:
+        forget_triggered_alert(user_id, symbol, target_price, direction)
+        return
+    if not alert_store.contains(user_id, symbol, target_price, direction):
+        return
+    held_index_for(symbol).add(target_price, user_id, direction)
+    mark_alert_held(user_id, symbol, target_price, direction, True)
+    if alert_shards is not None:
+        # Held alerts live in the main process; the shard gets the alert back once it re-arms
+        alert_shards.alert_delivered(symbol)
+
+
+def release_held_alerts(symbol: str, current_price: float) -> None:
+    """Put the held alerts this price has moved back through the hysteresis band into the index"""
+    held = held_alerts.get(symbol)
+    if held is None:
+        return
+    rearmed = held.pop_rearmed(current_price)
+    if rearmed:
+        index = index_for(symbol)
+        for target_price, user_id, direction in rearmed:
+            index.add(target_price, user_id, direction)
+            poll_scheduler.threshold_added(symbol, target_price)
+            mark_alert_held(user_id, symbol, target_price, direction, False)
+    if not held:
+        del held_alerts[symbol]
+
+
+def add_move_alert(user_id: int, symbol: str, percent: float, window: int) -> None:
+    """Store a new percent-move alert for the user and index it"""
+    user_move_alerts.setdefault(user_id, []).append((symbol, percent, window))
+    move_index_for(symbol).add(percent, window, user_id)
+    # Start sampling the coin now rather than at its next scheduled poll
+    poll_scheduler.expedite(symbol, time.monotonic())
+    state_store.queue(
+        'INSERT INTO move_alerts (user_id, symbol, percent, window_seconds) VALUES (?, ?, ?, ?)',
+        (user_id, symbol, percent, window)
+    )
+
+
+def remove_move_alerts(user_id: int, symbol: str) -> bool:
+    """Remove all of the user's percent-move alerts for a symbol, returning False if there were none"""
+    alerts = user_move_alerts.get(user_id)
+    removed = [alert for alert in alerts or () if alert[0] == symbol]
+    if not removed:
+        return False
+    alerts[:] = [alert for alert in alerts if alert[0] != symbol]
+    if not alerts:
+        del user_move_alerts[user_id]
+    state_store.queue('DELETE FROM move_alerts WHERE user_id = ? AND symbol = ?', (user_id, symbol))
+    
+    index = move_index.get(symbol)
+    if index is not None:
+        for _, percent, window in removed:
+            index.remove(percent, window, user_id)
+        if not index:
+            del move_index[symbol]
+    return True
+
+
+def rearm_move_alert(user_id: int, symbol: str, percent: float, window: int) -> None:
+    """Put a popped percent-move alert back into the index if the user still has it"""
+    if (symbol, percent, window) in user_move_alerts.get(user_id, ()):
+        move_index_for(symbol).add(percent, window, user_id)
+
+
+def forget_move_alert(user_id: int, symbol: str, percent: float, window: int) -> None:
+    """Drop a delivered percent-move alert from the user's list (it is already out of the index)"""
+    alerts = user_move_alerts.get(user_id)
+    if not alerts or (symbol, percent, window) not in alerts:
+        return
+    alerts.remove((symbol, percent, window))
+    if not alerts:
+        del user_move_alerts[user_id]
+    state_store.queue(
+        'DELETE FROM move_alerts WHERE id = (SELECT id FROM move_alerts '
+        'WHERE user_id = ? AND symbol = ? AND percent = ? AND window_seconds = ? LIMIT 1)',
+        (user_id, symbol, percent, window)
+    )
+
+
+def add_to_watchlist(user_id: int, symbol: str) -> bool:
+    """Add a symbol to the user's watchlist, returning False if it is already there"""
+    watchlist = user_watchlists.setdefault(user_id, [])
+    if symbol in watchlist:
+        return False
+    watchlist.append(symbol)
+    state_store.queue('INSERT OR IGNORE INTO watchlists (user_id, symbol) VALUES (?, ?)', (user_id, symbol))
+    return True
+
+
+def remove_from_watchlist(user_id: int, symbol: str) -> bool:
+    """Remove a symbol from the user's watchlist, returning False if it was not there"""
+    watchlist = user_watchlists.get(user_id)
+    if not watchlist or symbol not in watchlist:
+        return False
+    watchlist.remove(symbol)
+    state_store.queue('DELETE FROM watchlists WHERE user_id = ? AND symbol = ?', (user_id, symbol))
+    return True
+
+
+def set_user_language(user_id: int, lang: str) -> None:
+    """Store the user's language preference"""
+    user_languages[user_id] = lang
+    state_store.queue('INSERT OR REPLACE INTO languages (user_id, lang) VALUES (?, ?)', (user_id, lang))
+
+
+def set_user_currency(user_id: int, currency: str) -> None:
+    """Store the user's quote currency preference"""
+    user_currencies[user_id] = currency
+    state_store.queue('INSERT OR REPLACE INTO currencies (user_id, currency) VALUES (?, ?)', (user_id, currency))
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` operations per second with bursts up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self) -> float:
+        """Take one token, returning how many seconds the caller must wait before using it"""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    def available(self) -> bool:
+        """True if a token can be taken right now"""
+        self._refill(time.monotonic())
+        return self.tokens >= 1
+    
+    def is_idle(self) -> bool:
+        """True when the bucket is full again, i.e. it carries no state worth keeping"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+# Shared CoinGecko request budget (requests per second, with up to ten seconds of burst)
+upstream_budget = TokenBucket(UPSTREAM_REQUESTS_PER_MINUTE / 60, max(1.0, UPSTREAM_REQUESTS_PER_MINUTE / 6))
+
+
+class OutboundMessage:
+    """A queued Telegram message (or edit of an existing one) with delivery callbacks"""
+    
+    __slots__ = ('chat_id', 'text', 'parse_mode', 'message_id', 'on_sent', 'on_failed', 'attempts', 'enqueued_at')
+    
+    def __init__(self, chat_id: int, text: str, parse_mode: Optional[str] = None,
+                 on_sent=None, on_failed=None, message_id: Optional[int] = None):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        # Set for edits of a message already in the chat
+        self.message_id = message_id
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+class NotificationDispatcher:
+    """Outbound message queue drained by concurrent senders under global and per-chat rate limits"""
+    
+    def __init__(self, workers: int, global_rate: float, chat_rate: float, max_retries: int):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.bot = None
+        self._tasks: List[asyncio.Task] = []
+        # Messages accepted but not yet delivered or given up on
+        self.pending = 0
+        self._drained: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        # Recent send call durations and enqueue-to-delivery times, in seconds
+        self.send_latencies = deque(maxlen=1000)
+        self.delivery_latencies = deque(maxlen=1000)
+    
+    def start(self, bot) -> None:
+        """Start the sender tasks"""
+        self.bot = bot
+        self.queue = asyncio.Queue()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self, timeout: float) -> None:
+        """Give queued messages up to `timeout` seconds to go out, then stop the senders"""
+        if self.queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping dispatcher with {self.depth()} undelivered messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queue = None
+    
+    def depth(self) -> int:
+        """Number of messages not yet delivered or given up on"""
+        return self.pending
+    
+    def submit(self, chat_id: int, text: str, parse_mode: Optional[str] = None,
+               on_sent=None, on_failed=None, message_id: Optional[int] = None) -> None:
+        """Queue a message, or an edit of message_id; on_sent/on_failed are called once it succeeds or is abandoned"""
+        message = OutboundMessage(chat_id, text, parse_mode, on_sent, on_failed, message_id)
+        if self.queue is None:
+            logger.error(f"Dispatcher is not running, dropping message to {chat_id}")
+            if on_failed:
+                on_failed()
+            return
+        self.pending += 1
+        self._drained.clear()
+        self._schedule(message, self._chat_delay(chat_id))
+    
+    def _chat_delay(self, chat_id: int) -> float:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {
+                    cid: b for cid, b in self.chat_buckets.items() if not b.is_idle()
+                }
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1.0)
+        return bucket.reserve()
+    
+    def _schedule(self, message: OutboundMessage, delay: float) -> None:
+        if delay <= 0:
+            self.queue.put_nowait(message)
+            return
+        # Hold the message outside the queue so senders are not blocked by one busy chat
+        asyncio.get_running_loop().call_later(delay, self._release, message)
+    
+    def _release(self, message: OutboundMessage) -> None:
+        if self.queue is not None:
+            self.queue.put_nowait(message)
+    
+    async def _worker(self) -> None:
+        while True:
+            message = await self.queue.get()
+            try:
+                await self._deliver(message)
+            except Exception as e:
+                logger.error(f"Unexpected error delivering to {message.chat_id}: {e}")
+            finally:
+                self.queue.task_done()
+    
+    async def _deliver(self, message: OutboundMessage) -> None:
+        await self.global_bucket.acquire()
+        message.attempts += 1
+        started = time.monotonic()
+        
+        try:
+            if message.message_id is None:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode=message.parse_mode
+                )
+            else:
+                await self._edit(message)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Flood control for chat {message.chat_id}, retrying in {retry_after}s")
+            self._retry(message, float(retry_after))
+            return
+        except (BadRequest, Forbidden, InvalidToken) as e:
+            # Permanent errors: the chat is gone, blocked the bot or the message is malformed
+            logger.error(f"Error sending message to {message.chat_id}: {e}")
+            self._give_up(message)
+            return
+        except (NetworkError, asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logger.warning(f"Transient error sending to {message.chat_id} (attempt {message.attempts}): {e}")
+            self._retry(message, min(60.0, 2 ** message.attempts))
+            return
+        except Exception as e:
+            logger.error(f"Error sending message to {message.chat_id}: {e}")
+            self._give_up(message)
+            return
+        
+        now = time.monotonic()
+        OUTBOUND_LATENCY.observe(now - started)
+        self.send_latencies.append(now - started)
+        self.delivery_latencies.append(now - message.enqueued_at)
+        self.sent += 1
+        OUTBOUND_MESSAGES.inc('sent')
+        self._finish()
+        if message.on_sent:
+            message.on_sent()
+    
+    async def _edit(self, message: OutboundMessage) -> None:
+        try:
+            await self.bot.edit_message_text(
+                text=message.text,
+                chat_id=message.chat_id,
+                message_id=message.message_id,
+                parse_mode=message.parse_mode
+            )
+        except BadRequest as e:
+            # Telegram refuses edits that change nothing, but the message already shows this text
+            if 'not modified' not in str(e).lower():
+                raise
+    
+    def _retry(self, message: OutboundMessage, delay: float) -> None:
+        if message.attempts > self.max_retries:
+            self._give_up(message)
+            return
+        self.retried += 1
+        OUTBOUND_MESSAGES.inc('retried')
+        self._schedule(message, delay)
+    
+    def _give_up(self, message: OutboundMessage) -> None:
+        self.failed += 1
+        OUTBOUND_MESSAGES.inc('failed')
+        self._finish()
+        if message.on_failed:
+            message.on_failed()
+    
+    def _finish(self) -> None:
+        self.pending -= 1
+        if self.pending == 0:
+            self._drained.set()
+    
+    def stats(self) -> Dict[str, float]:
+        """Return queue depth, counters and recent latency percentiles in seconds"""
+        send = sorted(self.send_latencies)
+        delivery = sorted(self.delivery_latencies)
+        return {
+            'depth': self.depth(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'send_p50': send[len(send) // 2] if send else 0.0,
+            'send_p99': send[int(len(send) * 0.99)] if send else 0.0,
+            'delivery_p50': delivery[len(delivery) // 2] if delivery else 0.0,
+            'delivery_p99': delivery[int(len(delivery) * 0.99)] if delivery else 0.0
+        }
+
+
+# Shared outbound queue for alert notifications
+dispatcher = NotificationDispatcher(NOTIFY_WORKERS, NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_MAX_RETRIES)
+
+
+class AlertDigest:
+    """Coalesces the alerts each chat triggers within a short window into one notification"""
+    
+    def __init__(self, window: float, max_lines: int):
+        self.window = window
+        self.max_lines = max(1, max_lines)
+        # chat_id -> [(alert_time, render_single, render_line, on_sent, on_failed)] waiting for the flush
+        self._pending: Dict[int, List[tuple]] = {}
+        self._handle: Optional[asyncio.Handle] = None
+        self.alerts = 0
+        self.messages = 0
+        self.digests = 0
+    
+    def add(self, chat_id: int, alert_time: str, render_single: Callable[[], str],
+            render_line: Callable[[], str], on_sent, on_failed) -> None:
+        """Collect one fired alert; it is rendered and handed to the dispatcher at the next flush"""
+        entries = self._pending.get(chat_id)
+        if entries is None:
+            entries = self._pending[chat_id] = []
+        entries.append((alert_time, render_single, render_line, on_sent, on_failed))
+        self.alerts += 1
+        if self._handle is None:
+            loop = asyncio.get_running_loop()
+            # Without a window the flush still waits for the rest of the current tick
+            if self.window > 0:
+                self._handle = loop.call_later(self.window, self.flush)
+            else:
+                self._handle = loop.call_soon(self.flush)
+    
+    def pending(self) -> int:
+        """Alerts collected but not yet handed to the dispatcher"""
+        return sum(len(entries) for entries in self._pending.values())
+    
+    @staticmethod
+    def _run_all(callbacks) -> None:
+        for callback in callbacks:
+            callback()
+    
+    def flush(self) -> None:
+        """Send what every chat collected: a lone alert as its usual message, several as one digest"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        for chat_id, entries in pending.items():
+            if len(entries) == 1:
+                _, render_single, _, on_sent, on_failed = entries[0]
+                self.messages += 1
+                dispatcher.submit(chat_id, render_single(), parse_mode='Markdown',
+                                  on_sent=on_sent, on_failed=on_failed)
+                continue
+            renderer = renderer_for(chat_id)
+            for start in range(0, len(entries), self.max_lines):
+                chunk = entries[start:start + self.max_lines]
+                lines = [renderer.render('digest_header', count=len(chunk))]
+                lines.extend(entry[2]() for entry in chunk)
+                lines.append(renderer.render('digest_footer', time=chunk[-1][0]))
+                self.messages += 1
+                self.digests += 1
+                # Delivery or failure of the digest settles every alert in it
+                dispatcher.submit(
+                    chat_id,
+                    ''.join(lines),
+                    parse_mode='Markdown',
+                    on_sent=partial(self._run_all, [entry[3] for entry in chunk]),
+                    on_failed=partial(self._run_all, [entry[4] for entry in chunk])
+                )
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'alerts': self.alerts,
+            'messages': self.messages,
+            'digests': self.digests,
+            'pending': self.pending()
+        }
+
+
+# Per-chat coalescing stage between alert evaluation and the dispatcher
+alert_digest = AlertDigest(ALERT_DIGEST_WINDOW_MS / 1000, ALERT_DIGEST_MAX_LINES)
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send a message when the command /start is issued."""
+    user_id = update.effective_user.id
+    
+    if user_id not in user_languages:
+        set_user_language(user_id, 'en')
+    
+    await update.message.reply_text(t(user_id, 'welcome'), parse_mode='Markdown')
+
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send a message when the command /help is issued."""
+    await start(update, context)
+
+
+def format_price_message(user_id: int, price_data: Dict) -> str:
+    """The /price answer for a price dict, marked with its age when it is stale"""
+    updated = datetime.fromtimestamp(time.time() - price_data['age'])
+    change_emoji = "📈" if price_data['change_24h'] >= 0 else "📉"
+    change_sign = "+" if price_data['change_24h'] >= 0 else ""
+    currency, rate = quote_currency(user_id)
+    
+    message = t(user_id, 'price_info',
+               symbol=price_data['symbol'],
+               price=format_money(price_data['price'] * rate, currency),
+               emoji=change_emoji,
+               sign=change_sign,
+               change=price_data['change_24h'],
+               market_cap=format_money(price_data['market_cap'] * rate, currency, 0),
+               time=updated.strftime('%Y-%m-%d %H:%M:%S'))
+    if price_data['age'] > price_cache.ttl:
+        message += t(user_id, 'price_stale', minutes=max(1, round(price_data['age'] / 60)))
+    return message
+
+
+async def reply_unknown_symbol(update: Update, user_id: int, text: str, key: str) -> None:
+    """Answer a symbol that did not resolve: list the coins behind an ambiguous ticker, or suggest close ones"""
+    symbol = text.upper()
+    candidates = coin_index.candidates(text)
+    if candidates:
+        ids = ', '.join(candidates[:10]) + (', ...' if len(candidates) > 10 else '')
+        await update.message.reply_text(t(user_id, 'symbol_ambiguous', symbol=symbol, ids=ids))
+        return
+    
+    message = t(user_id, key, symbol=symbol)
+    suggestions = coin_index.suggest(text)
+    if suggestions:
+        message += t(user_id, 'symbol_suggest', suggestions=', '.join(suggestions))
+    await update.message.reply_text(message)
+
+
+async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Get current price of a cryptocurrency"""
+    user_id = update.effective_user.id
+    
+    if not context.args:
+        await update.message.reply_text(t(user_id, 'price_usage'))
+        return
+    
+    symbol = resolve_symbol(context.args[0])
+    if symbol is None:
+        await reply_unknown_symbol(update, user_id, context.args[0], 'price_not_found')
+        return
+    
+    price_data = await get_crypto_price(symbol)
+    
+    if price_data:
+        await update.message.reply_text(format_price_message(user_id, price_data), parse_mode='Markdown')
+    elif upstream_breaker.is_open():
+        await update.message.reply_text(t(user_id, 'price_unavailable'))
+    else:
+        await update.message.reply_text(t(user_id, 'price_not_found', symbol=symbol))
+
+
+async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Set a price alert"""
+    user_id = update.effective_user.id
+    
+    if len(context.args) < 3:
+        await update.message.reply_text(t(user_id, 'alert_usage'))
+        return
+    
+    symbol = resolve_symbol(context.args[0])
+    try:
+        target_price = float(context.args[1])
+    except ValueError:
+        await update.message.reply_text(t(user_id, 'alert_invalid_price'))
+        return
+    
+    direction = context.args[2].lower()
+    # Support both English and Russian direction words
+    if direction in ['выше', 'higher']:
+        direction = 'above'
+    elif direction in ['ниже', 'lower']:
+        direction = 'below'
+    
+    if direction not in ['above', 'below']:
+        await update.message.reply_text(t(user_id, 'alert_invalid_direction'))
+        return
+    
+    repeat = len(context.args) > 3 and context.args[3].lower() in ['repeat', 'повтор']
+    if len(context.args) > 3 and not repeat:
+        await update.message.reply_text(t(user_id, 'alert_usage'))
+        return
+    
+    if symbol is None:
+        await reply_unknown_symbol(update, user_id, context.args[0], 'alert_unsupported')
+        return
+    
+    # The price is in the user's currency; thresholds are stored in USD so evaluation never converts
+    currency = get_user_currency(user_id)
+    if currency == 'usd':
+        add_alert(user_id, symbol, target_price, direction, repeat)
+    elif currency in fx_rates:
+        add_alert(user_id, symbol, target_price / fx_rates[currency], direction, repeat, (currency, target_price))
+    else:
+        await update.message.reply_text(t(user_id, 'fx_unavailable'))
+        return
+    
+    # Translate direction for display
+    direction_text = t(user_id, direction)
+    text = t(user_id, 'alert_set', symbol=symbol, direction=direction_text,
+             price=format_money(target_price, currency))
+    if repeat:
+        text += t(user_id, 'alert_repeat', band=ALERT_HYSTERESIS_PCT)
+    await update.message.reply_text(text)
+
+
+async def move_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Set a percent-move alert"""
+    user_id = update.effective_user.id
+    
+    if len(context.args) < 2:
+        await update.message.reply_text(t(user_id, 'move_usage'))
+        return
+    
+    symbol = resolve_symbol(context.args[0])
+    # Windows shorter than two history buckets could not tell a move from a single sample
+    min_minutes = max(1, math.ceil(2 * HISTORY_RESOLUTION / 60))
+    max_minutes = int(HISTORY_CAPACITY * HISTORY_RESOLUTION // 60)
+    try:
+        percent = float(context.args[1].rstrip('%'))
+        minutes = int(context.args[2]) if len(context.args) > 2 else 60
+    except ValueError:
+        await update.message.reply_text(t(user_id, 'move_usage'))
+        return
+    
+    if not 0 < percent < math.inf or not min_minutes <= minutes <= max_minutes:
+        await update.message.reply_text(
+            t(user_id, 'move_invalid', min_minutes=min_minutes, max_minutes=max_minutes)
+        )
+        return
+    
+    if symbol is None:
+        await reply_unknown_symbol(update, user_id, context.args[0], 'alert_unsupported')
+        return
+    
+    add_move_alert(user_id, symbol, percent, minutes * 60)
+    await update.message.reply_text(t(user_id, 'move_set', symbol=symbol, percent=percent, minutes=minutes))
+
+
+async def list_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List all active alerts for the user"""
+    user_id = update.effective_user.id
+    
+    user_alert_list = alert_store.alerts_of(user_id)
+    moves_by_symbol = {}
+    for symbol, percent, window in user_move_alerts.get(user_id, ()):
+        moves_by_symbol.setdefault(symbol, []).append((percent, window))
+    if not user_alert_list and not moves_by_symbol:
+        await update.message.reply_text(t(user_id, 'list_empty'))
+        return
+    
+    renderer = renderer_for(user_id)
+    lines = [renderer.static['list_header']]
+    
+    symbols = list(user_alert_list) + [symbol for symbol in moves_by_symbol if symbol not in user_alert_list]
+    for symbol in symbols:
+        lines.append(f"**{symbol}:**\n")
+        for price, direction in user_alert_list.get(symbol, ()):
+            arrow = "⬆️" if direction == "above" else "⬇️"
+            key = (user_id, symbol, price, direction)
+            repeat = " 🔁" if key in repeat_alerts else ""
+            quote = alert_quotes.get(key)
+            amount = format_money(quote[1], quote[0]) if quote else format_money(price, 'usd')
+            lines.append(f"  {arrow} {amount} ({renderer.direction[direction]}){repeat}\n")
+        for percent, window in moves_by_symbol.get(symbol, ()):
+            lines.append(renderer.render('move_entry', percent=percent, minutes=window // 60))
+        lines.append("\n")
+    
+    await update.message.reply_text(''.join(lines), parse_mode='Markdown')
+
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Add a cryptocurrency to watchlist"""
+    user_id = update.effective_user.id
+    
+    if not context.args:
+        await update.message.reply_text(t(user_id, 'watch_usage'))
+        return
+    
+    symbol = resolve_symbol(context.args[0])
+    
+    if symbol is None:
+        await reply_unknown_symbol(update, user_id, context.args[0], 'watch_unsupported')
+        return
+    
+    if not add_to_watchlist(user_id, symbol):
+        await update.message.reply_text(t(user_id, 'watch_exists', symbol=symbol))
+        return
+    
+    await update.message.reply_text(t(user_id, 'watch_added', symbol=symbol))
+
+
+def format_watchlist(user_id: int, symbols: List[str], prices: Dict[str, Dict]) -> Tuple[str, float]:
+    """Watchlist lines for the coins with a known price, and the age of the oldest price shown"""
+    currency, rate = quote_currency(user_id)
+    lines = []
+    oldest = 0.0
+    for symbol in symbols:
+        price_data = prices.get(symbol)
+        if price_data:
+            oldest = max(oldest, price_data['age'])
+            change_emoji = "📈" if price_data['change_24h'] >= 0 else "📉"
+            change_sign = "+" if price_data['change_24h'] >= 0 else ""
+            lines.append(
+                f"**{symbol}:** {format_money(price_data['price'] * rate, currency)} "
+                f"{change_emoji} {change_sign}{price_data['change_24h']:.2f}%\n"
+            )
+    return ''.join(lines), oldest
+
+
+async def watchlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show user's watchlist with current prices"""
+    user_id = update.effective_user.id
+    
+    if user_id not in user_watchlists or not user_watchlists[user_id]:
+        await update.message.reply_text(t(user_id, 'watchlist_empty'))
+        return
+    
+    message = t(user_id, 'watchlist_header')
+    prices = await get_crypto_prices(user_watchlists[user_id], stale_ok=True)
+    lines, oldest = format_watchlist(user_id, user_watchlists[user_id], prices)
+    message += lines
+    if oldest > price_cache.ttl:
+        message += t(user_id, 'price_stale', minutes=max(1, round(oldest / 60)))
+    elif len(prices) < len(user_watchlists[user_id]) and upstream_breaker.is_open():
+        message += '\n' + t(user_id, 'price_unavailable')
+    
+    await update.message.reply_text(message, parse_mode='Markdown')
+
+
+class LiveDashboards:
+    """Pinned live watchlists, re-rendered from the price snapshot and edited only when their text changes"""
+    
+    # Consecutive failed edits after which a dashboard is dropped (usually the user deleted the message)
+    MAX_FAILURES = 3
+    
+    def __init__(self, max_edits: int):
+        self.max_edits = max(1, max_edits)
+        # user_id -> (chat_id, message_id) of the pinned dashboard
+        self.messages: Dict[int, Tuple[int, int]] = {}
+        # user_id -> hash of the text the dashboard shows; unknown after a restart, so the first refresh edits
+        self._shown: Dict[int, int] = {}
+        # Dashboards with an edit in the dispatcher; they are not rendered again until it settles
+        self._editing: Set[int] = set()
+        self._failures: Dict[int, int] = {}
+        # Where the next refresh starts, so dashboards over the edit limit are not starved
+        self._cursor = 0
+        self.refreshes = 0
+        self.edits = 0
+        self.unchanged = 0
+        self.deferred = 0
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    def render(self, user_id: int, prices: Dict[str, Dict]) -> str:
+        """The dashboard text for the user's watchlist and these prices"""
+        lines, oldest = format_watchlist(user_id, user_watchlists.get(user_id) or [], prices)
+        text = t(user_id, 'live_header') + (lines or t(user_id, 'watchlist_empty') + '\n')
+        if oldest > price_cache.ttl:
+            text += t(user_id, 'price_stale', minutes=max(1, round(oldest / 60)))
+        return text + t(user_id, 'live_footer', seconds=round(LIVE_REFRESH_INTERVAL))
+    
+    def snapshot_prices(self, symbols) -> Dict[str, Dict]:
+        """Price dicts for the symbols the snapshot knows; missing and expired ones are fetched for the next refresh"""
+        now = time.monotonic()
+        prices = {}
+        refresh = []
+        for symbol in symbols:
+            crypto_id = coin_id(symbol)
+            if crypto_id is None:
+                continue
+            cached = price_cache.snapshot(crypto_id)
+            if cached is None or now - cached[0] >= price_cache.ttl:
+                refresh.append(crypto_id)
+            if cached is not None:
+                prices[symbol] = price_data_from(symbol, cached[1], now - cached[0])
+        if refresh:
+            # One batched fetch for every dashboard, however many users watch the coin
+            price_cache.prefetch(refresh, fetch_prices)
+        return prices
+    
+    def add(self, user_id: int, chat_id: int, message_id: int, text: str) -> None:
+        self.messages[user_id] = (chat_id, message_id)
+        self._shown[user_id] = hash(text)
+        self._failures.pop(user_id, None)
+    
+    def remove(self, user_id: int) -> Optional[Tuple[int, int]]:
+        self._shown.pop(user_id, None)
+        self._failures.pop(user_id, None)
+        return self.messages.pop(user_id, None)
+    
+    def refresh(self) -> int:
+        """Queue edits for the dashboards whose text changed, at most max_edits, returning how many were queued"""
+        if not self.messages:
+            return 0
+        self.refreshes += 1
+        symbols = set()
+        for user_id in self.messages:
+            symbols.update(user_watchlists.get(user_id) or ())
+        prices = self.snapshot_prices(symbols)
+        
+        users = list(self.messages)
+        start = self._cursor % len(users)
+        edits = 0
+        for offset in range(len(users)):
+            user_id = users[(start + offset) % len(users)]
+            if user_id in self._editing:
+                continue
+            text = self.render(user_id, prices)
+            digest = hash(text)
+            if self._shown.get(user_id) == digest:
+                self.unchanged += 1
+                continue
+            if edits >= self.max_edits:
+                # This and the remaining dashboards go first in the next refresh
+                self.deferred += len(users) - offset
+                self._cursor = start + offset
+                break
+            chat_id, message_id = self.messages[user_id]
+            self._editing.add(user_id)
+            dispatcher.submit(
+                chat_id,
+                text,
+                parse_mode='Markdown',
+                message_id=message_id,
+                on_sent=partial(self._edited, user_id, message_id, digest),
+                on_failed=partial(self._edit_failed, user_id, message_id)
+            )
+            edits += 1
+        self.edits += edits
+        return edits
+    
+    def _edited(self, user_id: int, message_id: int, digest: int) -> None:
+        self._editing.discard(user_id)
+        if self.messages.get(user_id, (0, None))[1] == message_id:
+            self._shown[user_id] = digest
+            self._failures.pop(user_id, None)
+    
+    def _edit_failed(self, user_id: int, message_id: int) -> None:
+        self._editing.discard(user_id)
+        if self.messages.get(user_id, (0, None))[1] != message_id:
+            return
+        self._failures[user_id] = self._failures.get(user_id, 0) + 1
+        if self._failures[user_id] >= self.MAX_FAILURES:
+            logger.info(f"Dropping live watchlist of {user_id} after {self.MAX_FAILURES} failed edits")
+            stop_live_dashboard(user_id)
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'dashboards': len(self.messages),
+            'refreshes': self.refreshes,
+            'edits': self.edits,
+            'unchanged': self.unchanged,
+            'deferred': self.deferred
+        }
+
+
+# Pinned live watchlists, refreshed by refresh_live_dashboards
+live_dashboards = LiveDashboards(LIVE_MAX_EDITS)
+
+
+def start_live_dashboard(user_id: int, chat_id: int, message_id: int, text: str) -> Optional[Tuple[int, int]]:
+    """Register a dashboard message, returning the (chat_id, message_id) it replaces"""
+    previous = live_dashboards.remove(user_id)
+    live_dashboards.add(user_id, chat_id, message_id, text)
+    state_store.queue(
+        'INSERT OR REPLACE INTO live_dashboards (user_id, chat_id, message_id) VALUES (?, ?, ?)',
+        (user_id, chat_id, message_id)
+    )
+    return previous
+
+
+def stop_live_dashboard(user_id: int) -> Optional[Tuple[int, int]]:
+    """Forget the user's dashboard, returning its (chat_id, message_id) if there was one"""
+    previous = live_dashboards.remove(user_id)
+    if previous is not None:
+        state_store.queue('DELETE FROM live_dashboards WHERE user_id = ?', (user_id,))
+    return previous
+
+
+async def unpin_quietly(bot, chat_id: int, message_id: int) -> None:
+    """Unpin a dashboard, ignoring chats where it is already gone or the bot may not pin"""
+    try:
+        await bot.unpin_chat_message(chat_id=chat_id, message_id=message_id)
+    except (BadRequest, Forbidden) as e:
+        logger.debug(f"Could not unpin {message_id} in {chat_id}: {e}")
+
+
+async def live_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Start (or with "off" stop) a pinned watchlist that the bot keeps up to date"""
+    user_id = update.effective_user.id
+    
+    if context.args and context.args[0].lower() in ['off', 'stop', 'стоп']:
+        previous = stop_live_dashboard(user_id)
+        if previous is None:
+            await update.message.reply_text(t(user_id, 'live_not_running'))
+            return
+        await unpin_quietly(context.bot, *previous)
+        await update.message.reply_text(t(user_id, 'live_stopped'))
+        return
+    
+    if not user_watchlists.get(user_id):
+        await update.message.reply_text(t(user_id, 'watchlist_empty'))
+        return
+    
+    # Prices are fetched once here; afterwards the dashboard only reads the shared snapshot
+    await get_crypto_prices(user_watchlists[user_id], stale_ok=True)
+    text = live_dashboards.render(user_id, live_dashboards.snapshot_prices(user_watchlists[user_id]))
+    message = await update.message.reply_text(text, parse_mode='Markdown')
+    previous = start_live_dashboard(user_id, message.chat_id, message.message_id, text)
+    if previous is not None:
+        await unpin_quietly(context.bot, *previous)
+    try:
+        await context.bot.pin_chat_message(chat_id=message.chat_id, message_id=message.message_id,
+                                           disable_notification=True)
+    except (BadRequest, Forbidden) as e:
+        # Groups may not let the bot pin; the dashboard still updates in place
+        logger.debug(f"Could not pin the live watchlist in {message.chat_id}: {e}")
+
+
+async def refresh_live_dashboards(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Background job editing the live watchlists whose prices changed"""
+    live_dashboards.refresh()
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    """One PNG chunk: length, type, data and CRC"""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def render_chart_png(prices: List[float], width: int = 800, height: int = 400) -> bytes:
+    """Area chart of a price series as PNG bytes, drawn without an imaging library (runs in the chart workers)"""
+    pad = 12
+    rising = prices[-1] >= prices[0]
+    line = bytes((22, 163, 74) if rising else (220, 38, 38))
+    fill = bytes((220, 252, 231) if rising else (254, 226, 226))
+    rows = [bytearray(b'\xff' * (3 * width)) for _ in range(height)]
+    top, bottom = pad, height - pad - 1
+    
+    # Five evenly spaced grid lines from the high to the low
+    for n in range(5):
+        rows[top + (bottom - top) * n // 4][3 * pad:3 * (width - pad)] = bytes((229, 231, 235)) * (width - 2 * pad)
+    
+    if len(prices) < 2:
+        prices = list(prices) * 2
+    low, high = min(prices), max(prices)
+    if high == low:
+        # A flat series is drawn across the middle
+        low, high = low - 1, high + 1
+    scale = (bottom - top) / (high - low)
+    last = len(prices) - 1
+    plot = width - 2 * pad
+    previous = None
+    for x in range(plot):
+        # Price at this column, interpolated between the two nearest points of the series
+        position = x * last / (plot - 1)
+        i = min(int(position), last - 1)
+        price = prices[i] + (prices[i + 1] - prices[i]) * (position - i)
+        y = top + round((high - price) * scale)
+        column = 3 * (pad + x)
+        for row in rows[y:bottom + 1]:
+            row[column:column + 3] = fill
+        # The line is 3 px thick and joins this column's point to the previous one
+        start, end = (y, y) if previous is None else (min(y, previous), max(y, previous))
+        for row in rows[max(top, start - 1):min(bottom, end + 1) + 1]:
+            row[column:column + 3] = line
+        previous = y
+    
+    raw = b''.join(b'\x00' + bytes(row) for row in rows)
+    return (b'\x89PNG\r\n\x1a\n'
+            + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + png_chunk(b'IDAT', zlib.compress(raw, 6))
+            + png_chunk(b'IEND', b''))
+
+
+class Chart:
+    """A rendered chart: the series figures for captions, the PNG and, once uploaded, its Telegram file_id"""
+    __slots__ = ('first', 'last', 'high', 'low', 'png', 'file_id', 'upload', 'created')
+    
+    def __init__(self, prices: List[float], png: bytes):
+        self.first, self.last = prices[0], prices[-1]
+        self.high, self.low = max(prices), min(prices)
+        self.png = png
+        self.file_id: Optional[str] = None
+        # Resolved when the upload in progress finishes, so other sends can wait for its file_id
+        self.upload: Optional[asyncio.Future] = None
+        self.created = time.monotonic()
+
+
+class ChartCache:
+    """Charts per (symbol, range): one fetch and one render for all concurrent requests, then the file_id reused"""
+    
+    def __init__(self, ttl: float, max_size: int, workers: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.workers = workers
+        self._charts: 'OrderedDict[Tuple[str, str], Chart]' = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.renders = 0
+        self.uploads = 0
+        self.reused = 0
+    
+    def __len__(self) -> int:
+        return len(self._charts)
+    
+    async def get(self, symbol: str, range_key: str) -> Optional[Chart]:
+        """The cached chart, or one fetched and rendered once for every caller asking meanwhile (None on failure)"""
+        self.requests += 1
+        key = (symbol, range_key)
+        chart = self._charts.get(key)
+        if chart is not None and time.monotonic() - chart.created < self.ttl:
+            self._charts.move_to_end(key)
+            self.hits += 1
+            return chart
+        
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        chart = None
+        try:
+            chart = await self._build(symbol, range_key)
+        finally:
+            del self._inflight[key]
+            future.set_result(chart)
+        return chart
+    
+    async def _build(self, symbol: str, range_key: str) -> Optional[Chart]:
+        try:
+            prices = await fetch_market_chart(coin_id(symbol), CHART_RANGES[range_key])
+        except CircuitOpen:
+            return None
+        except UpstreamUnavailable as e:
+            logger.warning(f"Market chart fetch for {symbol} {range_key} failed: {e}")
+            return None
+        self.fetches += 1
+        
+        try:
+            png = await asyncio.get_running_loop().run_in_executor(self._executor(), render_chart_png, prices)
+        except BrokenProcessPool as e:
+            # A crashed worker breaks the whole pool; the next chart starts a new one
+            logger.error(f"Chart worker pool failed: {e}")
+            self._pool = None
+            return None
+        self.renders += 1
+        
+        chart = Chart(prices, png)
+        now = time.monotonic()
+        for key in [key for key, cached in self._charts.items() if now - cached.created >= self.ttl]:
+            del self._charts[key]
+        self._charts[(symbol, range_key)] = chart
+        while len(self._charts) > self.max_size:
+            self._charts.popitem(last=False)
+        return chart
+    
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        """The worker pool, started on first use; None draws in the event loop's default thread pool"""
+        if self._pool is None and self.workers > 0:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+    
+    async def send(self, chart: Chart, send_photo: Callable) -> None:
+        """Send with send_photo(photo), uploading the PNG once and passing its file_id on every later send"""
+        while chart.file_id is None and chart.upload is not None:
+            # Another chat is uploading this chart; its file_id is used as soon as the upload finishes
+            await asyncio.shield(chart.upload)
+        if chart.file_id is not None:
+            try:
+                await send_photo(chart.file_id)
+                self.reused += 1
+                return
+            except BadRequest as e:
+                logger.warning(f"Cached chart file_id was refused, uploading again: {e}")
+                chart.file_id = None
+        
+        chart.upload = asyncio.get_running_loop().create_future()
+        try:
+            message = await send_photo(chart.png)
+            self.uploads += 1
+            if message.photo:
+                chart.file_id = message.photo[-1].file_id
+        finally:
+            chart.upload.set_result(None)
+            chart.upload = None
+    
+    def stop(self) -> None:
+        """Shut the worker pool down"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'charts': len(self._charts),
+            'requests': self.requests,
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'fetches': self.fetches,
+            'renders': self.renders,
+            'uploads': self.uploads,
+            'reused': self.reused
+        }
+
+
+chart_cache = ChartCache(CHART_CACHE_TTL, CHART_CACHE_SIZE, CHART_WORKERS)
+
+
+async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send a price chart of a cryptocurrency over a range"""
+    user_id = update.effective_user.id
+    
+    range_key = context.args[1].lower() if len(context.args) > 1 else '24h'
+    if not context.args or range_key not in CHART_RANGES:
+        await update.message.reply_text(t(user_id, 'chart_usage', ranges=', '.join(CHART_RANGES)))
+        return
+    
+    symbol = resolve_symbol(context.args[0])
+    if symbol is None:
+        await reply_unknown_symbol(update, user_id, context.args[0], 'price_not_found')
+        return
+    
+    chart = await chart_cache.get(symbol, range_key)
+    if chart is None:
+        await update.message.reply_text(t(user_id, 'chart_unavailable', symbol=symbol))
+        return
+    
+    # The image carries no text, so one upload serves every language and currency; the caption is per user
+    currency, rate = quote_currency(user_id)
+    change = (chart.last / chart.first - 1) * 100 if chart.first else 0.0
+    caption = t(user_id, 'chart_caption',
+                symbol=symbol,
+                range=range_key,
+                price=format_money(chart.last * rate, currency),
+                sign='+' if change >= 0 else '',
+                change=change,
+                high=format_money(chart.high * rate, currency),
+                low=format_money(chart.low * rate, currency))
+    await chart_cache.send(chart, partial(update.message.reply_photo, caption=caption))
+
+
+async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Remove all alerts for a cryptocurrency"""
+    user_id = update.effective_user.id
+    
+    if not context.args:
+        await update.message.reply_text(t(user_id, 'remove_usage'))
+        return
+    
+    symbol = resolve_symbol(context.args[0]) or context.args[0].upper()
+    
+    removed = remove_alerts(user_id, symbol)
+    removed = remove_move_alerts(user_id, symbol) or removed
+    if removed:
+        await update.message.reply_text(t(user_id, 'remove_success', symbol=symbol))
+    else:
+        await update.message.reply_text(t(user_id, 'remove_not_found', symbol=symbol))
+    
+    # Also remove from watchlist
+    if remove_from_watchlist(user_id, symbol):
+        await update.message.reply_text(t(user_id, 'remove_watchlist', symbol=symbol))
+
+
+async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Change language preference"""
+    user_id = update.effective_user.id
+    
+    # Create inline keyboard with language options
+    keyboard = [
+        [
+            InlineKeyboardButton("🇬🇧 English", callback_data='lang_en'),
+            InlineKeyboardButton("🇷🇺 Русский", callback_data='lang_ru')
+        ]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    current_lang = get_user_lang(user_id)
+    if current_lang == 'en':
+        text = "Choose your language:\nВыберите язык:"
+    else:
+        text = "Выберите язык:\nChoose your language:"
+    
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+
+async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle language selection from inline keyboard"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = query.from_user.id
+    
+    if query.data == 'lang_en':
+        set_user_language(user_id, 'en')
+        await query.edit_message_text(text=t(user_id, 'lang_changed'))
+    elif query.data == 'lang_ru':
+        set_user_language(user_id, 'ru')
+        await query.edit_message_text(text=t(user_id, 'lang_changed'))
+
+
+async def currency_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Change the quote currency for prices and new alerts"""
+    user_id = update.effective_user.id
+    
+    if context.args:
+        currency = context.args[0].lower()
+        if currency not in CURRENCIES:
+            await update.message.reply_text(
+                t(user_id, 'currency_invalid', currencies=', '.join(c.upper() for c in CURRENCIES))
+            )
+            return
+        set_user_currency(user_id, currency)
+        await update.message.reply_text(t(user_id, 'currency_changed', currency=currency.upper()))
+        return
+    
+    keyboard = [[InlineKeyboardButton(c.upper(), callback_data=f'currency_{c}') for c in CURRENCIES]]
+    await update.message.reply_text(
+        t(user_id, 'currency_choose', currency=get_user_currency(user_id).upper()),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def currency_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle currency selection from inline keyboard"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = query.from_user.id
+    currency = query.data[len('currency_'):]
+    if currency in CURRENCIES:
+        set_user_currency(user_id, currency)
+        await query.edit_message_text(text=t(user_id, 'currency_changed', currency=currency.upper()))
+
+
+class InlinePrices:
+    """Inline query answers built from the price cache snapshot, one memoized article per coin, language, currency and price"""
+    
+    # Telegram shows at most 50 results; a handful is plenty for price lookups
+    MAX_RESULTS = 10
+    
+    def __init__(self, debounce: float, cache_time: int, max_articles: int):
+        self.debounce = debounce
+        self.cache_time = cache_time
+        self.max_articles = max_articles
+        # {(lang, currency, symbol): ((fetched_at, stale minutes, units per USD), article)}
+        self._articles: Dict[Tuple[str, str, str], Tuple[Tuple[float, int, float], InlineQueryResultArticle]] = {}
+        # Latest query per user; the user's timer answers whichever query is latest when it fires
+        self._latest: Dict[int, object] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        # When each user's timer may fire; every keystroke pushes it back by the debounce window
+        self._deadlines: Dict[int, float] = {}
+        self.queries = 0
+        self.answered = 0
+        self.superseded = 0
+        self.rendered = 0
+    
+    def submit(self, query) -> None:
+        """Accept a query; keystrokes arriving within the debounce window replace it unanswered"""
+        self.queries += 1
+        user_id = query.from_user.id
+        if user_id in self._latest:
+            self.superseded += 1
+        self._latest[user_id] = query
+        self._deadlines[user_id] = time.monotonic() + self.debounce
+        if user_id not in self._timers:
+            self._timers[user_id] = asyncio.create_task(self._answer_later(user_id))
+    
+    async def _answer_later(self, user_id: int) -> None:
+        try:
+            # Sleep until the user has paused for a whole window, however long they keep typing
+            delay = self.debounce
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self._deadlines[user_id] - time.monotonic()
+        finally:
+            self._timers.pop(user_id, None)
+            self._deadlines.pop(user_id, None)
+        query = self._latest.pop(user_id, None)
+        if query is None:
+            return
+        results, complete = self.results(user_id, query.query)
+        try:
+            # Answers missing prices that are being fetched must not stick in Telegram's cache
+            await query.answer(results, cache_time=self.cache_time if complete else 0, is_personal=True)
+            self.answered += 1
+        except (BadRequest, NetworkError) as e:
+            # Usually the query expired while the user kept typing
+            logger.debug(f"Could not answer inline query: {e}")
+    
+    def symbols_for(self, user_id: int, text: str) -> List[str]:
+        """Coins to show: exact tickers or ids, else completions of each word, else the user's watchlist"""
+        words = text.split()
+        if not words:
+            return list(user_watchlists.get(user_id) or CRYPTO_IDS)[:self.MAX_RESULTS]
+        symbols = []
+        for word in words[:self.MAX_RESULTS]:
+            symbol = resolve_symbol(word)
+            if symbol is not None:
+                symbols.append(symbol)
+            else:
+                symbols.extend(coin_index.complete(word, self.MAX_RESULTS))
+        return list(dict.fromkeys(symbols))
+    
+    def results(self, user_id: int, text: str) -> Tuple[List[InlineQueryResultArticle], bool]:
+        """Articles for the coins the snapshot knows, and whether none were missing or expired"""
+        # Missing and expired coins are refreshed in the background for the next query
+        now = time.monotonic()
+        results = []
+        refresh = []
+        for symbol in self.symbols_for(user_id, text):
+            crypto_id = coin_id(symbol)
+            if crypto_id is None:
+                continue
+            cached = price_cache.snapshot(crypto_id)
+            if cached is None or now - cached[0] >= price_cache.ttl:
+                refresh.append(crypto_id)
+            if cached is not None and len(results) < self.MAX_RESULTS:
+                results.append(self.article(user_id, symbol, cached[0], cached[1], now))
+        if refresh:
+            # A burst of queries shares one in-flight fetch, and the next keystrokes find the prices cached
+            price_cache.prefetch(refresh[:self.MAX_RESULTS], fetch_prices)
+        return results, not refresh
+    
+    def article(self, user_id: int, symbol: str, fetched_at: float, entry: Dict,
+                now: float) -> InlineQueryResultArticle:
+        """The memoized article for this coin and price in the user's language and currency"""
+        lang = get_user_lang(user_id)
+        currency, rate = quote_currency(user_id)
+        age = now - fetched_at
+        stale = max(1, round(age / 60)) if age > price_cache.ttl else 0
+        version = (fetched_at, stale, rate)
+        memo = self._articles.get((lang, currency, symbol))
+        if memo is not None and memo[0] == version:
+            return memo[1]
+        
+        price_data = price_data_from(symbol, entry, age)
+        description = t(user_id, 'inline_description',
+                        sign='+' if price_data['change_24h'] >= 0 else '',
+                        change=price_data['change_24h'],
+                        market_cap=format_money(price_data['market_cap'] * rate, currency, 0))
+        if stale:
+            description += t(user_id, 'inline_stale', minutes=stale)
+        article = InlineQueryResultArticle(
+            id=symbol[:64],
+            title=f"{symbol} {format_money(price_data['price'] * rate, currency)}",
+            description=description,
+            input_message_content=InputTextMessageContent(format_price_message(user_id, price_data),
+                                                          parse_mode='Markdown')
+        )
+        self.rendered += 1
+        if len(self._articles) >= self.max_articles:
+            self._articles.clear()
+        self._articles[(lang, currency, symbol)] = (version, article)
+        return article
+    
+    async def stop(self) -> None:
+        """Drop queries still waiting for their debounce timer"""
+        timers = list(self._timers.values())
+        for task in timers:
+            task.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
+        self._latest.clear()
+        self._deadlines.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queries': self.queries,
+            'answered': self.answered,
+            'superseded': self.superseded,
+            'rendered': self.rendered
+        }
+
+
+# Inline mode state, shared by every inline query
+inline_prices = InlinePrices(INLINE_DEBOUNCE_MS / 1000, INLINE_CACHE_TIME, 2 * PRICE_CACHE_MAX_SIZE)
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer inline price lookups (@bot BTC) from the price snapshot once the user stops typing"""
+    inline_prices.submit(update.inline_query)
+
+
+def evaluate_alerts(symbol: str, current_price: float, alert_time: Optional[str] = None,
+                    source: str = 'stream') -> int:
+    """Queue notifications for every alert on the symbol fired by this price, returning how many fired"""
+    release_held_alerts(symbol, current_price)
+    index = alert_index.get(symbol)
+    if index is None:
+        return 0
+    ALERTS_EVALUATED.inc(source, amount=len(index))
+    
+    if alert_time is None:
+        alert_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    triggered = index.pop_triggered(current_price)
+    notify_triggered(symbol, current_price, triggered, alert_time)
+    
+    if triggered:
+        ALERTS_TRIGGERED.inc(source, amount=len(triggered))
+    if not index and alert_index.get(symbol) is index:
+        del alert_index[symbol]
+    return len(triggered)
+
+
+def notify_triggered(symbol: str, current_price: float, triggered: List[Tuple[float, int, str]],
+                     alert_time: str) -> None:
+    """Hand every popped (target_price, user_id, direction) alert to its chat's digest"""
+    for target_price, user_id, direction in triggered:
+        renderer = renderer_for(user_id)
+        # Alerts set in another currency are shown in it, with the price converted at the current rate
+        currency, target, current = 'usd', target_price, current_price
+        quote = alert_quotes.get((user_id, symbol, target_price, direction)) if alert_quotes else None
+        if quote is not None and quote[0] in fx_rates:
+            currency, target = quote
+            current = current_price * fx_rates[currency]
+        # The alert stays out of the index while queued and is only dropped once delivered
+        alert_digest.add(
+            user_id,
+            alert_time,
+            partial(notification_cache.render, renderer, symbol, target, direction, current, alert_time, currency),
+            partial(renderer.render, 'digest_alert', arrow='⬆️' if direction == 'above' else '⬇️', symbol=symbol,
+                    current=format_money(current, currency), target=format_money(target, currency),
+                    direction=renderer.direction[direction]),
+            on_sent=partial(alert_delivered, user_id, symbol, target_price, direction),
+            on_failed=partial(rearm_alert, user_id, symbol, target_price, direction)
+        )
+
+
+def evaluate_move_alerts(symbol: str, current_price: float, alert_time: Optional[str] = None,
+                         source: str = 'stream') -> int:
+    """Queue notifications for every percent-move alert on the symbol fired by this price, returning how many fired"""
+    index = move_index.get(symbol)
+    ring = price_history.ring(coin_id(symbol))
+    if index is None or ring is None:
+        return 0
+    ALERTS_EVALUATED.inc(source, amount=len(index))
+    
+    if alert_time is None:
+        alert_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    triggered = index.pop_triggered(current_price, ring, time.time())
+    for percent, window, user_id, change, reference in triggered:
+        renderer = renderer_for(user_id)
+        sign = '+' if change >= 0 else ''
+        currency, rate = quote_currency(user_id)
+        current = format_money(current_price * rate, currency)
+        alert_digest.add(
+            user_id,
+            alert_time,
+            partial(renderer.render, 'move_triggered', symbol=symbol, sign=sign, change=change * 100,
+                    minutes=window // 60, reference=format_money(reference * rate, currency),
+                    current=current, time=alert_time),
+            partial(renderer.render, 'digest_move', symbol=symbol, sign=sign, change=change * 100,
+                    minutes=window // 60, current=current),
+            on_sent=partial(forget_move_alert, user_id, symbol, percent, window),
+            on_failed=partial(rearm_move_alert, user_id, symbol, percent, window)
+        )
+    
+    if triggered:
+        ALERTS_TRIGGERED.inc(source, amount=len(triggered))
+    if not index and move_index.get(symbol) is index:
+        del move_index[symbol]
+    return len(triggered)
+
+
+async def evaluate_prices(prices: Dict[str, float], alert_time: Optional[str] = None,
+                          source: str = 'poll', moves: bool = True) -> int:
+    """Evaluate a {symbol: price} snapshot in-process or on the shard workers, returning how many fired"""
+    if alert_time is None:
+        alert_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # Percent-move alerts are few and always evaluated in-process (the stream does it per tick, so it skips them)
+    moved = sum(
+        evaluate_move_alerts(symbol, price, alert_time, source)
+        for symbol, price in prices.items() if symbol in move_index
+    ) if moves else 0
+    if alert_shards is None:
+        return moved + sum(evaluate_alerts(symbol, price, alert_time, source) for symbol, price in prices.items())
+    
+    for symbol in held_alerts.keys() & prices.keys():
+        release_held_alerts(symbol, prices[symbol])
+    prices = {symbol: price for symbol, price in prices.items() if symbol in alert_index}
+    if not prices:
+        return moved
+    ALERTS_EVALUATED.inc(source, amount=sum(len(alert_index[symbol]) for symbol in prices))
+    triggered = await alert_shards.evaluate(prices)
+    count = 0
+    for symbol, fired in triggered.items():
+        notify_triggered(symbol, prices[symbol], fired, alert_time)
+        count += len(fired)
+    if count:
+        ALERTS_TRIGGERED.inc(source, amount=count)
+    return count + moved
+
+
+def record_tick(job: str, started: float, evaluated: int, triggered: int) -> None:
+    """Export the duration and alert counts of one polling tick"""
+    TICK_DURATION.observe(time.perf_counter() - started, job)
+    LAST_TICK_ALERTS.set(evaluated, 'evaluated')
+    LAST_TICK_ALERTS.set(triggered, 'triggered')
+
+
+async def check_alerts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Background task to check all alerts"""
+    started = time.perf_counter()
+    # Symbols kept current by the streaming feed don't need polling
+    symbols = [
+        symbol for symbol in alert_symbols()
+        if not (price_stream is not None and price_stream.is_fresh(symbol))
+    ]
+    if not symbols:
+        return
+    
+    # Fetch every watched symbol once, then look up fired alerts in each symbol's index
+    prices = await get_crypto_prices(symbols)
+    snapshot = {symbol: data['price'] for symbol, data in prices.items() if data}
+    if len(snapshot) < len(symbols):
+        logger.warning(f"No price for {len(symbols) - len(snapshot)} of {len(symbols)} symbols, "
+                       f"their alerts wait for the next check")
+    evaluated = sum(len(alert_index.get(symbol, ())) + len(move_index.get(symbol, ())) for symbol in snapshot)
+    triggered = await evaluate_prices(snapshot, source='poll')
+    
+    record_tick('check_alerts', started, evaluated, triggered)
+
+
+class PollScheduler:
+    """Per-symbol poll deadlines in a heap; a symbol is polled sooner the closer and more volatile it is"""
+    
+    # Assumed volatility (stddev of log price per sqrt(second), ~3% an hour) until a symbol has history
+    DEFAULT_VOLATILITY = 0.0005
+    # How many standard deviations of movement an interval may allow before reaching a threshold
+    SAFETY_SIGMAS = 3.0
+    
+    def __init__(self, min_interval: float, max_interval: float):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # (deadline, symbol) entries; superseded ones are skipped lazily on pop
+        self._heap: List[Tuple[float, str]] = []
+        self.deadlines: Dict[str, float] = {}
+        # {symbol: (monotonic time, price)} of the last observation
+        self.last_seen: Dict[str, Tuple[float, float]] = {}
+        # {symbol: EWMA of squared log return per second}
+        self.variance: Dict[str, float] = {}
+    
+    def schedule(self, symbol: str, deadline: float) -> None:
+        """Set the symbol's next poll time, replacing any earlier schedule"""
+        self.deadlines[symbol] = deadline
+        heapq.heappush(self._heap, (deadline, symbol))
+    
+    def observe(self, symbol: str, price: float, now: float) -> None:
+        """Record a price and update the symbol's volatility estimate"""
+        previous = self.last_seen.get(symbol)
+        self.last_seen[symbol] = (now, price)
+        if previous is None or previous[1] <= 0 or price <= 0 or now <= previous[0]:
+            return
+        log_return = math.log(price / previous[1])
+        sample = log_return * log_return / (now - previous[0])
+        old = self.variance.get(symbol)
+        self.variance[symbol] = sample if old is None else 0.8 * old + 0.2 * sample
+    
+    def interval_for(self, symbol: str, distance: float) -> float:
+        """Seconds until the price could plausibly move `distance` (relative) given its volatility"""
+        if distance == math.inf:
+            return self.max_interval
+        variance = self.variance.get(symbol)
+        sigma = math.sqrt(variance) if variance else self.DEFAULT_VOLATILITY
+        interval = (max(distance, 0.0) / (self.SAFETY_SIGMAS * sigma)) ** 2
+        return min(self.max_interval, max(self.min_interval, interval))
+    
+    def reschedule(self, symbol: str, now: float) -> None:
+        """Schedule the next poll from the symbol's last price and nearest armed threshold or move"""
+        index = alert_index.get(symbol)
+        moves = move_index.get(symbol)
+        seen = self.last_seen.get(symbol)
+        if (index is None and moves is None) or seen is None:
+            self.schedule(symbol, now + self.min_interval)
+            return
+        distance = index.nearest_distance(seen[1]) if index is not None else math.inf
+        interval = math.inf
+        if moves is not None:
+            ring = price_history.ring(coin_id(symbol))
+            distance = min(distance, moves.nearest_distance(seen[1], ring, time.time()))
+            # Move windows need samples spread across them even when nothing is close to firing
+            interval = max(self.min_interval, moves.sampling_interval())
+        self.schedule(symbol, now + min(interval, self.interval_for(symbol, distance)))
+    
+    def expedite(self, symbol: str, deadline: float) -> None:
+        """Pull the next poll forward to deadline if it is scheduled later"""
+        if deadline < self.deadlines.get(symbol, math.inf):
+            self.schedule(symbol, deadline)
+    
+    def threshold_added(self, symbol: str, target_price: float) -> None:
+        """Pull the next poll forward if a new threshold is closer than the current schedule allows"""
+        now = time.monotonic()
+        seen = self.last_seen.get(symbol)
+        if seen is None:
+            deadline = now
+        else:
+            deadline = now + self.interval_for(symbol, abs(target_price - seen[1]) / seen[1])
+        self.expedite(symbol, deadline)
+    
+    def next_deadline(self) -> float:
+        while self._heap and self.deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else math.inf
+    
+    def pop_due(self, now: float, horizon: float) -> List[str]:
+        """Remove and return symbols due by now, plus those due within `horizon` that can share the request"""
+        due = []
+        while self._heap and self._heap[0][0] <= now + horizon:
+            deadline, symbol = heapq.heappop(self._heap)
+            if self.deadlines.get(symbol) != deadline:
+                continue
+            del self.deadlines[symbol]
+            if has_alerts(symbol):
+                due.append(symbol)
+            else:
+                self.last_seen.pop(symbol, None)
+                self.variance.pop(symbol, None)
+        return due
+
+
+# Adaptive polling state, driven by adaptive_poll
+poll_scheduler = PollScheduler(POLL_MIN_INTERVAL, POLL_MAX_INTERVAL)
+
+
+async def adaptive_poll(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Poll the symbols whose deadlines have passed, in one batched request, within the upstream budget"""
+    now = time.monotonic()
+    for symbol in alert_symbols():
+        if symbol not in poll_scheduler.deadlines:
+            poll_scheduler.schedule(symbol, now)
+    
+    # While the circuit breaker is open due symbols simply stay due
+    if poll_scheduler.next_deadline() > now or not upstream_budget.available() or upstream_breaker.is_open():
+        return
+    
+    symbols = []
+    for symbol in poll_scheduler.pop_due(now, poll_scheduler.min_interval):
+        if price_stream is not None and price_stream.is_fresh(symbol):
+            # The stream is evaluating this symbol; check back once it could have gone stale
+            poll_scheduler.schedule(symbol, now + price_stream.stale_after)
+        else:
+            symbols.append(symbol)
+    if not symbols:
+        return
+    
+    started = time.perf_counter()
+    prices = await get_crypto_prices(symbols, max_age=0)
+    now = time.monotonic()
+    snapshot = {symbol: data['price'] for symbol, data in prices.items() if data}
+    for symbol, price in snapshot.items():
+        poll_scheduler.observe(symbol, price, now)
+    evaluated = sum(len(alert_index.get(symbol, ())) + len(move_index.get(symbol, ())) for symbol in snapshot)
+    triggered = await evaluate_prices(snapshot, source='poll')
+    
+    for symbol in symbols:
+        if not has_alerts(symbol):
+            continue
+        if symbol in snapshot:
+            poll_scheduler.reschedule(symbol, now)
+        else:
+            # No price this time: retry soon instead of waiting out an interval based on old data
+            poll_scheduler.schedule(symbol, now + poll_scheduler.min_interval)
+    if len(snapshot) < len(symbols):
+        logger.warning(f"No price for {len(symbols) - len(snapshot)} of {len(symbols)} polled symbols")
+    
+    record_tick('adaptive_poll', started, evaluated, triggered)
+
+
+class PriceFeed:
+    """Streaming price feed adapter: subscription messages and update parsing for one provider"""
+    
+    default_url = ''
+    
+    def __init__(self, url: str = ''):
+        self.url = url or self.default_url
+    
+    def supports(self, symbol: str) -> bool:
+        """Whether the provider streams this symbol"""
+        return True
+    
+    def subscribe_message(self, symbols: List[str]) -> Optional[Dict]:
+        raise NotImplementedError
+    
+    def unsubscribe_message(self, symbols: List[str]) -> Optional[Dict]:
+        raise NotImplementedError
+    
+    def parse(self, message) -> List[Tuple[str, float]]:
+        """Extract (symbol, USD price) updates from one decoded message"""
+        raise NotImplementedError
+
+
+class BinanceFeed(PriceFeed):
+    """Binance mini-ticker stream, using USDT pairs as the USD price"""
+    
+    default_url = 'wss://stream.binance.com:9443/ws'
+    
+    def __init__(self, url: str = ''):
+        super().__init__(url)
+        self._request_id = 0
+    
+    def supports(self, symbol: str) -> bool:
+        # Coins keyed by CoinGecko id have an ambiguous ticker, so a Binance pair can't be trusted for them
+        return symbol != 'USDT' and symbol.isupper()
+    
+    def _message(self, method: str, symbols: List[str]) -> Dict:
+        self._request_id += 1
+        return {
+            'method': method,
+            'params': [f"{symbol.lower()}usdt@miniTicker" for symbol in symbols],
+            'id': self._request_id
+        }
+    
+    def subscribe_message(self, symbols: List[str]) -> Optional[Dict]:
+        return self._message('SUBSCRIBE', symbols)
+    
+    def unsubscribe_message(self, symbols: List[str]) -> Optional[Dict]:
+        return self._message('UNSUBSCRIBE', symbols)
+    
+    def parse(self, message) -> List[Tuple[str, float]]:
+        if not isinstance(message, dict) or message.get('e') != '24hrMiniTicker':
+            return []
+        pair = message.get('s', '')
+        if not pair.endswith('USDT'):
+            return []
+        return [(pair[:-4], float(message['c']))]
+
+
+class JsonFeed(PriceFeed):
+    """Minimal JSON protocol spoken by tools/fake_price_feed.py"""
+    
+    default_url = 'ws://127.0.0.1:8765/ws'
+    
+    def subscribe_message(self, symbols: List[str]) -> Optional[Dict]:
+        return {'op': 'subscribe', 'symbols': symbols}
+    
+    def unsubscribe_message(self, symbols: List[str]) -> Optional[Dict]:
+        return {'op': 'unsubscribe', 'symbols': symbols}
+    
+    def parse(self, message) -> List[Tuple[str, float]]:
+        if isinstance(message, dict):
+            message = [message]
+        if not isinstance(message, list):
+            return []
+        # Symbols come back exactly as subscribed: tickers are upper-case, CoinGecko id keys lower-case
+        return [
+            (str(tick['symbol']), float(tick['price']))
+            for tick in message
+            if isinstance(tick, dict) and 'symbol' in tick and 'price' in tick
+        ]
+
+
+# Available streaming feed adapters, selected with PRICE_FEED
+PRICE_FEEDS = {
+    'binance': BinanceFeed,
+    'json': JsonFeed
+}
+
+
+class PriceStream:
+    """Long-lived WebSocket consumer that evaluates alerts on every streamed price update"""
+    
+    def __init__(self, feed: PriceFeed, stale_after: float):
+        self.feed = feed
+        self.stale_after = stale_after
+        self.connected = False
+        self.subscribed = set()
+        # {symbol: monotonic time of the last streamed update}
+        self.last_update: Dict[str, float] = {}
+        self.updates = 0
+        self._task: Optional[asyncio.Task] = None
+        # Latest streamed prices waiting for the shard workers, evaluated together
+        self._pending: Dict[str, float] = {}
+        self._evaluating: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start consuming in the background"""
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Disconnect and stop consuming"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._evaluating is not None:
+            await asyncio.gather(self._evaluating, return_exceptions=True)
+            self._evaluating = None
+    
+    def is_fresh(self, symbol: str) -> bool:
+        """True while the stream is up and has recently delivered a price for the symbol"""
+        return self.connected and time.monotonic() - self.last_update.get(symbol, -math.inf) < self.stale_after
+    
+    async def _sync_subscriptions(self, ws) -> None:
+        wanted = {symbol for symbol in alert_symbols() if self.feed.supports(symbol)}
+        added = sorted(wanted - self.subscribed)
+        removed = sorted(self.subscribed - wanted)
+        if added:
+            await ws.send_json(self.feed.subscribe_message(added))
+        if removed:
+            await ws.send_json(self.feed.unsubscribe_message(removed))
+            for symbol in removed:
+                self.last_update.pop(symbol, None)
+        self.subscribed = wanted
+    
+    def _handle(self, data: str) -> None:
+        try:
+            updates = self.feed.parse(json.loads(data))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed price feed message: {e}")
+            return
+        
+        now = time.monotonic()
+        for symbol, price in updates:
+            self.last_update[symbol] = now
+            self.updates += 1
+            crypto_id = coin_id(symbol)
+            if crypto_id:
+                price_cache.update_price(crypto_id, price)
+                price_history.record(crypto_id, price, time.time())
+                evaluate_move_alerts(symbol, price)
+            if alert_shards is None:
+                evaluate_alerts(symbol, price)
+            else:
+                self._pending[symbol] = price
+        
+        if self._pending and (self._evaluating is None or self._evaluating.done()):
+            self._evaluating = asyncio.create_task(self._evaluate_pending())
+    
+    async def _evaluate_pending(self) -> None:
+        """Send streamed prices to the shard workers; ticks arriving meanwhile coalesce into the next round"""
+        while self._pending:
+            prices, self._pending = self._pending, {}
+            try:
+                # Move alerts already saw every tick in _handle
+                await evaluate_prices(prices, source='stream', moves=False)
+            except Exception as e:
+                logger.error(f"Error evaluating streamed prices: {e}")
+    
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with get_http_session().ws_connect(self.feed.url, heartbeat=30) as ws:
+                    logger.info(f"Price feed connected to {self.feed.url}")
+                    self.connected = True
+                    backoff = 1.0
+                    await self._sync_subscriptions(ws)
+                    synced_at = time.monotonic()
+                    while True:
+                        try:
+                            msg = await ws.receive(timeout=1)
+                        except asyncio.TimeoutError:
+                            msg = None
+                        if msg is not None:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._handle(msg.data)
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.CLOSING,
+                                              aiohttp.WSMsgType.ERROR):
+                                break
+                        # Follow alerts being added and removed, at most once a second
+                        if time.monotonic() - synced_at >= 1:
+                            await self._sync_subscriptions(ws)
+                            synced_at = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Price feed error: {e}")
+            finally:
+                self.connected = False
+                self.subscribed = set()
+            
+            logger.warning(f"Price feed disconnected, polling takes over; reconnecting in {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+# Streaming consumer, created in post_init when PRICE_FEED is set
+price_stream: Optional[PriceStream] = None
+
+metrics.register(Gauge(
+    'crypto_bot_store_size', 'Entries in the in-memory stores', ('store',),
+    callback=lambda: {
+        ('alert_users',): alert_store.user_count,
+        ('alerts',): sum(len(index) for index in alert_index.values()),
+        ('held_alerts',): sum(len(held) for held in held_alerts.values()),
+        ('move_alerts',): sum(len(index) for index in move_index.values()),
+        ('price_history_coins',): len(price_history),
+        ('watchlists',): len(user_watchlists),
+        ('live_dashboards',): len(live_dashboards),
+        ('charts',): len(chart_cache),
+        ('languages',): len(user_languages)
+    }))
+metrics.register(Gauge(
+    'crypto_bot_price_cache', 'Price cache size and lookup counters', ('stat',),
+    callback=lambda: {(key,): value for key, value in price_cache.stats().items()}))
+metrics.register(Gauge(
+    'crypto_bot_inline_queries', 'Inline queries received, answered, superseded while typing and articles rendered',
+    ('stat',), callback=lambda: {(key,): value for key, value in inline_prices.stats().items()}))
+metrics.register(Gauge(
+    'crypto_bot_alert_digest', 'Alerts fired, notifications sent for them (digests among them) and alerts pending',
+    ('stat',), callback=lambda: {(key,): value for key, value in alert_digest.stats().items()}))
+metrics.register(Gauge(
+    'crypto_bot_live_dashboards', 'Live watchlists, their refreshes, edits sent and renders skipped as unchanged or deferred',
+    ('stat',), callback=lambda: {(key,): value for key, value in live_dashboards.stats().items()}))
+metrics.register(Gauge(
+    'crypto_bot_charts', 'Chart requests, cache hits, requests joining a build in progress, fetches, renders and uploads',
+    ('stat',), callback=lambda: {(key,): value for key, value in chart_cache.stats().items()}))
+metrics.register(Gauge(
+    'crypto_bot_upstream_circuit_open', 'Whether the CoinGecko circuit breaker is refusing requests',
+    callback=lambda: int(upstream_breaker.is_open())))
+metrics.register(Gauge(
+    'crypto_bot_upstream_circuit_opened', 'Times the CoinGecko circuit breaker has opened',
+    callback=lambda: upstream_breaker.opened))
+metrics.register(Gauge(
+    'crypto_bot_outbound_queue_depth', 'Notifications accepted but not yet delivered',
+    callback=lambda: dispatcher.depth()))
+metrics.register(Gauge(
+    'crypto_bot_price_stream_connected', 'Whether the streaming price feed is connected',
+    callback=lambda: int(price_stream is not None and price_stream.connected)))
+
+# Background tasks and servers owned by post_init
+metrics_runner: Optional[web.AppRunner] = None
+loop_lag_task: Optional[asyncio.Task] = None
+
+
+async def log_runtime_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Periodically log runtime statistics"""
+    cache = price_cache.stats()
+    logger.info(
+        f"Price cache: size={cache['size']} hits={cache['hits']} "
+        f"misses={cache['misses']} coalesced={cache['coalesced']} stale={cache['stale']} "
+        f"upstream={upstream_breaker.state}"
+    )
+    notify = dispatcher.stats()
+    logger.info(
+        f"Notifications: queued={notify['depth']} sent={notify['sent']} failed={notify['failed']} "
+        f"retried={notify['retried']} send_p50={notify['send_p50']:.3f}s "
+        f"send_p99={notify['send_p99']:.3f}s delivery_p99={notify['delivery_p99']:.3f}s"
+    )
+
+
+async def save_price_history(context: Optional[ContextTypes.DEFAULT_TYPE] = None) -> None:
+    """Write the price history snapshot, serialized on the event loop and written off it"""
+    try:
+        await asyncio.to_thread(price_history.save, HISTORY_SNAPSHOT_PATH, price_history.dump())
+    except OSError as e:
+        logger.error(f"Could not write price history snapshot: {e}")
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in arrival order"""
+    
+    # PTB's own limit only bounds how many updates may wait here; the real limit is our semaphore, which an
+    # update takes once its user's earlier updates are done, so one busy user never holds idle slots
+    MAX_WAITING_UPDATES = 100000
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max(max_concurrent_updates, self.MAX_WAITING_UPDATES))
+        self.limit = max_concurrent_updates
+        self._slots: Optional[asyncio.Semaphore] = None
+        # {user or chat id: (lock, number of updates holding or waiting for it)}
+        self._locks: Dict[int, list] = {}
+    
+    @staticmethod
+    def order_key(update: object) -> Optional[int]:
+        """The id whose updates must not overtake each other"""
+        # Inline queries change no state and are debounced, so they never wait behind a user's commands
+        if isinstance(update, Update) and update.inline_query is None:
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        """Wait for the user's earlier updates first and only then for a free slot"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        key = self.order_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock is FIFO and updates reach this point in arrival order
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+    
+    async def initialize(self) -> None:
+        # Created inside the running loop, which older Pythons bind asyncio primitives to
+        self._slots = asyncio.Semaphore(self.limit)
+    
+    async def shutdown(self) -> None:
+        pass
+
+
+class WebhookServer:
+    """Embedded aiohttp server receiving Telegram updates and handing them to the Application"""
+    
+    def __init__(self, application: Application, host: str, port: int, path: str, secret: str = ''):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.draining = False
+        self.received = 0
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.draining:
+            # Telegram retries undelivered updates, so refusing during shutdown loses nothing
+            return web.Response(status=503)
+        if self.secret and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret:
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Rejecting malformed webhook update: {e}")
+            return web.Response(status=400)
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+    
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text='draining' if self.draining else 'ok', status=503 if self.draining else 200)
+    
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+    
+    async def stop(self, drain_timeout: float) -> None:
+        """Stop accepting updates and give queued ones up to `drain_timeout` seconds to finish"""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.application.update_queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Webhook drain timed out with {self.application.update_queue.qsize()} updates queued")
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve_webhook(application: Application, stop_event: asyncio.Event, url: str = '',
+                        host: str = '', port: int = 0) -> None:
+    """Run the Application behind the embedded webhook server until stop_event is set"""
+    server = WebhookServer(application, host or WEBHOOK_LISTEN, port or WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+    
+    await application.initialize()
+    await post_init(application)
+    try:
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(
+            url=url or WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=100
+        )
+        await stop_event.wait()
+    finally:
+        await server.stop(WEBHOOK_DRAIN_TIMEOUT)
+        if application.running:
+            await application.stop()
+        await post_stop(application)
+        await application.shutdown()
+        await post_shutdown(application)
+
+
+async def run_webhook_bot(application: Application) -> None:
+    """Serve webhooks until SIGINT/SIGTERM, then drain and shut down"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows has no loop signal handlers; Ctrl+C still interrupts the loop
+            pass
+    await serve_webhook(application, stop_event)
+
+
+async def post_init(application: Application) -> None:
+    """Create long-lived resources once the Application is initialized"""
+    global alert_shards
+    if ALERT_SHARDS > 0:
+        # Workers must be running before the stored alerts are loaded into them
+        alert_shards = AlertShards(ALERT_SHARDS)
+        alert_shards.start()
+    global coin_index
+    coin_index = load_coin_index(COIN_LIST_PATH)
+    # The list only changes when new coins are listed; refresh it in the background once it is old
+    age = coin_list_age(COIN_LIST_PATH)
+    application.job_queue.run_repeating(refresh_coin_list, interval=COIN_LIST_MAX_AGE,
+                                        first=max(5.0, COIN_LIST_MAX_AGE - age))
+    if len(CURRENCIES) > 1:
+        # One small request per FX_RATES_TTL serves every currency; prices themselves stay USD-only
+        application.job_queue.run_repeating(refresh_exchange_rates, interval=FX_RATES_TTL, first=0)
+    state_store.open()
+    state_store.load()
+    state_store.start()
+    price_history.restore(HISTORY_SNAPSHOT_PATH)
+    get_http_session()
+    dispatcher.start(application.bot)
+    
+    global price_stream, metrics_runner, loop_lag_task
+    loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    
+    if PRICE_FEED:
+        if PRICE_FEED in PRICE_FEEDS:
+            price_stream = PriceStream(PRICE_FEEDS[PRICE_FEED](PRICE_FEED_URL), PRICE_FEED_STALE_AFTER)
+            price_stream.start()
+        else:
+            logger.error(f"Unknown PRICE_FEED '{PRICE_FEED}', using polling only")
+
+
+async def post_stop(application: Application) -> None:
+    """Flush outbound work while the bot can still send"""
+    if price_stream is not None:
+        await price_stream.stop()
+    await inline_prices.stop()
+    # Alerts still collecting into a digest go out now rather than being lost with the loop
+    alert_digest.flush()
+    await dispatcher.stop(NOTIFY_DRAIN_TIMEOUT)
+    # Delivered alerts queue their deletes, so the store is flushed after the dispatcher
+    await state_store.stop()
+    await save_price_history()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Release long-lived resources when the Application shuts down"""
+    if loop_lag_task is not None:
+        loop_lag_task.cancel()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await close_http_session()
+    if alert_shards is not None:
+        await alert_shards.stop()
+    chart_cache.stop()
+
+
+def load_token() -> str:
+    """Load bot token from rr.env file or environment variable"""
+    # First, try to load from rr.env file
+    env_file = Path(__file__).parent / 'rr.env'
+    
+    if env_file.exists():
+        try:
             with open(env_file, 'r', encoding='utf-8') as f:
                 for line in f:
                     line = line.strip()
@@ -520,6 +4811,58 @@ def load_token() -> str:
     return None
 
 
+def build_application(token: str, request=None) -> Application:
+    """Create the Application with all handlers and background jobs registered"""
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY))
+    if request is not None:
+        # Alternative Bot API transport, used by the load-testing tools
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    
+    # Register command handlers
+    application.add_handler(CommandHandler("start", timed_handler("start", start)))
+    application.add_handler(CommandHandler("help", timed_handler("help", help_command)))
+    application.add_handler(CommandHandler("price", timed_handler("price", price_command)))
+    application.add_handler(CommandHandler("alert", timed_handler("alert", alert_command)))
+    application.add_handler(CommandHandler("move", timed_handler("move", move_command)))
+    application.add_handler(CommandHandler("list", timed_handler("list", list_alerts)))
+    application.add_handler(CommandHandler("watch", timed_handler("watch", watch_command)))
+    application.add_handler(CommandHandler("watchlist", timed_handler("watchlist", watchlist_command)))
+    application.add_handler(CommandHandler("live", timed_handler("live", live_command)))
+    application.add_handler(CommandHandler("chart", timed_handler("chart", chart_command)))
+    application.add_handler(CommandHandler("remove", timed_handler("remove", remove_command)))
+    application.add_handler(CommandHandler("lang", timed_handler("lang", lang_command)))
+    application.add_handler(CommandHandler("currency", timed_handler("currency", currency_command)))
+    
+    # Register callback query handlers for language and currency selection
+    application.add_handler(CallbackQueryHandler(timed_handler('lang_callback', language_callback), pattern='^lang_'))
+    application.add_handler(CallbackQueryHandler(timed_handler('currency_callback', currency_callback),
+                                                 pattern='^currency_'))
+    
+    # Inline mode (enable it for the bot with /setinline in @BotFather)
+    application.add_handler(InlineQueryHandler(timed_handler('inline', inline_query)))
+    
+    # Set up background alert polling: per-symbol adaptive schedule, or everything every 60 seconds
+    job_queue = application.job_queue
+    if POLL_MODE == 'fixed':
+        job_queue.run_repeating(check_alerts, interval=60, first=10)
+    else:
+        job_queue.run_repeating(adaptive_poll, interval=1, first=10)
+    job_queue.run_repeating(log_runtime_stats, interval=STATS_LOG_INTERVAL, first=STATS_LOG_INTERVAL)
+    job_queue.run_repeating(refresh_live_dashboards, interval=LIVE_REFRESH_INTERVAL, first=LIVE_REFRESH_INTERVAL)
+    job_queue.run_repeating(save_price_history, interval=HISTORY_SNAPSHOT_INTERVAL, first=HISTORY_SNAPSHOT_INTERVAL)
+    
+    return application
+
+
 def main() -> None:
     """Start the bot."""
     # Get token from rr.env file or environment variable
@@ -535,32 +4878,20 @@ def main() -> None:
         return
     
     # Create the Application
-    application = Application.builder().token(token).build()
-    
-    # Register command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("price", price_command))
-    application.add_handler(CommandHandler("alert", alert_command))
-    application.add_handler(CommandHandler("list", list_alerts))
-    application.add_handler(CommandHandler("watch", watch_command))
-    application.add_handler(CommandHandler("watchlist", watchlist_command))
-    application.add_handler(CommandHandler("remove", remove_command))
-    application.add_handler(CommandHandler("lang", lang_command))
-    
-    # Register callback query handler for language selection
-    application.add_handler(CallbackQueryHandler(language_callback, pattern='^lang_'))
-    
-    # Set up background task to check alerts every 60 seconds
-    job_queue = application.job_queue
-    job_queue.run_repeating(check_alerts, interval=60, first=10)
+    application = build_application(token)
     
     logger.info("Bot started successfully!")
     print("\n✅ Crypto Alert Bot is running!")
     print("Press Ctrl+C to stop.\n")
     
     # Run the bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            logger.error("BOT_MODE=webhook requires WEBHOOK_URL")
+            return
+        asyncio.run(run_webhook_bot(application))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
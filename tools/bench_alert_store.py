@@ -0,0 +1,190 @@
+"""Memory and speed of the compact alert storage against the original dict/list/tuple layout.
+
+Builds the same synthetic population in both layouts (per-user alerts plus the
+per-symbol threshold index) and reports traced memory per alert and the cost
+of the operations behind /alert, /list, /remove and an alert check tick:
+
+    python tools/bench_alert_store.py --alerts 1000000 [--json]
+"""
+import argparse
+import gc
+import json
+import math
+import random
+import sys
+import time
+import tracemalloc
+from bisect import bisect_left, bisect_right, insort
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import crypto_bot  # noqa: E402
+
+
+class LegacyAlerts:
+    """The original layout: {user_id: {symbol: [(target, direction)]}} and sorted (target, user_id) lists"""
+
+    def __init__(self):
+        self.user_alerts = {}
+        self.index = {}
+
+    def add(self, user_id, symbol, target, direction):
+        self.user_alerts.setdefault(user_id, {}).setdefault(symbol, []).append((target, direction))
+        sides = self.index.setdefault(symbol, ([], []))
+        insort(sides[0 if direction == 'above' else 1], (target, user_id))
+
+    def alerts_of(self, user_id):
+        return self.user_alerts.get(user_id, {})
+
+    def remove_symbol(self, user_id, symbol):
+        alerts = self.user_alerts.get(user_id, {}).pop(symbol, [])
+        for target, direction in alerts:
+            side = self.index[symbol][0 if direction == 'above' else 1]
+            idx = bisect_left(side, (target, user_id))
+            if idx < len(side) and side[idx] == (target, user_id):
+                del side[idx]
+        return alerts
+
+    def pop_triggered(self, symbol, price):
+        above, below = self.index.get(symbol, ([], []))
+        idx = bisect_right(above, (price, math.inf))
+        fired = above[:idx]
+        del above[:idx]
+        idx = bisect_left(below, (price, -math.inf))
+        fired += below[idx:]
+        del below[idx:]
+        return fired
+
+
+class CompactAlerts:
+    """crypto_bot's CompactAlertStore plus one AlertIndex per symbol"""
+
+    def __init__(self):
+        self.store = crypto_bot.CompactAlertStore()
+        self.index = {}
+
+    def add(self, user_id, symbol, target, direction):
+        self.store.add(user_id, symbol, target, direction)
+        index = self.index.get(symbol)
+        if index is None:
+            index = self.index[symbol] = crypto_bot.AlertIndex()
+        index.add(target, user_id, direction)
+
+    def alerts_of(self, user_id):
+        return self.store.alerts_of(user_id)
+
+    def remove_symbol(self, user_id, symbol):
+        alerts = self.store.remove_symbol(user_id, symbol)
+        for target, direction in alerts:
+            self.index[symbol].remove(target, user_id, direction)
+        return alerts
+
+    def pop_triggered(self, symbol, price):
+        index = self.index.get(symbol)
+        return index.pop_triggered(price) if index is not None else []
+
+
+# Every symbol trades at this price; thresholds sit up to 20% away on their side of it
+PRICE = 50000.0
+
+
+def population(count: int, users: int, seed: int):
+    """(user_id, symbol, target, direction) rows with Zipf-distributed symbols"""
+    rng = random.Random(seed)
+    symbols = list(crypto_bot.CRYPTO_IDS)
+    weights = [1 / (rank + 1) for rank in range(len(symbols))]
+    user_ids = rng.sample(range(10 ** 6, 10 ** 10), users)
+    rows = []
+    for i, symbol in enumerate(rng.choices(symbols, weights, k=count)):
+        direction = rng.choice(('above', 'below'))
+        offset = rng.uniform(0.001, 0.2)
+        target = round(PRICE * (1 + offset if direction == 'above' else 1 - offset), 2)
+        rows.append((user_ids[i % users], symbol, target, direction))
+    return rows
+
+
+def build(cls, rows):
+    """Load rows the way each layout is populated at startup, returning it and its traced size"""
+    gc.collect()
+    tracemalloc.start()
+    alerts = cls()
+    if cls is CompactAlerts:
+        # Bulk path used by StateStore.load
+        alerts.store.load_sorted(sorted(rows, key=lambda row: row[0]))
+        for user_id, symbol, target, direction in sorted(rows, key=lambda row: (row[1], row[3], row[2], row[0])):
+            index = alerts.index.get(symbol)
+            if index is None:
+                index = alerts.index[symbol] = crypto_bot.AlertIndex()
+            index._side(direction).append(target, user_id)
+    else:
+        for row in sorted(rows, key=lambda row: (row[1], row[3], row[2], row[0])):
+            alerts.add(*row)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return alerts, size
+
+
+def time_ops(alerts, rows, rng: random.Random, number: int) -> dict:
+    users = [row[0] for row in rng.sample(rows, number)]
+    results = {}
+
+    started = time.perf_counter()
+    for user_id in users:
+        alerts.add(user_id, 'ETH', round(rng.uniform(1, 100000), 2), 'above')
+    results['add_us'] = (time.perf_counter() - started) / number * 1e6
+
+    started = time.perf_counter()
+    for user_id in users:
+        alerts.alerts_of(user_id)
+    results['list_us'] = (time.perf_counter() - started) / number * 1e6
+
+    started = time.perf_counter()
+    for user_id in users:
+        alerts.remove_symbol(user_id, 'ETH')
+    results['remove_us'] = (time.perf_counter() - started) / number * 1e6
+
+    # A quiet tick: every symbol moves 0.2%, firing about 0.5% of its alerts
+    started = time.perf_counter()
+    fired = 0
+    for symbol in crypto_bot.CRYPTO_IDS:
+        fired += len(alerts.pop_triggered(symbol, PRICE * 1.002))
+    results['tick_ms'] = (time.perf_counter() - started) * 1000
+    results['tick_fired'] = fired
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in results.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1000000)
+    parser.add_argument('--alerts-per-user', type=float, default=5.0)
+    parser.add_argument('--ops', type=int, default=2000, help='operations timed per kind')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rows = population(args.alerts, max(1, int(args.alerts / args.alerts_per_user)), args.seed)
+    report = {'benchmark': 'alert_store', 'alerts': len(rows), 'results': []}
+    for name, cls in (('legacy', LegacyAlerts), ('compact', CompactAlerts)):
+        alerts, size = build(cls, rows)
+        entry = {'layout': name, 'bytes': size, 'bytes_per_alert': round(size / len(rows), 1)}
+        entry.update(time_ops(alerts, rows, random.Random(args.seed), args.ops))
+        report['results'].append(entry)
+        del alerts
+    legacy, compact = report['results']
+    report['memory_reduction'] = round(legacy['bytes'] / compact['bytes'], 2)
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{report['alerts']} alerts")
+    print(f"{'layout':8} {'MB':>8} {'B/alert':>8} {'add us':>8} {'list us':>8} {'remove us':>10} {'tick ms':>8}")
+    for r in report['results']:
+        print(f"{r['layout']:8} {r['bytes'] / 1e6:>8.1f} {r['bytes_per_alert']:>8} {r['add_us']:>8} "
+              f"{r['list_us']:>8} {r['remove_us']:>10} {r['tick_ms']:>8}")
+    print(f"memory reduction: {report['memory_reduction']}x")
+
+
+if __name__ == '__main__':
+    main()
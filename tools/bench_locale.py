@@ -0,0 +1,89 @@
+"""Micro-benchmark of the LOCALE renderers against the original t() implementation.
+
+Both paths format with str.format, so any speedup comes from what the renderers skip
+(the per-call LOCALE and fallback lookups, or formatting amounts again); the "saves" column names it.
+
+    python tools/bench_locale.py [--number 200000] [--json]
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import crypto_bot  # noqa: E402
+
+
+def legacy_t(user_id: int, key: str, **kwargs) -> str:
+    """t() as it was before the renderers: two LOCALE lookups and str.format on every call"""
+    lang = crypto_bot.get_user_lang(user_id)
+    text = crypto_bot.LOCALE[lang].get(key, crypto_bot.LOCALE['en'].get(key, key))
+    if kwargs:
+        return text.format(**kwargs)
+    return text
+
+
+# Amounts reach the templates already formatted with their currency sign
+ALERT_ARGS = {
+    'symbol': 'BTC',
+    'target': crypto_bot.format_money(50000.0, 'usd'),
+    'current': crypto_bot.format_money(50012.5, 'usd'),
+    'time': '2024-01-01 12:00:00'
+}
+
+
+def cases():
+    """(name, what the new path saves, legacy callable, new callable) tuples exercising the hot paths"""
+    user_id = 1
+    renderer = crypto_bot.renderer_for(user_id)
+    cache = crypto_bot.NotificationCache()
+    return [
+        ('static welcome', 'LOCALE lookups',
+         lambda: legacy_t(user_id, 'welcome'),
+         lambda: crypto_bot.t(user_id, 'welcome')),
+        ('direction word', 'whole t() call',
+         lambda: legacy_t(user_id, 'above'),
+         lambda: renderer.direction['above']),
+        ('alert_set', 'LOCALE lookups',
+         lambda: legacy_t(user_id, 'alert_set', symbol='BTC', direction='above', price=ALERT_ARGS['target']),
+         lambda: crypto_bot.t(user_id, 'alert_set', symbol='BTC', direction='above', price=ALERT_ARGS['target'])),
+        ('alert_triggered', 'LOCALE lookups x2',
+         lambda: legacy_t(user_id, 'alert_triggered', direction=legacy_t(user_id, 'above'), **ALERT_ARGS),
+         lambda: renderer.templates['alert_triggered'](direction=renderer.direction['above'], **ALERT_ARGS)),
+        # Without the cache every notification formats its amounts again
+        ('alert_triggered, cached per tick', 'formatting',
+         lambda: legacy_t(user_id, 'alert_triggered', direction=legacy_t(user_id, 'above'), symbol='BTC',
+                          target=crypto_bot.format_money(50000.0, 'usd'),
+                          current=crypto_bot.format_money(50012.5, 'usd'), time=ALERT_ARGS['time']),
+         lambda: cache.render(renderer, 'BTC', 50000.0, 'above', 50012.5, ALERT_ARGS['time'])),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=200000)
+    parser.add_argument('--lang', default='ru', choices=sorted(crypto_bot.LOCALE))
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    crypto_bot.user_languages[1] = args.lang
+    results = []
+    for name, saves, legacy, new in cases():
+        assert legacy() == new(), name
+        legacy_ns = min(timeit.repeat(legacy, number=args.number, repeat=3)) / args.number * 1e9
+        new_ns = min(timeit.repeat(new, number=args.number, repeat=3)) / args.number * 1e9
+        results.append({'case': name, 'saves': saves, 'legacy_ns': round(legacy_ns, 1), 'new_ns': round(new_ns, 1),
+                        'speedup': round(legacy_ns / new_ns, 2)})
+
+    if args.json:
+        print(json.dumps({'benchmark': 'locale', 'lang': args.lang, 'results': results}))
+        return
+    print(f"{'case':34} {'saves':18} {'legacy ns':>10} {'new ns':>10} {'speedup':>8}")
+    for r in results:
+        print(f"{r['case']:34} {r['saves']:18} {r['legacy_ns']:>10} {r['new_ns']:>10} {r['speedup']:>7}x")
+
+
+if __name__ == '__main__':
+    main()
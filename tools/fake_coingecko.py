@@ -0,0 +1,265 @@
+"""Local stand-in for the CoinGecko API used by load tests and offline runs.
+
+Serves /api/v3/simple/price with configurable latency, a configurable share of
+429 responses and prices following a random walk, and /api/v3/coins/list with
+the known coins plus --coins synthetic ones (some sharing tickers), and /api/v3/exchange_rates
+quoted per BTC like the real one, from fixed FX_PER_USD rates, and /api/v3/coins/{id}/market_chart
+with a random walk ending at the current price. Prices can be scripted with
+POST /admin/price {"id": "bitcoin", "price": 50000} (or FakeCoinGecko.set_price
+in-process), and GET /admin/stats returns request counters. An outage is
+simulated with POST /admin/outage {"status": 503} (or 429 with "retry_after",
+or 0 to end it).
+
+    python tools/fake_coingecko.py --port 8766 --latency 0.05 --rate-limit 0.01
+    SET COINGECKO_API=http://127.0.0.1:8766/api/v3
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Starting USD prices for the random walk; other ids start at 1.0
+START_PRICES = {
+    'bitcoin': 43000.0,
+    'ethereum': 2300.0,
+    'tether': 1.0,
+    'binancecoin': 310.0,
+    'solana': 100.0,
+    'ripple': 0.6,
+    'cardano': 0.5,
+    'dogecoin': 0.08,
+    'tron': 0.1,
+    'polkadot': 7.0,
+    'matic-network': 0.8,
+    'litecoin': 70.0,
+    'shiba-inu': 0.00001,
+    'avalanche-2': 35.0,
+    'uniswap': 6.0,
+    'chainlink': 14.0,
+    'cosmos': 9.0,
+    'stellar': 0.12,
+    'the-open-network': 2.2,
+    'aptos': 9.0
+}
+
+# Tickers of the START_PRICES coins, as /coins/list reports them
+START_SYMBOLS = {
+    'bitcoin': 'btc', 'ethereum': 'eth', 'tether': 'usdt', 'binancecoin': 'bnb', 'solana': 'sol',
+    'ripple': 'xrp', 'cardano': 'ada', 'dogecoin': 'doge', 'tron': 'trx', 'polkadot': 'dot',
+    'matic-network': 'matic', 'litecoin': 'ltc', 'shiba-inu': 'shib', 'avalanche-2': 'avax',
+    'uniswap': 'uni', 'chainlink': 'link', 'cosmos': 'atom', 'stellar': 'xlm',
+    'the-open-network': 'ton', 'aptos': 'apt'
+}
+
+# Units of each fiat currency per 1 USD served by /exchange_rates
+FX_PER_USD = {'usd': 1.0, 'eur': 0.92, 'rub': 92.0, 'gbp': 0.79, 'uah': 41.0, 'kzt': 470.0}
+
+
+class FakeCoinGecko:
+    """In-process fake of the CoinGecko endpoints the bot uses"""
+
+    def __init__(self, latency: float = 0.0, rate_limit: float = 0.0, volatility: float = 0.001,
+                 step_interval: float = 1.0, seed: Optional[int] = None, coins: int = 0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.volatility = volatility
+        self.step_interval = step_interval
+        self.random = random.Random(seed)
+        self.prices: Dict[str, float] = dict(START_PRICES)
+        self.coins: List[Dict[str, str]] = self._coin_list(coins)
+        self.open_prices: Dict[str, float] = dict(START_PRICES)
+        self.requests = 0
+        self.rate_limited = 0
+        self.ids_requested = 0
+        # While set, every request is answered with this HTTP status
+        self.outage = 0
+        self.outage_retry_after: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def price(self, crypto_id: str) -> float:
+        if crypto_id not in self.prices:
+            self.prices[crypto_id] = self.open_prices[crypto_id] = 1.0
+        return self.prices[crypto_id]
+
+    def _coin_list(self, extra: int) -> List[Dict[str, str]]:
+        """Known coins plus `extra` synthetic ones with short random tickers, so some tickers repeat"""
+        coins = [{'id': crypto_id, 'symbol': symbol, 'name': crypto_id.replace('-', ' ').title()}
+                 for crypto_id, symbol in START_SYMBOLS.items()]
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        for n in range(extra):
+            symbol = ''.join(self.random.choice(letters) for _ in range(self.random.randint(2, 5)))
+            coins.append({'id': f'coin-{n}', 'symbol': symbol, 'name': f'Coin {n}'})
+        return coins
+    
+    def set_price(self, crypto_id: str, price: float) -> None:
+        """Script a price move"""
+        self.price(crypto_id)
+        self.prices[crypto_id] = price
+
+    def step(self) -> None:
+        """Advance every known price by one random-walk step"""
+        for crypto_id, price in self.prices.items():
+            self.prices[crypto_id] = price * (1 + self.random.gauss(0, self.volatility))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'ids_requested': self.ids_requested
+        }
+
+    def reset_stats(self) -> None:
+        self.requests = self.rate_limited = self.ids_requested = 0
+
+    def set_outage(self, status: int, retry_after: Optional[float] = None) -> None:
+        """Answer every request with `status` (0 ends the outage)"""
+        self.outage = status
+        self.outage_retry_after = retry_after
+
+    async def _simulate_upstream(self) -> Optional[web.Response]:
+        """Count the request, apply latency and maybe answer 429"""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.outage:
+            headers = {'Retry-After': str(self.outage_retry_after)} if self.outage_retry_after is not None else {}
+            return web.json_response({'status': {'error_code': self.outage}}, status=self.outage, headers=headers)
+        if self.rate_limit and self.random.random() < self.rate_limit:
+            self.rate_limited += 1
+            return web.json_response({'status': {'error_code': 429}}, status=429,
+                                     headers={'Retry-After': '1'})
+        return None
+
+    async def handle_simple_price(self, request: web.Request) -> web.Response:
+        limited = await self._simulate_upstream()
+        if limited is not None:
+            return limited
+
+        ids = [i for i in request.query.get('ids', '').split(',') if i]
+        currencies = [c for c in request.query.get('vs_currencies', 'usd').split(',') if c]
+        self.ids_requested += len(ids)
+        data = {}
+        for crypto_id in ids:
+            price = self.price(crypto_id)
+            change = (price / self.open_prices[crypto_id] - 1) * 100
+            entry = {}
+            for currency in currencies:
+                entry[currency] = price
+                if request.query.get('include_24hr_change') == 'true':
+                    entry[f'{currency}_24h_change'] = change
+                if request.query.get('include_market_cap') == 'true':
+                    entry[f'{currency}_market_cap'] = price * 1e7
+            data[crypto_id] = entry
+        return web.json_response(data)
+
+    async def handle_coins_list(self, request: web.Request) -> web.Response:
+        limited = await self._simulate_upstream()
+        if limited is not None:
+            return limited
+        return web.json_response(self.coins)
+    
+    async def handle_exchange_rates(self, request: web.Request) -> web.Response:
+        limited = await self._simulate_upstream()
+        if limited is not None:
+            return limited
+        btc = self.price('bitcoin')
+        rates = {'btc': {'name': 'Bitcoin', 'unit': 'BTC', 'value': 1.0, 'type': 'crypto'}}
+        for currency, per_usd in FX_PER_USD.items():
+            rates[currency] = {'name': currency.upper(), 'unit': currency.upper(),
+                               'value': btc * per_usd, 'type': 'fiat'}
+        return web.json_response({'rates': rates})
+
+    async def handle_market_chart(self, request: web.Request) -> web.Response:
+        limited = await self._simulate_upstream()
+        if limited is not None:
+            return limited
+        days = float(request.query.get('days', '1'))
+        # CoinGecko's automatic granularity: 5-minute points for a day, hourly up to 90 days, daily beyond
+        step = 300 if days <= 1 else 3600 if days <= 90 else 86400
+        count = int(days * 86400 / step)
+        now_ms = int(time.time() * 1000)
+        price = self.price(request.match_info['id'])
+        points = []
+        for n in range(count + 1):
+            points.append([now_ms - n * step * 1000, price])
+            price /= 1 + self.random.gauss(0, self.volatility * 5)
+        points.reverse()
+        return web.json_response({'prices': points, 'market_caps': [], 'total_volumes': []})
+    
+    async def handle_set_price(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        self.set_price(data['id'], float(data['price']))
+        return web.json_response({'id': data['id'], 'price': self.prices[data['id']]})
+
+    async def handle_outage(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        self.set_outage(int(data.get('status', 0)), data.get('retry_after'))
+        return web.json_response({'status': self.outage, 'retry_after': self.outage_retry_after})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def _walk_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.step_interval)
+            self.step()
+
+    async def _on_startup(self, app: web.Application) -> None:
+        if self.step_interval > 0:
+            self._task = asyncio.create_task(self._walk_loop())
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/api/v3/simple/price', self.handle_simple_price)
+        app.router.add_get('/api/v3/coins/list', self.handle_coins_list)
+        app.router.add_get('/api/v3/exchange_rates', self.handle_exchange_rates)
+        app.router.add_get('/api/v3/coins/{id}/market_chart', self.handle_market_chart)
+        app.router.add_post('/admin/price', self.handle_set_price)
+        app.router.add_post('/admin/outage', self.handle_outage)
+        app.router.add_get('/admin/stats', self.handle_stats)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Serve in the running event loop and return the API base URL"""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/api/v3"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fake CoinGecko API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--volatility', type=float, default=0.001, help='stddev of each random-walk step')
+    parser.add_argument('--step-interval', type=float, default=1.0, help='seconds between random-walk steps')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--coins', type=int, default=15000, help='synthetic coins added to /coins/list')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeCoinGecko(args.latency, args.rate_limit, args.volatility, args.step_interval, args.seed, args.coins)
+    web.run_app(fake.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
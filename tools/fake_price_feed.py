@@ -0,0 +1,131 @@
+"""Local fake streaming price feed for testing PRICE_FEED=json offline.
+
+Serves a WebSocket at /ws speaking the JsonFeed protocol from crypto_bot.py:
+clients send {"op": "subscribe", "symbols": [...]} and receive
+{"symbol": "BTC", "price": 43000.0} ticks following a random walk.
+POST /price with {"symbol": "BTC", "price": 50000} to script a price move.
+Symbols are the bot's keys as subscribed: tickers upper-case, CoinGecko ids
+(e.g. "pepe-2") lower-case.
+
+    python tools/fake_price_feed.py --port 8765 --interval 0.5
+    PRICE_FEED=json PRICE_FEED_URL=ws://127.0.0.1:8765/ws python crypto_bot.py
+"""
+import argparse
+import asyncio
+import logging
+import random
+from typing import Dict, Optional
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+# Starting prices for the random walk; unknown symbols start at 1.0
+START_PRICES = {
+    'BTC': 43000.0,
+    'ETH': 2300.0,
+    'BNB': 310.0,
+    'SOL': 100.0,
+    'XRP': 0.6,
+    'ADA': 0.5,
+    'DOGE': 0.08,
+    'TON': 2.2
+}
+
+
+class FakePriceFeed:
+    """Random-walk price generator pushing ticks to subscribed WebSocket clients"""
+
+    def __init__(self, interval: float = 0.5, volatility: float = 0.002, seed: Optional[int] = None):
+        self.interval = interval
+        self.volatility = volatility
+        self.random = random.Random(seed)
+        self.prices: Dict[str, float] = dict(START_PRICES)
+        # {websocket: set of subscribed symbols}
+        self.clients: Dict[web.WebSocketResponse, set] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def price(self, symbol: str) -> float:
+        return self.prices.setdefault(symbol, 1.0)
+
+    def step(self) -> None:
+        """Advance every subscribed symbol's random walk by one step"""
+        for symbol in {s for symbols in self.clients.values() for s in symbols}:
+            self.prices[symbol] = self.price(symbol) * (1 + self.random.gauss(0, self.volatility))
+
+    async def broadcast(self, symbols=None) -> None:
+        for ws, subscribed in list(self.clients.items()):
+            ticks = [
+                {'symbol': symbol, 'price': self.price(symbol)}
+                for symbol in subscribed
+                if symbols is None or symbol in symbols
+            ]
+            if ticks and not ws.closed:
+                await ws.send_json(ticks)
+
+    async def _tick_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.step()
+            await self.broadcast()
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.clients[ws] = set()
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = msg.json()
+                symbols = {str(s) for s in data.get('symbols', [])}
+                if data.get('op') == 'subscribe':
+                    self.clients[ws] |= symbols
+                    await self.broadcast(symbols)
+                elif data.get('op') == 'unsubscribe':
+                    self.clients[ws] -= symbols
+        finally:
+            self.clients.pop(ws, None)
+        return ws
+
+    async def handle_set_price(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        symbol = str(data['symbol'])
+        self.prices[symbol] = float(data['price'])
+        await self.broadcast({symbol})
+        return web.json_response({'symbol': symbol, 'price': self.prices[symbol]})
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._task = asyncio.create_task(self._tick_loop())
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        for ws in list(self.clients):
+            await ws.close()
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/ws', self.handle_ws)
+        app.router.add_post('/price', self.handle_set_price)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fake streaming price feed')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between ticks')
+    parser.add_argument('--volatility', type=float, default=0.002, help='stddev of each relative step')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    feed = FakePriceFeed(args.interval, args.volatility, args.seed)
+    web.run_app(feed.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
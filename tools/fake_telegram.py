@@ -0,0 +1,113 @@
+"""Fake Telegram Bot API transport for load tests.
+
+FakeTelegramRequest plugs into python-telegram-bot as the HTTP backend, so a
+real Bot/Application runs unchanged while every API call is answered locally
+and recorded. make_command_update builds Update objects for slash commands and
+make_inline_update for inline queries.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Load Test', 'username': 'load_test_bot'}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally and records them"""
+
+    def __init__(self, latency: float = 0.0, keep: int = 1000):
+        self.latency = latency
+        self.keep = keep
+        self.calls = Counter()
+        # Most recent (method, parameters) pairs, for assertions
+        self.recent: List[Tuple[str, Dict]] = []
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def sent_messages(self) -> int:
+        return self.calls['sendMessage']
+
+    def _result(self, method: str, params: Dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText', 'sendPhoto'):
+            self._message_id += 1
+            chat_id = int(params.get('chat_id', 0))
+            message = {
+                'message_id': int(params.get('message_id', self._message_id)),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER
+            }
+            if 'text' in params:
+                message['text'] = params['text']
+            if method == 'sendPhoto':
+                message['photo'] = [{
+                    'file_id': f'photo-{self._message_id}',
+                    'file_unique_id': f'u{self._message_id}',
+                    'width': 800,
+                    'height': 400
+                }]
+            return message
+        return True
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+        self.recent.append((api_method, params))
+        if len(self.recent) > self.keep:
+            del self.recent[:len(self.recent) - self.keep]
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, json.dumps({'ok': True, 'result': self._result(api_method, params)}).encode()
+
+
+_update_id = 0
+
+
+def make_command_update(bot, user_id: int, text: str) -> Update:
+    """Build a private-chat Update carrying a slash command from the given user"""
+    global _update_id
+    _update_id += 1
+    command = text.split()[0]
+    data = {
+        'update_id': _update_id,
+        'message': {
+            'message_id': _update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        }
+    }
+    return Update.de_json(data, bot)
+
+
+def make_inline_update(bot, user_id: int, query: str) -> Update:
+    """Build an Update carrying an inline query (@bot <query>) from the given user"""
+    global _update_id
+    _update_id += 1
+    data = {
+        'update_id': _update_id,
+        'inline_query': {
+            'id': str(_update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'query': query,
+            'offset': ''
+        }
+    }
+    return Update.de_json(data, bot)
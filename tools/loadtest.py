@@ -0,0 +1,382 @@
+"""Offline load test of crypto_bot.py against a fake CoinGecko and a fake Telegram transport.
+
+Generates a synthetic population of users, alerts and watchlists in a fresh
+state database, starts the real Application on top of it and measures:
+
+* cold start (state load) time,
+* alert check tick duration on a quiet market and after a scripted price move,
+* delivery time of the triggered notifications and how many messages they were coalesced into,
+* per-command handler latency under update storms, also during an upstream outage,
+* inline query bursts: answers sent and upstream requests they cost,
+* live watchlists: message edits per refresh with unchanged and with moved prices,
+* chart bursts: fetches, renders and photo uploads behind many users asking for the same chart,
+* the worst event loop stall while alerts are evaluated (compare --shards 0 and N),
+* upstream request counts per phase and peak RSS.
+
+Results are printed as one JSON document so they can be tracked across releases:
+
+    python tools/loadtest.py --users 10000 --alerts-per-user 5 --output bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import crypto_bot  # noqa: E402
+from fake_coingecko import FakeCoinGecko  # noqa: E402
+from fake_telegram import FakeTelegramRequest, make_command_update, make_inline_update  # noqa: E402
+from telegram.ext import CallbackContext  # noqa: E402
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize_ms(samples) -> dict:
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def populate(db_path: str, fake: FakeCoinGecko, args, rng: random.Random) -> dict:
+    """Write a synthetic population straight into a state database"""
+    symbols = list(crypto_bot.CRYPTO_IDS)
+    # Popular coins get most alerts, roughly Zipf-distributed
+    weights = [1 / (rank + 1) for rank in range(len(symbols))]
+
+    store = crypto_bot.StateStore(db_path, 1.0)
+    store.open()
+    conn = store.conn
+    conn.execute('BEGIN')
+    alerts = []
+    for user_id in range(1, args.users + 1):
+        for symbol in rng.choices(symbols, weights, k=args.alerts_per_user):
+            price = fake.price(crypto_bot.CRYPTO_IDS[symbol])
+            direction = rng.choice(('above', 'below'))
+            offset = rng.uniform(0.001, args.spread)
+            target = price * (1 + offset if direction == 'above' else 1 - offset)
+            alerts.append((user_id, symbol, round(target, 8), direction))
+        if len(alerts) >= 100000:
+            conn.executemany('INSERT INTO alerts (user_id, symbol, target, direction) VALUES (?, ?, ?, ?)', alerts)
+            alerts = []
+    conn.executemany('INSERT INTO alerts (user_id, symbol, target, direction) VALUES (?, ?, ?, ?)', alerts)
+    conn.executemany(
+        'INSERT OR IGNORE INTO watchlists (user_id, symbol) VALUES (?, ?)',
+        [
+            (user_id, symbol)
+            for user_id in range(1, args.users + 1)
+            for symbol in rng.sample(symbols, args.watchlist_size)
+        ]
+    )
+    conn.execute('COMMIT')
+    conn.close()
+    return {'users': args.users, 'alerts': args.users * args.alerts_per_user}
+
+
+async def wait_for_deliveries(timeout: float) -> float:
+    started = time.perf_counter()
+    while ((crypto_bot.alert_digest.pending() or crypto_bot.dispatcher.depth())
+           and time.perf_counter() - started < timeout):
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - started
+
+
+class LoopLagProbe:
+    """Records how late a short periodic sleep wakes up, i.e. how long the event loop was blocked"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+    def start(self) -> None:
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return summarize_ms(self.samples)
+
+
+async def run_ticks(context, count: int, fake: FakeCoinGecko) -> list:
+    durations = []
+    for _ in range(count):
+        fake.step()
+        # Ticks are a minute apart in production, so the cache never answers them
+        crypto_bot.price_cache.ttl = 0
+        started = time.perf_counter()
+        await crypto_bot.check_alerts(context)
+        durations.append(time.perf_counter() - started)
+    crypto_bot.price_cache.ttl = crypto_bot.PRICE_CACHE_TTL
+    return durations
+
+
+async def run_storm(application, commands, users: int, count: int, concurrency: int,
+                    rng: random.Random) -> dict:
+    """Process `count` updates per command with at most `concurrency` in flight"""
+    results = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(text: str, samples: list) -> None:
+        update = make_command_update(application.bot, rng.randint(1, users), text)
+        async with semaphore:
+            started = time.perf_counter()
+            await application.process_update(update)
+            samples.append(time.perf_counter() - started)
+
+    for name, text in commands:
+        samples = []
+        await asyncio.gather(*(one(text, samples) for _ in range(count)))
+        results[name] = summarize_ms(samples)
+    return results
+
+
+async def run_inline_burst(application, telegram, users: int, count: int, rng: random.Random) -> dict:
+    """Users type tickers into inline mode one keystroke at a time, all at once"""
+    symbols = list(crypto_bot.CRYPTO_IDS)
+    answers_before = telegram.calls['answerInlineQuery']
+    typed = 0
+    updates = []
+    for _ in range(count):
+        user_id = rng.randint(1, users)
+        symbol = rng.choice(symbols)
+        for length in range(1, len(symbol) + 1):
+            updates.append(make_inline_update(application.bot, user_id, symbol[:length]))
+    started = time.perf_counter()
+    for update in updates:
+        await application.process_update(update)
+        typed += 1
+    # Let the debounce timers fire and the answers go out
+    await asyncio.sleep(crypto_bot.inline_prices.debounce + 0.2)
+    return {
+        'queries': typed,
+        'answered': telegram.calls['answerInlineQuery'] - answers_before,
+        'elapsed_s': round(time.perf_counter() - started, 3)
+    }
+
+
+async def run_live(application, telegram, fake: FakeCoinGecko, users: int) -> dict:
+    """Start `users` live watchlists, then refresh them before, right after and again after a price move"""
+    for user_id in range(1, users + 1):
+        await application.process_update(make_command_update(application.bot, user_id, '/live'))
+    dashboards = crypto_bot.live_dashboards
+    report = {'dashboards': len(dashboards), 'pinned': telegram.calls['pinChatMessage'], 'refreshes': []}
+    for phase in ('unchanged', 'moved', 'settled'):
+        if phase == 'moved':
+            fake.step()
+            crypto_bot.price_cache.ttl = 0
+            await crypto_bot.get_crypto_prices(list(crypto_bot.CRYPTO_IDS))
+            crypto_bot.price_cache.ttl = crypto_bot.PRICE_CACHE_TTL
+        edits_before = telegram.calls['editMessageText']
+        started = time.perf_counter()
+        queued = dashboards.refresh()
+        render_ms = (time.perf_counter() - started) * 1000
+        await wait_for_deliveries(10)
+        report['refreshes'].append({
+            'phase': phase,
+            'queued': queued,
+            'edits': telegram.calls['editMessageText'] - edits_before,
+            'render_ms': round(render_ms, 3)
+        })
+    return report
+
+
+async def run_chart_burst(application, telegram, users: int) -> dict:
+    """`users` users ask for the BTC 24h chart at once"""
+    before = crypto_bot.chart_cache.stats()
+    photos_before = telegram.calls['sendPhoto']
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        application.process_update(make_command_update(application.bot, user_id, '/chart BTC 24h'))
+        for user_id in range(1, users + 1)
+    ))
+    after = crypto_bot.chart_cache.stats()
+    report = {key: after[key] - before[key] for key in ('requests', 'fetches', 'renders', 'uploads', 'reused')}
+    report['photos_sent'] = telegram.calls['sendPhoto'] - photos_before
+    report['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    fake = FakeCoinGecko(args.latency, args.rate_limit, args.volatility, step_interval=0, seed=args.seed)
+    crypto_bot.COINGECKO_API = await fake.start()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = str(Path(workdir.name) / 'loadtest.db')
+    population = populate(db_path, fake, args, rng)
+
+    crypto_bot.state_store.path = db_path
+    crypto_bot.HISTORY_SNAPSHOT_PATH = str(Path(workdir.name) / 'price_history.bin')
+    crypto_bot.COIN_LIST_PATH = str(Path(workdir.name) / 'coins.tsv')
+    crypto_bot.ALERT_SHARDS = args.shards
+    crypto_bot.dispatcher = crypto_bot.NotificationDispatcher(
+        args.send_workers, args.send_rate, args.send_rate, crypto_bot.NOTIFY_MAX_RETRIES
+    )
+    telegram = FakeTelegramRequest(latency=args.telegram_latency)
+    application = crypto_bot.build_application('123456:LOADTEST', request=telegram)
+    await application.initialize()
+
+    report = {'benchmark': 'loadtest', 'timestamp': int(time.time()), 'params': vars(args), **population}
+
+    started = time.perf_counter()
+    await crypto_bot.post_init(application)
+    report['cold_start_s'] = round(time.perf_counter() - started, 3)
+    context = CallbackContext(application)
+
+    # Quiet market: small random walk, few or no triggers
+    fake.reset_stats()
+    probe = LoopLagProbe()
+    probe.start()
+    quiet = await run_ticks(context, args.ticks, fake)
+    report['tick_quiet'] = summarize_ms(quiet)
+    report['tick_quiet']['loop_lag'] = await probe.stop()
+    report['tick_quiet']['upstream_requests'] = fake.stats()['requests']
+    await wait_for_deliveries(args.drain_timeout)
+
+    # Scripted move: every coin jumps by --move, firing a slice of the "above" alerts
+    fake.reset_stats()
+    sent_before = telegram.sent_messages()
+    digest_before = crypto_bot.alert_digest.stats()
+    for crypto_id in list(fake.prices):
+        fake.set_price(crypto_id, fake.price(crypto_id) * (1 + args.move))
+    crypto_bot.price_cache.ttl = 0
+    probe.start()
+    started = time.perf_counter()
+    await crypto_bot.check_alerts(context)
+    tick_move = time.perf_counter() - started
+    loop_lag = await probe.stop()
+    crypto_bot.price_cache.ttl = crypto_bot.PRICE_CACHE_TTL
+    delivery = await wait_for_deliveries(args.drain_timeout)
+    digest = crypto_bot.alert_digest.stats()
+    report['tick_move'] = {
+        'duration_ms': round(tick_move * 1000, 3),
+        'triggered': digest['alerts'] - digest_before['alerts'],
+        'messages': digest['messages'] - digest_before['messages'],
+        'digests': digest['digests'] - digest_before['digests'],
+        'delivered': telegram.sent_messages() - sent_before,
+        'delivery_s': round(delivery, 3),
+        'upstream_requests': fake.stats()['requests'],
+        'loop_lag': loop_lag
+    }
+
+    # Update storms through the real handlers
+    fake.reset_stats()
+    commands = [
+        ('price', '/price BTC'),
+        ('watchlist', '/watchlist'),
+        ('list', '/list'),
+        ('alert', '/alert ETH 1000000 above')
+    ]
+    report['handlers'] = await run_storm(application, commands, args.users, args.storm, args.concurrency, rng)
+    report['handlers_upstream_requests'] = fake.stats()['requests']
+
+    # Inline query bursts are answered from the cached prices
+    fake.reset_stats()
+    report['inline'] = await run_inline_burst(application, telegram, args.users, args.storm, rng)
+    report['inline']['upstream_requests'] = fake.stats()['requests']
+
+    # Live watchlists are edited from the shared snapshot, only when their text changed
+    fake.reset_stats()
+    report['live'] = await run_live(application, telegram, fake, min(args.users, args.storm))
+    report['live']['upstream_requests'] = fake.stats()['requests']
+
+    # Charts: one market_chart fetch, one render and one upload however many users ask at once
+    fake.reset_stats()
+    report['chart'] = await run_chart_burst(application, telegram, min(args.users, args.storm))
+    report['chart']['upstream_requests'] = fake.stats()['requests']
+
+    # Upstream outage: cached prices expire, CoinGecko answers 503 slowly; handlers should serve stale prices
+    fake.reset_stats()
+    fake.set_outage(503)
+    latency, fake.latency = fake.latency, args.outage_latency
+    crypto_bot.price_cache.ttl = 0
+    outage_commands = [('price', '/price BTC'), ('watchlist', '/watchlist')]
+    report['handlers_outage'] = await run_storm(application, outage_commands, args.users, args.storm,
+                                                args.concurrency, rng)
+    # Let the background refreshes started by the storm fail and trip the breaker
+    await asyncio.sleep(args.outage_latency + 0.5)
+    report['handlers_outage']['upstream_requests'] = fake.stats()['requests']
+    report['handlers_outage']['circuit'] = crypto_bot.upstream_breaker.state
+    crypto_bot.price_cache.ttl = crypto_bot.PRICE_CACHE_TTL
+    fake.latency = latency
+    fake.set_outage(0)
+
+    report['upstream'] = fake.stats()
+    report['telegram_calls'] = dict(telegram.calls)
+    report['price_cache'] = crypto_bot.price_cache.stats()
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    await crypto_bot.post_stop(application)
+    await application.shutdown()
+    await crypto_bot.post_shutdown(application)
+    await fake.stop()
+    workdir.cleanup()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Offline load test for crypto_bot.py')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--alerts-per-user', type=int, default=5)
+    parser.add_argument('--watchlist-size', type=int, default=5)
+    parser.add_argument('--spread', type=float, default=0.2, help='max relative distance of thresholds from price')
+    parser.add_argument('--ticks', type=int, default=5, help='quiet-market ticks to measure')
+    parser.add_argument('--move', type=float, default=0.02, help='relative price move of the scripted tick')
+    parser.add_argument('--storm', type=int, default=500, help='updates per command in the handler storm')
+    parser.add_argument('--concurrency', type=int, default=100, help='updates processed at once in a storm')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake CoinGecko latency, seconds')
+    parser.add_argument('--outage-latency', type=float, default=1.0,
+                        help='fake CoinGecko latency while it is failing, seconds')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='share of CoinGecko requests answered 429')
+    parser.add_argument('--volatility', type=float, default=0.001, help='random-walk step between ticks')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='fake Bot API latency, seconds')
+    parser.add_argument('--shards', type=int, default=0, help='ALERT_SHARDS worker processes (0: in-process)')
+    parser.add_argument('--send-workers', type=int, default=crypto_bot.NOTIFY_WORKERS)
+    parser.add_argument('--send-rate', type=float, default=1e6,
+                        help='messages per second allowed by the dispatcher (no Telegram limits by default)')
+    parser.add_argument('--drain-timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
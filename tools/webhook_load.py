@@ -0,0 +1,219 @@
+"""Webhook throughput test: posts synthetic updates at high rate to the embedded webhook server.
+
+Runs the real Application in webhook mode against a fake CoinGecko and a fake
+Telegram transport (both with latency), once per --concurrency value, and
+reports updates per second. Concurrency 1 processes updates one after another,
+which is how the bot handled them under run_polling before; higher values show
+what concurrent processing buys.
+
+Every user sends a run of /alert commands with increasing targets, so the
+report also checks that each user's commands were applied in order.
+
+A second phase has one user flood the bot with --spam slow /watchlist updates and
+then --spam-others other users send one /alert each; their latency shows whether
+the flooding user's backlog holds up everyone else.
+
+    python tools/webhook_load.py --users 200 --updates 4000 --concurrency 1,64
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import aiohttp  # noqa: E402
+import crypto_bot  # noqa: E402
+from fake_coingecko import FakeCoinGecko  # noqa: E402
+from fake_telegram import FakeTelegramRequest, make_command_update  # noqa: E402
+
+SECRET = 'webhook-load-test'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_updates(bot, args, rng: random.Random) -> list:
+    """Update payloads in posting order; /alert targets grow per user"""
+    sequence = {}
+    payloads = []
+    for _ in range(args.updates):
+        user_id = rng.randint(1, args.users)
+        if rng.random() < args.slow_share:
+            text = '/watchlist'
+        else:
+            sequence[user_id] = sequence.get(user_id, 0) + 1
+            text = f'/alert BTC {1000000 + sequence[user_id]} above'
+        payloads.append(make_command_update(bot, user_id, text).to_dict())
+    return payloads
+
+
+def ordering_violations(users: int) -> int:
+    """Users whose BTC alerts were not stored in the order they were sent"""
+    violations = 0
+    for user_id in range(1, users + 1):
+        targets = [target for target, _ in crypto_bot.alert_store.alerts_of(user_id).get('BTC', [])]
+        if targets != sorted(targets):
+            violations += 1
+    return violations
+
+
+async def spam_phase(session, url: str, bot, args) -> dict:
+    """One user floods the bot with slow updates; measure how long other users' commands take meanwhile"""
+    spammer = args.users + 1
+    crypto_bot.user_watchlists[spammer] = list(crypto_bot.CRYPTO_IDS)[:args.watchlist_size]
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+    for _ in range(args.spam):
+        async with session.post(url, json=make_command_update(bot, spammer, '/watchlist').to_dict(),
+                                headers=headers) as response:
+            await response.read()
+
+    async def other(user_id: int) -> float:
+        started = time.perf_counter()
+        payload = make_command_update(bot, user_id, '/alert ETH 1000000 above').to_dict()
+        async with session.post(url, json=payload, headers=headers) as response:
+            await response.read()
+        while 'ETH' not in crypto_bot.alert_store.alerts_of(user_id):
+            await asyncio.sleep(0.002)
+        return time.perf_counter() - started
+
+    latencies = sorted(await asyncio.gather(*(other(user_id) for user_id in range(1, args.spam_others + 1))))
+    return {
+        'spammer_updates': args.spam,
+        'others': len(latencies),
+        'others_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0.0,
+        'others_max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0
+    }
+
+
+async def run_once(args, concurrency: int, workdir: str) -> dict:
+    crypto_bot.alert_store = crypto_bot.CompactAlertStore()
+    crypto_bot.alert_index.clear()
+    crypto_bot.user_watchlists.clear()
+    crypto_bot.UPDATE_CONCURRENCY = concurrency
+    crypto_bot.WEBHOOK_SECRET = SECRET
+    crypto_bot.HISTORY_SNAPSHOT_PATH = str(Path(workdir) / f'history-{concurrency}.bin')
+    crypto_bot.COIN_LIST_PATH = str(Path(workdir) / 'coins.tsv')
+    crypto_bot.state_store = crypto_bot.StateStore(
+        str(Path(workdir) / f'webhook-{concurrency}.db'), crypto_bot.STATE_FLUSH_INTERVAL_MS / 1000
+    )
+    crypto_bot.dispatcher = crypto_bot.NotificationDispatcher(
+        crypto_bot.NOTIFY_WORKERS, 1e6, 1e6, crypto_bot.NOTIFY_MAX_RETRIES
+    )
+    # Every user watches a few coins so /watchlist does real upstream work
+    for user_id in range(1, args.users + 1):
+        crypto_bot.user_watchlists[user_id] = list(crypto_bot.CRYPTO_IDS)[:args.watchlist_size]
+
+    telegram = FakeTelegramRequest(latency=args.telegram_latency)
+    application = crypto_bot.build_application('123456:WEBHOOK', request=telegram)
+    payloads = build_updates(application.bot, args, random.Random(args.seed))
+
+    port = free_port()
+    url = f'http://127.0.0.1:{port}{crypto_bot.WEBHOOK_PATH}'
+    stop_event = asyncio.Event()
+    server = asyncio.create_task(
+        crypto_bot.serve_webhook(application, stop_event, url=url, host='127.0.0.1', port=port)
+    )
+    async with aiohttp.ClientSession() as session:
+        # Wait for the server to come up
+        while True:
+            try:
+                async with session.get(f'http://127.0.0.1:{port}/healthz') as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+
+        semaphore = asyncio.Semaphore(args.connections)
+        statuses = {}
+        by_user = {}
+        for payload in payloads:
+            by_user.setdefault(payload['message']['from']['id'], []).append(payload)
+
+        async def post_user(user_payloads: list) -> None:
+            # Like Telegram, one user's updates are delivered one at a time and in order
+            for payload in user_payloads:
+                async with semaphore:
+                    async with session.post(url, json=payload,
+                                            headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as response:
+                        statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post_user(p) for p in by_user.values()))
+        accepted = time.perf_counter() - started
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - started
+
+        spam = await spam_phase(session, url, application.bot, args) if args.spam else None
+
+    stop_event.set()
+    await server
+    return {
+        'concurrency': concurrency,
+        'updates': len(payloads),
+        'http_statuses': statuses,
+        'accept_s': round(accepted, 3),
+        'elapsed_s': round(elapsed, 3),
+        'updates_per_s': round(len(payloads) / elapsed, 1),
+        'ordering_violations': ordering_violations(args.users),
+        'spam': spam,
+        'telegram_calls': dict(telegram.calls)
+    }
+
+
+async def run(args) -> dict:
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    fake = FakeCoinGecko(args.latency, 0.0, 0.001, step_interval=0, seed=args.seed)
+    crypto_bot.COINGECKO_API = await fake.start()
+    # Every /watchlist should reach the fake upstream, not the cache
+    crypto_bot.price_cache.ttl = 0
+    crypto_bot.upstream_budget = crypto_bot.TokenBucket(1e6, 1e6)
+
+    workdir = tempfile.TemporaryDirectory()
+    report = {'benchmark': 'webhook', 'timestamp': int(time.time()), 'params': vars(args), 'runs': []}
+    for concurrency in args.concurrency:
+        report['runs'].append(await run_once(args, concurrency, workdir.name))
+    await fake.stop()
+    workdir.cleanup()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Webhook throughput test for crypto_bot.py')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--slow-share', type=float, default=0.2, help='share of /watchlist updates')
+    parser.add_argument('--watchlist-size', type=int, default=5)
+    parser.add_argument('--concurrency', type=lambda v: [int(c) for c in v.split(',')], default=[1, 64],
+                        help='comma-separated UPDATE_CONCURRENCY values to compare')
+    parser.add_argument('--spam', type=int, default=100, help='slow updates sent by one flooding user (0: skip)')
+    parser.add_argument('--spam-others', type=int, default=20, help='users sending one command during the flood')
+    parser.add_argument('--connections', type=int, default=40, help='concurrent HTTP posts')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake CoinGecko latency, seconds')
+    parser.add_argument('--telegram-latency', type=float, default=0.01, help='fake Bot API latency, seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()